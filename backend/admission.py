@@ -0,0 +1,191 @@
+"""
+Admission control and load shedding for Sensation by Sanu API
+"""
+
+import asyncio
+import json
+import math
+import os
+import re
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Deque, List, Optional, Set
+
+
+class ConcurrencyLimiter:
+    """Cap concurrent requests, queueing a bounded number for a bounded time"""
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float) -> None:
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @classmethod
+    def from_env(cls, name: str, max_concurrent: int, max_queue: int, queue_timeout: float) -> "ConcurrencyLimiter":
+        """Build a limiter whose defaults can be overridden by ADMISSION_<NAME>_* variables"""
+        prefix = f"ADMISSION_{name.upper()}_"
+        return cls(
+            name,
+            int(os.getenv(prefix + "CONCURRENCY", max_concurrent)),
+            int(os.getenv(prefix + "QUEUE", max_queue)),
+            float(os.getenv(prefix + "QUEUE_TIMEOUT", queue_timeout)),
+        )
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        """Take a slot, waiting in the queue if needed; False means shed the request"""
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # The releasing request hands its slot over, so active is unchanged
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was handed over just as the deadline passed
+                return True
+            waiter.cancel()
+            self.timed_out += 1
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Client went away after being handed a slot, pass it on
+                self.release()
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def release(self) -> None:
+        """Hand the slot to the oldest live waiter, or free it"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+    def retry_after(self) -> int:
+        """Seconds a shed client should wait before retrying"""
+        return max(1, math.ceil(self.queue_timeout))
+
+    def stats(self) -> dict:
+        """Current load and shed counters"""
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+class RoutePattern:
+    """Match requests by path pattern and optional methods
+
+    Mixed into dataclasses declaring `path_pattern` and `methods` fields;
+    also used by rate_limit.RateLimitedRoute.
+    """
+    path_pattern: str
+    methods: Optional[Set[str]]
+
+    def __post_init__(self) -> None:
+        self._compiled = re.compile(self.path_pattern)
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods and method not in self.methods:
+            return False
+        return bool(self._compiled.match(path))
+
+
+@dataclass
+class RouteClass(RoutePattern):
+    """Requests matching a path pattern (and methods) that share a limiter
+
+    A class without a limiter is admitted unconditionally, e.g. long-lived
+    streams that would otherwise hold a slot for minutes.
+    """
+    name: str
+    limiter: Optional[ConcurrencyLimiter]
+    path_pattern: str
+    methods: Optional[Set[str]] = None
+
+
+class AdmissionControlMiddleware:
+    """ASGI middleware admitting each request through its route class's limiter
+
+    Classes are checked in order and the first match wins. Each class has
+    its own pool, so cheap catalog reads never queue behind logins or
+    dashboard queries.
+    """
+
+    def __init__(self, app: Callable, route_classes: List[RouteClass]) -> None:
+        self.app = app
+        self.route_classes = route_classes
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route_class = self.classify(scope["method"], scope["path"])
+        limiter = route_class.limiter if route_class else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await limiter.acquire():
+            await self._shed(send, limiter)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+    def classify(self, method: str, path: str) -> Optional[RouteClass]:
+        """Find the route class of a request"""
+        for route_class in self.route_classes:
+            if route_class.matches(method, path):
+                return route_class
+        return None
+
+    @staticmethod
+    async def _shed(send: Callable, limiter: ConcurrencyLimiter) -> None:
+        """Answer 503 with Retry-After, in the API's error format"""
+        body = json.dumps({
+            "success": False,
+            "error": "Server is busy, please retry shortly",
+            "details": {"status_code": 503, "route_class": limiter.name},
+            "timestamp": datetime.utcnow().isoformat(),
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(limiter.retry_after()).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
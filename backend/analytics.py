@@ -0,0 +1,87 @@
+"""
+Sales analytics for Sensation by Sanu API
+"""
+
+from datetime import date
+from typing import Any, List
+
+import numpy as np
+
+from models import AnalyticsInterval, ProductSales, ProductSalesReport, RevenuePoint, RevenueSeries
+
+
+def period_starts(days: np.ndarray, interval: AnalyticsInterval) -> np.ndarray:
+    """Map each day to the first day of its week (Monday) or month"""
+    if interval == AnalyticsInterval.WEEK:
+        # 1970-01-01, day 0, was a Thursday
+        weekday = (days.astype(np.int64) + 3) % 7
+        return days - weekday.astype("timedelta64[D]")
+    if interval == AnalyticsInterval.MONTH:
+        return days.astype("datetime64[M]").astype("datetime64[D]")
+    return days
+
+
+def average_order_values(revenue: np.ndarray, orders: np.ndarray) -> np.ndarray:
+    """Revenue per order in whole cents, 0 where there were no orders"""
+    average = np.zeros(len(revenue), dtype=np.float64)
+    np.divide(revenue, orders, out=average, where=orders > 0)
+    return np.rint(average).astype(np.int64)
+
+
+def revenue_series(rows: List[Any], start: date, end: date, interval: AnalyticsInterval) -> RevenueSeries:
+    """Bucket daily (day, orders, revenue) rows into a gap-free series
+
+    The first and last buckets are partial when the range doesn't start or
+    end on a bucket boundary; their period_start is clipped to `start`.
+    """
+    first = np.datetime64(start, "D")
+    days = np.arange(first, np.datetime64(end, "D") + 1)
+    orders = np.zeros(len(days), dtype=np.int64)
+    revenue = np.zeros(len(days), dtype=np.int64)
+    if rows:
+        offsets = np.array([np.datetime64(r.day, "D") for r in rows]) - first
+        orders[offsets.astype(np.int64)] = [r.orders for r in rows]
+        revenue[offsets.astype(np.int64)] = [r.revenue for r in rows]
+
+    periods, bucket_first_day = np.unique(period_starts(days, interval), return_index=True)
+    bucket_orders = np.add.reduceat(orders, bucket_first_day)
+    bucket_revenue = np.add.reduceat(revenue, bucket_first_day)
+    bucket_average = average_order_values(bucket_revenue, bucket_orders)
+    periods = np.maximum(periods, first)
+
+    total_orders = int(orders.sum())
+    total_revenue = int(revenue.sum())
+    return RevenueSeries(
+        start=start,
+        end=end,
+        interval=interval,
+        orders=total_orders,
+        revenue=total_revenue,
+        average_order_value=round(total_revenue / total_orders) if total_orders else 0,
+        points=[
+            RevenuePoint(period_start=p, orders=o, revenue=r, average_order_value=a)
+            for p, o, r, a in zip(
+                periods.astype(object), bucket_orders.tolist(), bucket_revenue.tolist(), bucket_average.tolist()
+            )
+        ]
+    )
+
+
+def top_products(rows: List[Any], start: date, end: date, limit: int) -> ProductSalesReport:
+    """Rank per-product (product_id, name, units, revenue) rows by units and by revenue"""
+    units = np.array([r.units for r in rows], dtype=np.int64)
+    revenue = np.array([r.revenue for r in rows], dtype=np.int64)
+
+    def ranked(values: np.ndarray) -> List[ProductSales]:
+        order = np.argsort(-values, kind="stable")[:limit]
+        return [
+            ProductSales(
+                product_id=str(rows[i].product_id),
+                name=rows[i].name,
+                units=int(units[i]),
+                revenue=int(revenue[i])
+            )
+            for i in order
+        ]
+
+    return ProductSalesReport(start=start, end=end, by_units=ranked(units), by_revenue=ranked(revenue))
@@ -0,0 +1,421 @@
+"""
+Sensation by Sanu - Database backup and restore
+
+Streams every table through COPY into gzip-compressed CSV chunks, each read
+in its own short transaction by primary key range, with a SHA-256 per chunk
+in manifest.json. Incremental backups copy only rows changed since an
+earlier backup and are applied on top of it with upserts.
+
+    python backup.py backup                               # full, to ../backups/db_<time>
+    python backup.py backup --since ../backups/db_2025-09-01_02-00-00
+    python backup.py verify ../backups/db_2025-09-01_02-00-00
+    python backup.py restore FULL_DIR [INCREMENTAL_DIR ...] --jobs 4
+
+Tables are not dumped from one snapshot. Children are dumped before their
+parents, so every referenced row is present. The order tables, their
+archive and the log of moves between them are dumped first, holding
+ORDER_MOVE_LOCK, so no order moves while they are read. For that part of
+the backup the archiver skips its runs and changes to archived orders are
+answered with 503. Deletes are not carried by incremental backups, except
+orders moved to or from the archive: the moves are logged, and replayed
+after the incremental backup is applied.
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import Table
+
+logger = logging.getLogger("backup")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join(BASE_DIR, "..", "backups"))
+MANIFEST_NAME = "manifest.json"
+FORMAT_VERSION = 1
+
+# Rows per chunk file, each read in one short transaction
+CHUNK_ROWS = 50000
+# Incremental backups reach back this far before the previous backup started,
+# to catch rows written by transactions that committed while it ran
+INCREMENTAL_OVERLAP = timedelta(minutes=5)
+# Tables without timestamps whose rows belong to a parent that has one:
+# table -> (foreign key column, parent table)
+INCREMENTAL_PARENTS = {"order_items": ("order_id", "orders")}
+# Tables whose rows are never edited, so created_at marks every change.
+# Other tables without updated_at (addresses) are copied in full.
+INSERT_ONLY_TABLES = {"contacts", "order_moves", "order_status_history"}
+
+
+def backup_tables() -> List[Table]:
+    """Every table of the shop database, parents before children"""
+    from database_production import Base
+    return list(Base.metadata.sorted_tables)
+
+
+def quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def change_filter(table: Table, since: datetime, cursor) -> Optional[str]:
+    """SQL condition selecting rows changed since a time, None to copy the whole table"""
+    names = ["archived_at", "updated_at"] + (["created_at"] if table.name in INSERT_ONLY_TABLES else [])
+    for name in names:
+        if name in table.columns:
+            return cursor.mogrify(f"{quote(name)} > %s", (since,)).decode()
+    if table.name in INCREMENTAL_PARENTS:
+        key, parent = INCREMENTAL_PARENTS[table.name]
+        return cursor.mogrify(
+            f"{quote(key)} IN (SELECT id FROM {quote(parent)} WHERE updated_at > %s)", (since,)
+        ).decode()
+    return None
+
+
+class HashingWriter:
+    """File wrapper computing the SHA-256 and size of what is written"""
+
+    def __init__(self, f) -> None:
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.f.write(data)
+
+    def flush(self) -> None:
+        self.f.flush()
+
+
+class HashingReader:
+    """File wrapper computing the SHA-256 of what is read"""
+
+    def __init__(self, f) -> None:
+        self.f = f
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.f.read(size)
+        self.sha256.update(data)
+        return data
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dump_table(connection, table: Table, directory: str, since: Optional[datetime],
+               chunk_rows: int = CHUNK_ROWS) -> Dict[str, Any]:
+    """COPY one table out in primary key ranges of `chunk_rows` rows"""
+    columns = [c.name for c in table.columns]
+    key = [c.name for c in table.primary_key.columns]
+    key_sql = "(" + ", ".join(quote(k) for k in key) + ")"
+    os.makedirs(os.path.join(directory, table.name), exist_ok=True)
+
+    cursor = connection.cursor()
+    base_filter = change_filter(table, since, cursor) if since else None
+    chunks: List[Dict[str, Any]] = []
+    last: Optional[Tuple] = None
+    while True:
+        conditions = [base_filter] if base_filter else []
+        if last is not None:
+            conditions.append(cursor.mogrify(f"{key_sql} > %s", (last,)).decode())
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        # Find where this chunk ends first, so the COPY is a bounded index range
+        cursor.execute(
+            f"SELECT {', '.join(quote(k) for k in key)} FROM {quote(table.name)}{where} "
+            f"ORDER BY {key_sql} OFFSET %s LIMIT 1",
+            (chunk_rows - 1,)
+        )
+        upper = cursor.fetchone()
+        if upper is not None:
+            where += (" AND " if conditions else " WHERE ") + cursor.mogrify(f"{key_sql} <= %s", (tuple(upper),)).decode()
+
+        filename = os.path.join(table.name, f"{len(chunks):05d}.csv.gz")
+        path = os.path.join(directory, filename)
+        with open(path + ".tmp", "wb") as raw:
+            writer = HashingWriter(raw)
+            with gzip.GzipFile(fileobj=writer, mode="wb", compresslevel=6, mtime=0) as compressed:
+                cursor.copy_expert(
+                    f"COPY (SELECT {', '.join(quote(c) for c in columns)} FROM {quote(table.name)}{where} "
+                    f"ORDER BY {key_sql}) TO STDOUT WITH (FORMAT csv)",
+                    compressed
+                )
+                rows = cursor.rowcount
+        os.replace(path + ".tmp", path)
+        if rows or not chunks:
+            chunks.append({"file": filename, "rows": rows, "bytes": writer.size, "sha256": writer.sha256.hexdigest()})
+        else:
+            os.remove(path)
+        if upper is None:
+            break
+        last = tuple(upper)
+
+    return {
+        "columns": columns,
+        "primary_key": key,
+        "mode": "changes" if base_filter else "full",
+        "rows": sum(chunk["rows"] for chunk in chunks),
+        "chunks": chunks,
+    }
+
+
+def order_move_tables() -> Set[str]:
+    """Tables orders move between, and the log of those moves"""
+    from database_production import ARCHIVE_TABLES, OrderMoveDB
+    return {model.__tablename__ for pair in ARCHIVE_TABLES for model in pair} | {OrderMoveDB.__tablename__}
+
+
+def dump_tables(connection, tables: List[Table], directory: str, since: Optional[datetime],
+                chunk_rows: int) -> Dict[str, Any]:
+    """Dump tables in order, logging each"""
+    dumped = {}
+    for table in tables:
+        started = time.monotonic()
+        dumped[table.name] = dump_table(connection, table, directory, since, chunk_rows)
+        logger.info("Dumped %s: %d rows in %.1fs", table.name, dumped[table.name]["rows"], time.monotonic() - started)
+    return dumped
+
+
+def load_manifest(directory: str) -> Dict[str, Any]:
+    with open(os.path.join(directory, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"{directory}: unsupported backup format {manifest.get('format_version')}")
+    return manifest
+
+
+def run_backup(output_dir: str, since_dir: Optional[str] = None, chunk_rows: int = CHUNK_ROWS) -> Dict[str, Any]:
+    """Write a full backup, or an incremental one on top of the backup in `since_dir`"""
+    from database_production import engine, ORDER_MOVE_LOCK
+
+    since = None
+    if since_dir:
+        since = datetime.fromisoformat(load_manifest(since_dir)["started_at"]) - INCREMENTAL_OVERLAP
+    os.makedirs(output_dir)
+
+    # Children first: a row referenced by a dumped child was already
+    # committed, so it is still there when its parent table is dumped.
+    # Only order tables reference order tables, so dumping them first as
+    # a group keeps that order.
+    tables = list(reversed(backup_tables()))
+    moving = order_move_tables()
+    order_tables = [table for table in tables if table.name in moving]
+    other_tables = [table for table in tables if table.name not in moving]
+
+    connection = engine.raw_connection()
+    locked = False
+    try:
+        # Every statement commits on its own; no transaction outlives a chunk
+        connection.driver_connection.autocommit = True
+        cursor = connection.cursor()
+        cursor.execute("SELECT timezone('utc', now())")
+        started_at = cursor.fetchone()[0]
+        manifest: Dict[str, Any] = {
+            "format_version": FORMAT_VERSION,
+            "kind": "incremental" if since else "full",
+            "started_at": started_at.isoformat(),
+            "since": since.isoformat() if since else None,
+            "base": os.path.basename(os.path.normpath(since_dir)) if since_dir else None,
+            "tables": {},
+        }
+        # Waits for moves in progress; new ones fail until the order tables are dumped
+        cursor.execute("SELECT pg_advisory_lock(%s)", (ORDER_MOVE_LOCK,))
+        locked = True
+        manifest["tables"].update(dump_tables(connection, order_tables, output_dir, since, chunk_rows))
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (ORDER_MOVE_LOCK,))
+        locked = False
+        manifest["tables"].update(dump_tables(connection, other_tables, output_dir, since, chunk_rows))
+    finally:
+        if locked:
+            # Session locks outlive the checkout, so release it before the pool gets the connection back
+            connection.cursor().execute("SELECT pg_advisory_unlock(%s)", (ORDER_MOVE_LOCK,))
+        connection.driver_connection.autocommit = False
+        connection.close()
+
+    manifest["finished_at"] = datetime.utcnow().isoformat()
+    with open(os.path.join(output_dir, MANIFEST_NAME + ".tmp"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    # The manifest is written last, so a backup without one is incomplete
+    os.replace(os.path.join(output_dir, MANIFEST_NAME + ".tmp"), os.path.join(output_dir, MANIFEST_NAME))
+    return manifest
+
+
+def verify_backup(directory: str) -> List[str]:
+    """Chunks that are missing or fail their checksum"""
+    problems = []
+    for name, table in load_manifest(directory)["tables"].items():
+        for chunk in table["chunks"]:
+            path = os.path.join(directory, chunk["file"])
+            if not os.path.exists(path):
+                problems.append(f"{chunk['file']}: missing")
+            elif file_digest(path) != chunk["sha256"]:
+                problems.append(f"{chunk['file']}: checksum mismatch")
+    return problems
+
+
+def load_chunk(connection, table: str, info: Dict[str, Any], directory: str, chunk: Dict[str, Any],
+               upsert: bool) -> None:
+    """COPY one chunk in, committing only if its checksum matches"""
+    columns = ", ".join(quote(c) for c in info["columns"])
+    cursor = connection.cursor()
+    target = quote(table)
+    if upsert:
+        target = quote(f"restore_{table}")
+        cursor.execute(f"CREATE TEMP TABLE {target} (LIKE {quote(table)} INCLUDING DEFAULTS) ON COMMIT DROP")
+    with open(os.path.join(directory, chunk["file"]), "rb") as raw:
+        reader = HashingReader(raw)
+        with gzip.GzipFile(fileobj=reader, mode="rb") as compressed:
+            cursor.copy_expert(f"COPY {target} ({columns}) FROM STDIN WITH (FORMAT csv)", compressed)
+        reader.sha256.update(raw.read())
+    if reader.sha256.hexdigest() != chunk["sha256"]:
+        connection.rollback()
+        raise ValueError(f"{chunk['file']}: checksum mismatch, not restored")
+    if upsert:
+        key = ", ".join(quote(k) for k in info["primary_key"])
+        updates = ", ".join(f"{quote(c)} = EXCLUDED.{quote(c)}" for c in info["columns"] if c not in info["primary_key"])
+        conflict = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+        cursor.execute(
+            f"INSERT INTO {quote(table)} ({columns}) SELECT {columns} FROM {target} "
+            f"ON CONFLICT ({key}) {conflict}"
+        )
+    connection.commit()
+
+
+def restore_table(table: str, info: Dict[str, Any], directory: str, upsert: bool) -> int:
+    """Load every chunk of one table on its own connection"""
+    from database_production import engine
+
+    connection = engine.raw_connection()
+    try:
+        for chunk in info["chunks"]:
+            load_chunk(connection, table, info, directory, chunk, upsert)
+    finally:
+        connection.close()
+    return info["rows"]
+
+
+def restore_levels(tables: List[Table], names: List[str]) -> List[List[str]]:
+    """Group tables so each group only references tables in earlier groups"""
+    by_name = {table.name: table for table in tables}
+    remaining = [name for name in names if name in by_name]
+    levels = []
+    while remaining:
+        level = [
+            name for name in remaining
+            if all(fk.column.table.name not in remaining or fk.column.table.name == name
+                   for fk in by_name[name].foreign_keys)
+        ]
+        levels.append(level)
+        remaining = [name for name in remaining if name not in level]
+    return levels
+
+
+def run_restore(directories: List[str], jobs: int = 4, clean: bool = False) -> None:
+    """Restore a full backup and the incremental backups taken after it, in order"""
+    from database_production import engine
+
+    manifests = [load_manifest(directory) for directory in directories]
+    tables = backup_tables()
+    known = {table.name for table in tables}
+    for directory in directories:
+        problems = verify_backup(directory)
+        if problems:
+            raise ValueError(f"{directory} is damaged: " + "; ".join(problems))
+
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if clean:
+            names = [name for name in manifests[0]["tables"] if name in known]
+            cursor.execute("TRUNCATE " + ", ".join(quote(name) for name in names) + " CASCADE")
+        elif manifests[0]["kind"] == "full":
+            for name in manifests[0]["tables"]:
+                if name not in known:
+                    continue
+                cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {quote(name)})")
+                if cursor.fetchone()[0]:
+                    raise ValueError(f"Table {name} is not empty; restore into an empty database or pass --clean")
+        connection.commit()
+    finally:
+        connection.close()
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for directory, manifest in zip(directories, manifests):
+            upsert = manifest["kind"] == "incremental"
+            for level in restore_levels(tables, list(manifest["tables"])):
+                futures = {
+                    name: pool.submit(restore_table, name, manifest["tables"][name], directory, upsert)
+                    for name in level
+                }
+                for name, future in futures.items():
+                    logger.info("Restored %s from %s: %d rows", name, os.path.basename(directory), future.result())
+            if upsert and "order_moves" in manifest["tables"]:
+                from database_production import replay_order_moves
+                settled = replay_order_moves(datetime.fromisoformat(manifest["since"]))
+                logger.info("Replayed archive moves of %d orders from %s", settled, os.path.basename(directory))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Parse arguments and run a command"""
+    parser = argparse.ArgumentParser(description="Back up and restore the shop database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backup = commands.add_parser("backup", help="Write a full or incremental backup")
+    backup.add_argument("--output", help="Backup directory (default: BACKUP_DIR/db_<time>)")
+    backup.add_argument("--since", metavar="BACKUP", help="Only copy rows changed since this backup")
+    backup.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Rows per chunk file")
+
+    verify = commands.add_parser("verify", help="Check every chunk against its checksum")
+    verify.add_argument("backup")
+
+    restore = commands.add_parser("restore", help="Restore a full backup and later incremental ones")
+    restore.add_argument("backups", nargs="+", help="Full backup first, then incremental backups in order")
+    restore.add_argument("--jobs", type=int, default=4, help="Tables restored in parallel")
+    restore.add_argument("--clean", action="store_true", help="Empty the tables before restoring")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    try:
+        return run_command(args)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+
+def run_command(args: argparse.Namespace) -> int:
+    """Run the parsed command, returning the exit status"""
+    if args.command == "backup":
+        output = args.output or os.path.join(DEFAULT_BACKUP_DIR, datetime.now().strftime("db_%Y-%m-%d_%H-%M-%S"))
+        manifest = run_backup(output, args.since, args.chunk_rows)
+        rows = sum(table["rows"] for table in manifest["tables"].values())
+        print(f"{manifest['kind'].capitalize()} backup of {rows} rows written to {output}")
+    elif args.command == "verify":
+        problems = verify_backup(args.backup)
+        for problem in problems:
+            print(problem)
+        if problems:
+            return 1
+        print("All chunks match their checksums")
+    else:
+        run_restore(args.backups, args.jobs, args.clean)
+        print("Restore complete")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
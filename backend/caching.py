@@ -0,0 +1,155 @@
+"""
+In-process caches for Sensation by Sanu API
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry expiry and negative caching
+
+    Storing ``None`` records a known miss, kept for ``negative_ttl`` seconds
+    so repeated lookups of unknown keys don't reach the database either.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, negative_ttl: Optional[float] = None) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        """Return (found, value); a found value of None is a cached miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Cache a value, or a miss when value is None"""
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        """Forget a key"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Forget every key"""
+        with self._lock:
+            self._entries.clear()
+
+
+class StaleWhileRevalidateCache:
+    """Async cache that serves stale values while one refresh runs in the background
+
+    Values are fresh for ``ttl`` seconds, then served stale for up to
+    ``stale_ttl`` more while a single background refresh replaces them.
+    Concurrent misses for the same key share one computation. ``expire``
+    may be called from any thread; a refresh that started before it is
+    returned to its callers but not cached, since it may predate the write.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float, max_entries: int = 1000) -> None:
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Bumped by expire(); results computed under an older one are dropped
+        self._generation = 0
+        # key -> (fresh until, stale until, value)
+        self._entries: "OrderedDict[Hashable, Tuple[float, float, Any]]" = OrderedDict()
+        # key -> (generation it started under, computation)
+        self._inflight: Dict[Hashable, Tuple[int, "asyncio.Future[Any]"]] = {}
+
+    async def get(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, computing it at most once at a time"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry[1]:
+                self._entries.move_to_end(key)
+        if entry is not None and now < entry[1]:
+            if now < entry[0]:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                self._refresh(key, compute)
+            return entry[2]
+
+        self.misses += 1
+        return await asyncio.shield(self._refresh(key, compute))
+
+    def expire(self) -> None:
+        """Mark every value stale, so the next read triggers a refresh"""
+        with self._lock:
+            self._generation += 1
+            for key, (_fresh_until, stale_until, value) in list(self._entries.items()):
+                self._entries[key] = (0.0, stale_until, value)
+
+    def clear(self) -> None:
+        """Forget every value"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def _refresh(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> "asyncio.Future[Any]":
+        """Start computing key unless a computation is already running for the current generation"""
+        generation = self._generation
+        inflight = self._inflight.get(key)
+        if inflight is not None and inflight[0] == generation:
+            return inflight[1]
+        future = asyncio.ensure_future(self._compute(key, compute, generation))
+        # Background refreshes have no awaiter; failures are logged in _compute
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = (generation, future)
+        return future
+
+    async def _compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]], generation: int) -> Any:
+        try:
+            value = await compute()
+        except Exception:
+            logger.exception("Refreshing cached value %r failed", key)
+            raise
+        finally:
+            inflight = self._inflight.get(key)
+            if inflight is not None and inflight[0] == generation:
+                del self._inflight[key]
+        now = time.monotonic()
+        with self._lock:
+            if generation != self._generation:
+                return value
+            self._entries[key] = (now + self.ttl, now + self.ttl + self.stale_ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
@@ -0,0 +1,91 @@
+"""
+In-memory catalog synchronisation for Sensation by Sanu API
+"""
+
+import asyncio
+import contextlib
+import logging
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from events import RedisSubscriber
+from models import Product
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogSync:
+    """Keep every worker's in-memory catalog in step with product writes
+
+    A worker that writes products calls `notify` with their IDs; with Redis
+    the other workers reload those products at once. Every worker also
+    rebuilds its catalog every `reload_interval` seconds, which bounds how
+    stale it can get without Redis or after a missed message.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[List[str]], List[Product]],
+        apply: Callable[[List[str], List[Product]], None],
+        reload: Callable[[], None],
+        redis_url: Optional[str] = None,
+        channel: str = "product-changes",
+        reload_interval: float = 60.0,
+    ) -> None:
+        self.load = load
+        self.apply = apply
+        self.reload = reload
+        self.reload_interval = reload_interval
+        self.sender = uuid.uuid4().hex
+        self._channel = RedisSubscriber(redis_url, channel, self._receive, "Catalog sync")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def notify(self, product_ids: List[str]) -> None:
+        """Tell the other workers these products changed (callable from any thread)"""
+        if not self._channel.connected or not product_ids:
+            return
+        coroutine = self._publish([str(product_id) for product_id in product_ids])
+        try:
+            asyncio.get_running_loop().create_task(coroutine)
+        except RuntimeError:
+            asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    async def start(self) -> None:
+        """Start the periodic reload and, with Redis, listening for other workers' changes"""
+        self._loop = asyncio.get_running_loop()
+        self._tasks.append(asyncio.create_task(self._reload_periodically()))
+        await self._channel.start()
+
+    async def stop(self) -> None:
+        """Stop syncing and close the Redis connection"""
+        for task in self._tasks:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+        await self._channel.stop()
+
+    async def _publish(self, product_ids: List[str]) -> None:
+        try:
+            await self._channel.publish({"sender": self.sender, "product_ids": product_ids})
+        except Exception as e:
+            logger.warning("Redis publish failed, other workers see the change on reload: %s", e)
+
+    async def _reload_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await asyncio.to_thread(self.reload)
+            except Exception as e:
+                logger.warning("Reloading the catalog failed: %s", e)
+
+    async def _receive(self, message: Dict[str, Any]) -> None:
+        """Reload products changed by other workers"""
+        if message["sender"] == self.sender:
+            return
+        product_ids = [str(product_id) for product_id in message["product_ids"]]
+        try:
+            self.apply(product_ids, await asyncio.to_thread(self.load, product_ids))
+        except Exception as e:
+            logger.warning("Applying a catalog change failed: %s", e)
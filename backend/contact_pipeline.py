@@ -0,0 +1,187 @@
+"""
+Contact form ingestion for Sensation by Sanu API
+
+Submissions are queued in memory and written in batches, so a flood of
+them costs one INSERT per batch instead of a connection per request.
+Duplicates are dropped on arrival and likely spam before the insert.
+Queued submissions are lost if the worker dies before flushing them.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import logging
+import math
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from models import ContactForm
+
+logger = logging.getLogger(__name__)
+
+_URL = re.compile(r"https?://|www\.|\b[a-z0-9-]+\.(?:ru|cn|xyz|top|click|link|biz|info)\b", re.IGNORECASE)
+_SPAM_TERMS = re.compile(
+    r"\b(?:casino|betting|crypto|bitcoin|forex|viagra|cialis|loan|backlinks?|seo|ranking|"
+    r"guest post|click here|free money|earn \$?\d+|whatsapp|telegram|investment opportunity)\b",
+    re.IGNORECASE,
+)
+_REPEATED = re.compile(r"(.)\1{5,}")
+_WHITESPACE = re.compile(r"\s+")
+
+# Weights of the spam features; the score is a logistic of their sum
+SPAM_WEIGHTS = {
+    "links": 1.6,           # per link, capped at 3
+    "link_in_name": 3.0,
+    "spam_terms": 1.2,      # per term, capped at 3
+    "shouting": 2.0,        # share of letters in capitals
+    "repeated_chars": 1.0,
+    "short_with_link": 1.5,
+}
+SPAM_BIAS = -3.0
+
+
+def normalize_text(text: str) -> str:
+    """Case-fold and collapse whitespace, so trivial variations hash alike"""
+    return _WHITESPACE.sub(" ", text.casefold()).strip()
+
+
+def dedup_key(contact: ContactForm) -> str:
+    """Hash of the normalized email and message"""
+    raw = f"{contact.email.strip().lower()}\0{normalize_text(contact.message)}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def spam_score(contact: ContactForm) -> float:
+    """Probability-like spam score between 0 and 1"""
+    text = f"{contact.subject or ''} {contact.message}"
+    letters = [c for c in text if c.isalpha()]
+    links = len(_URL.findall(text))
+    features = {
+        "links": min(links, 3),
+        "link_in_name": 1 if _URL.search(contact.name) else 0,
+        "spam_terms": min(len(_SPAM_TERMS.findall(text)), 3),
+        "shouting": sum(c.isupper() for c in letters) / len(letters) if len(letters) >= 20 else 0.0,
+        "repeated_chars": 1 if _REPEATED.search(text) else 0,
+        "short_with_link": 1 if links and len(contact.message) < 80 else 0,
+    }
+    total = SPAM_BIAS + sum(SPAM_WEIGHTS[name] * value for name, value in features.items())
+    return 1 / (1 + math.exp(-total))
+
+
+class ContactPipeline:
+    """Bounded queue of contact submissions, flushed to the database in batches"""
+
+    def __init__(
+        self,
+        insert_batch: Callable[[List[Dict[str, Any]]], int],
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 0.5,
+        dedup_window: float = 3600.0,
+        spam_threshold: float = 0.8,
+        max_dedup_keys: int = 100000,
+    ) -> None:
+        self.insert_batch = insert_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dedup_window = dedup_window
+        self.spam_threshold = spam_threshold
+        self.max_dedup_keys = max_dedup_keys
+        self.counts = {"accepted": 0, "duplicate": 0, "rejected": 0, "spam": 0, "stored": 0, "failed": 0}
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        # Dedup key -> when it stops counting as a duplicate, oldest first
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._worker: Optional[asyncio.Task] = None
+
+    def submit(self, contact: ContactForm) -> str:
+        """Queue a submission without waiting: "accepted", "duplicate" or "rejected" (queue full)"""
+        now = time.monotonic()
+        while self._seen and (next(iter(self._seen.values())) <= now or len(self._seen) > self.max_dedup_keys):
+            self._seen.popitem(last=False)
+        key = dedup_key(contact)
+        if key in self._seen:
+            self.counts["duplicate"] += 1
+            return "duplicate"
+        try:
+            self._queue.put_nowait((contact, datetime.utcnow()))
+        except asyncio.QueueFull:
+            self.counts["rejected"] += 1
+            return "rejected"
+        self._seen[key] = now + self.dedup_window
+        self.counts["accepted"] += 1
+        return "accepted"
+
+    def start(self) -> None:
+        """Start flushing batches on the running loop"""
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the worker after writing whatever is still queued"""
+        if self._worker is not None:
+            self._worker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._worker
+            self._worker = None
+        while not self._queue.empty():
+            await self._flush(self._take_ready())
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.counts, "queued": self._queue.qsize()}
+
+    def _take_ready(self) -> List[Any]:
+        batch = []
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch: List[Any] = []
+            try:
+                # Wait for the first submission, then give a flood a moment to fill the batch
+                batch.append(await self._queue.get())
+                deadline = asyncio.get_running_loop().time() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - asyncio.get_running_loop().time()
+                    if remaining <= 0:
+                        break
+                    # Not wait_for: it swallows stop()'s cancel if an item arrives
+                    # at the same moment, and the worker would never exit
+                    try:
+                        async with asyncio.timeout(remaining):
+                            batch.append(await self._queue.get())
+                    except TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # Already taken off the queue, so stop() wouldn't see these
+                await self._flush(batch)
+                raise
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Any]) -> None:
+        """Score a batch and insert the submissions that aren't spam"""
+        rows = []
+        for contact, received_at in batch:
+            score = spam_score(contact)
+            if score >= self.spam_threshold:
+                self.counts["spam"] += 1
+                continue
+            rows.append({
+                "name": contact.name,
+                "email": contact.email,
+                "message": contact.message,
+                "subject": contact.subject,
+                "spam_score": round(score, 3),
+                "created_at": received_at,
+            })
+        if not rows:
+            return
+        try:
+            self.counts["stored"] += await asyncio.to_thread(self.insert_batch, rows)
+        except Exception as e:
+            self.counts["failed"] += len(rows)
+            logger.error("Dropped %d contact submissions, insert failed: %s", len(rows), e)
@@ -0,0 +1,150 @@
+"""
+Order status event broadcasting for Sensation by Sanu API
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per subscriber before the oldest are dropped
+SUBSCRIBER_QUEUE_SIZE = 32
+
+
+def format_sse(event: Dict[str, Any], event_type: str = "status") -> str:
+    """Format an event as a Server-Sent Events message"""
+    return f"event: {event_type}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+class RedisSubscriber:
+    """Exchange JSON messages with the other workers over a Redis channel
+
+    Owns the connection and the task relaying received messages to
+    `handle`, resubscribing after errors. Without Redis, or when it is
+    unreachable at start, `connected` stays False and callers fall back
+    to working per worker. `name` labels log messages.
+    """
+
+    def __init__(
+        self, redis_url: Optional[str], channel: str, handle: Callable[[Any], Awaitable[None]], name: str
+    ) -> None:
+        self.redis_url = redis_url
+        self.channel = channel
+        self.handle = handle
+        self.name = name
+        self._redis: Any = None
+        self._listener: Optional[asyncio.Task] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._redis is not None
+
+    async def start(self) -> None:
+        """Connect to Redis and start relaying messages"""
+        if not self.redis_url or self._listener:
+            return
+        try:
+            import redis.asyncio as redis
+
+            self._redis = redis.from_url(self.redis_url)
+            pubsub = self._redis.pubsub()
+            await pubsub.subscribe(self.channel)
+        except Exception as e:
+            logger.warning("%s running without Redis fan-out: %s", self.name, e)
+            self._redis = None
+            return
+        self._listener = asyncio.create_task(self._relay(pubsub))
+
+    async def stop(self) -> None:
+        """Stop relaying and close the Redis connection"""
+        if self._listener:
+            self._listener.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._listener
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+    async def publish(self, message: Dict[str, Any]) -> None:
+        """Send a message to every subscribed worker, this one included; raises if Redis fails"""
+        await self._redis.publish(self.channel, json.dumps(message, default=str))
+
+    async def _relay(self, pubsub: Any) -> None:
+        """Hand each message published on the channel to `handle`"""
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        await self.handle(json.loads(message["data"]))
+                    except (KeyError, TypeError, ValueError):
+                        logger.warning("Ignoring malformed message on %s", self.channel)
+            except asyncio.CancelledError:
+                await pubsub.close()
+                raise
+            except Exception as e:
+                logger.warning("%s relay interrupted: %s", self.name, e)
+                await asyncio.sleep(1)
+                with contextlib.suppress(Exception):
+                    await pubsub.subscribe(self.channel)
+
+
+class OrderEventBroadcaster:
+    """Fan out order events to local subscribers, via Redis when configured"""
+
+    def __init__(self, redis_url: Optional[str] = None, channel: str = "order-events") -> None:
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._channel = RedisSubscriber(redis_url, channel, self._receive, "Order events")
+
+    async def start(self) -> None:
+        """Connect to Redis and start relaying published events"""
+        await self._channel.start()
+
+    async def stop(self) -> None:
+        """Stop relaying and close the Redis connection"""
+        await self._channel.stop()
+
+    async def publish(self, event: Dict[str, Any]) -> None:
+        """Publish an order event to subscribers in every worker"""
+        if self._channel.connected:
+            try:
+                await self._channel.publish(event)
+                return
+            except Exception as e:
+                logger.warning("Redis publish failed, delivering locally: %s", e)
+        self._dispatch(event)
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, order_id: str) -> AsyncIterator[asyncio.Queue]:
+        """Receive events for one order while the context is open"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(order_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(order_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[order_id]
+
+    def subscriber_count(self) -> int:
+        """Number of open subscriptions in this worker"""
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def _dispatch(self, event: Dict[str, Any]) -> None:
+        """Deliver an event to this worker's subscribers"""
+        for queue in self._subscribers.get(str(event.get("order_id")), ()):
+            if queue.full():
+                # Slow consumer: the latest status matters more than old ones
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    async def _receive(self, event: Dict[str, Any]) -> None:
+        """Deliver an event published by any worker"""
+        self._dispatch(event)
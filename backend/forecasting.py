@@ -0,0 +1,97 @@
+"""
+Inventory depletion forecasting for Sensation by Sanu API
+"""
+
+import math
+import threading
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from models import InventoryForecast
+
+
+class InventoryForecaster:
+    """Per-product sales velocity as an exponentially weighted daily average
+
+    Only complete days are folded in, each exactly once: update() takes the
+    days after the last one processed, so a run costs one query over the
+    new days, not the whole history.
+    """
+
+    def __init__(self, half_life_days: float = 7.0, history_days: int = 90, alert_days: float = 14.0) -> None:
+        self.alpha = 1 - 0.5 ** (1 / half_life_days)
+        self.history_days = history_days
+        self.alert_days = alert_days
+        self.last_day: Optional[date] = None
+        self._lock = threading.Lock()
+        self._column_of: Dict[str, int] = {}
+        self._average = np.zeros(0, dtype=np.float64)
+        self._days_seen = 0
+
+    def pending_range(self, today: date) -> Optional[Tuple[date, date]]:
+        """Complete days not yet folded in, as an inclusive (start, end) range"""
+        end = today - timedelta(days=1)
+        start = self.last_day + timedelta(days=1) if self.last_day else today - timedelta(days=self.history_days)
+        return (start, end) if start <= end else None
+
+    def update(self, rows: List[Any], start: date, end: date) -> None:
+        """Fold in the (day, product_id, units) rows of every day from start to end"""
+        with self._lock:
+            if self.last_day and start != self.last_day + timedelta(days=1):
+                return  # Another thread already folded these days in
+            for row in rows:
+                self._column(str(row.product_id))
+            days = (end - start).days + 1
+            units = np.zeros((len(self._column_of), days), dtype=np.float64)
+            if rows:
+                columns = np.array([self._column_of[str(r.product_id)] for r in rows])
+                offsets = np.array([(r.day - start).days for r in rows])
+                np.add.at(units, (columns, offsets), np.array([r.units for r in rows], dtype=np.float64))
+
+            # Same as applying avg = alpha * x + (1 - alpha) * avg once per day
+            decay = 1 - self.alpha
+            weights = self.alpha * decay ** np.arange(days - 1, -1, -1)
+            self._average = self._average * decay ** days + units @ weights
+            self._days_seen += days
+            self.last_day = end
+
+    def velocities(self) -> Dict[str, float]:
+        """Expected units sold per day, per product seen so far"""
+        with self._lock:
+            if not self._days_seen:
+                return {}
+            # Starting from zero biases early averages low; divide that out
+            average = self._average / (1 - (1 - self.alpha) ** self._days_seen)
+            return {product_id: float(average[i]) for product_id, i in self._column_of.items()}
+
+    def forecast(self, products: List[Any], today: date) -> List[InventoryForecast]:
+        """Project stockout for each product, soonest first"""
+        velocities = self.velocities()
+        forecasts = []
+        for product in products:
+            quantity = product.quantity or 0
+            velocity = velocities.get(str(product.id), 0.0)
+            days_left: Optional[float] = quantity / velocity if velocity > 0 else None
+            if quantity <= 0:
+                days_left = 0.0
+            forecasts.append(InventoryForecast(
+                product_id=str(product.id),
+                name=product.name,
+                quantity=quantity,
+                daily_velocity=round(velocity, 3),
+                days_until_stockout=round(days_left, 1) if days_left is not None else None,
+                stockout_date=today + timedelta(days=math.floor(days_left)) if days_left is not None else None,
+                at_risk=days_left is not None and days_left <= self.alert_days
+            ))
+        forecasts.sort(key=lambda f: (f.days_until_stockout is None, f.days_until_stockout or 0.0))
+        return forecasts
+
+    def _column(self, product_id: str) -> int:
+        """Column of a product, added with a zero average when first seen"""
+        column = self._column_of.get(product_id)
+        if column is None:
+            column = self._column_of[product_id] = len(self._column_of)
+            self._average = np.append(self._average, 0.0)
+        return column
@@ -0,0 +1,285 @@
+"""
+Sensation by Sanu - Responsive product image pipeline
+
+Renders each source image at several widths and formats, naming every file
+by a hash of its source and settings so it can be cached forever. A manifest
+records what was rendered; unchanged sources are skipped on the next run.
+
+    python image_pipeline.py                        # ../src/assets/images -> ../public/images
+    python image_pipeline.py --source DIR --output DIR --workers 4
+
+The API reads the manifest to add a `srcset` map to each product. Variants
+of a changed or removed source are kept for RETAIN_SECONDS before being
+deleted, so pages and snapshots built from the old manifest keep working.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("image_pipeline")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCE_DIR = os.path.join(BASE_DIR, "..", "src", "assets", "images")
+DEFAULT_OUTPUT_DIR = os.getenv("IMAGE_DERIVATIVES_DIR", os.path.join(BASE_DIR, "..", "public", "images"))
+# URL the output directory is served under
+DEFAULT_URL_PREFIX = os.getenv("IMAGE_DERIVATIVES_URL", "/images")
+MANIFEST_NAME = "manifest.json"
+# How long files dropped from the manifest stay on disk; cached pages,
+# snapshots and the API's in-memory catalog still point at them for a while
+RETAIN_SECONDS = 24 * 3600
+
+# Widths rendered for each place a product image is shown
+PRESETS: Dict[str, List[int]] = {
+    "thumb": [160, 320],
+    "card": [480, 768],
+    "zoom": [1200, 1600],
+}
+QUALITY = {"webp": 80, "avif": 60}
+SOURCE_EXTENSIONS = {".webp", ".png", ".jpg", ".jpeg"}
+# Bump to re-render everything after changing how variants are produced
+PIPELINE_VERSION = 1
+
+# Vite build names look like "blackbottle-544be0fa.webp"
+_BUILD_HASH = re.compile(r"-[0-9a-f]{8}$")
+
+
+def image_key(path_or_url: str) -> str:
+    """Name shared by a source file and its built asset URL, e.g. 'blackbottle'"""
+    stem = os.path.splitext(os.path.basename(path_or_url))[0]
+    return _BUILD_HASH.sub("", stem)
+
+
+def available_formats() -> List[str]:
+    """Output formats this Pillow build can encode; AVIF needs pillow-avif-plugin or Pillow 11.3+"""
+    from PIL import Image
+    try:
+        import pillow_avif  # noqa: F401  (registers the encoder)
+    except ImportError:
+        pass
+    Image.init()
+    return [fmt for fmt in ("avif", "webp") if fmt.upper() in Image.SAVE]
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def render_variants(source_path: str, output_dir: str, formats: List[str], digest: str) -> Dict[str, Any]:
+    """Render every preset width and format of one source (runs in a worker process)"""
+    from PIL import Image, ImageOps
+
+    key = image_key(source_path)
+    settings = json.dumps([PIPELINE_VERSION, PRESETS, QUALITY], sort_keys=True)
+    tag = hashlib.sha256((digest + settings).encode()).hexdigest()[:10]
+    variants: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        source_width, source_height = image.size
+
+        for preset, widths in PRESETS.items():
+            # Never upscale; a source narrower than a preset gets one variant at its own width
+            preset_widths = sorted({min(width, source_width) for width in widths})
+            for fmt in formats:
+                entries = []
+                for width in preset_widths:
+                    height = max(1, round(source_height * width / source_width))
+                    filename = f"{key}-{width}w-{tag}.{fmt}"
+                    path = os.path.join(output_dir, filename)
+                    if not os.path.exists(path):
+                        resized = image if width == source_width else image.resize((width, height), Image.LANCZOS)
+                        resized.save(path + ".tmp", format=fmt.upper(), quality=QUALITY[fmt])
+                        os.replace(path + ".tmp", path)
+                    entries.append({"file": filename, "width": width, "height": height})
+                variants.setdefault(preset, {})[fmt] = entries
+
+    return {"sha256": digest, "width": source_width, "height": source_height, "variants": variants}
+
+
+def variant_files(entry: Dict[str, Any]) -> List[str]:
+    """Every file a manifest entry refers to"""
+    return [
+        variant["file"]
+        for formats in entry["variants"].values()
+        for entries in formats.values()
+        for variant in entries
+    ]
+
+
+def load_manifest(output_dir: str) -> Dict[str, Any]:
+    """Read the manifest, or an empty one"""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"images": {}}
+
+
+def write_manifest(output_dir: str, manifest: Dict[str, Any]) -> None:
+    """Replace the manifest atomically, so readers never see half a file"""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def run_pipeline(
+    source_dir: str,
+    output_dir: str,
+    workers: Optional[int] = None,
+    prune: bool = True,
+    retain_seconds: float = RETAIN_SECONDS,
+) -> Dict[str, int]:
+    """Render new or changed sources and update the manifest"""
+    os.makedirs(output_dir, exist_ok=True)
+    formats = available_formats()
+    if "avif" not in formats:
+        logger.info("AVIF encoder not available, rendering %s only", ", ".join(formats))
+    manifest = load_manifest(output_dir)
+    previous = manifest.get("images", {})
+
+    jobs: List[Tuple[str, str, str]] = []
+    images: Dict[str, Any] = {}
+    skipped = 0
+    for name in sorted(os.listdir(source_dir)):
+        path = os.path.join(source_dir, name)
+        if os.path.splitext(name)[1].lower() not in SOURCE_EXTENSIONS:
+            if os.path.isfile(path):
+                logger.info("Skipping %s, not a raster image", name)
+            continue
+        key = image_key(name)
+        digest = file_digest(path)
+        entry = previous.get(key)
+        if (
+            entry and entry["sha256"] == digest and entry.get("formats") == formats
+            and entry.get("pipeline_version") == PIPELINE_VERSION
+            and all(os.path.exists(os.path.join(output_dir, f)) for f in variant_files(entry))
+        ):
+            images[key] = entry
+            skipped += 1
+        else:
+            jobs.append((key, path, digest))
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                (key, pool.submit(render_variants, path, output_dir, formats, digest))
+                for key, path, digest in jobs
+            ]
+            for key, future in futures:
+                entry = future.result()
+                entry.update(formats=formats, pipeline_version=PIPELINE_VERSION)
+                images[key] = entry
+                logger.info("Rendered %s: %d files", key, len(variant_files(entry)))
+
+    # Files leaving the manifest are retired, and only deleted once they have
+    # been out of it for `retain_seconds`
+    now = time.time()
+    keep = {f for entry in images.values() for f in variant_files(entry)}
+    retired: Dict[str, float] = {
+        filename: since for filename, since in manifest.get("retired", {}).items() if filename not in keep
+    }
+    for entry in previous.values():
+        for filename in variant_files(entry):
+            if filename not in keep:
+                retired.setdefault(filename, now)
+    removed = 0
+    for filename, since in list(retired.items()):
+        path = os.path.join(output_dir, filename)
+        if not os.path.exists(path):
+            del retired[filename]
+        elif prune and now - since >= retain_seconds:
+            os.remove(path)
+            del retired[filename]
+            removed += 1
+
+    write_manifest(output_dir, {"images": images, "retired": retired})
+    return {"rendered": len(jobs), "unchanged": skipped, "removed": removed}
+
+
+class ImageVariants:
+    """Read-side view of the manifest
+
+    `srcset` is a dictionary lookup; the owner calls `reload_if_changed`
+    periodically to pick up manifests the pipeline rewrote.
+    """
+
+    def __init__(self, output_dir: str = DEFAULT_OUTPUT_DIR, url_prefix: str = DEFAULT_URL_PREFIX) -> None:
+        self.manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        self.url_prefix = url_prefix.rstrip("/")
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._srcsets: Dict[str, Dict[str, Dict[str, str]]] = {}
+
+    def srcset(self, image_url: Optional[str]) -> Optional[Dict[str, Dict[str, str]]]:
+        """Preset -> format -> srcset string for a product image, None if not rendered"""
+        if not image_url:
+            return None
+        return self._srcsets.get(image_key(image_url))
+
+    def reload_if_changed(self) -> bool:
+        """Re-read the manifest if the pipeline rewrote it; True when it did"""
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            srcsets: Dict[str, Dict[str, Dict[str, str]]] = {}
+            if mtime is not None:
+                with open(self.manifest_path) as f:
+                    images = json.load(f).get("images", {})
+                for key, entry in images.items():
+                    srcsets[key] = {
+                        preset: {
+                            fmt: ", ".join(f"{self.url_prefix}/{v['file']} {v['width']}w" for v in entries)
+                            for fmt, entries in formats.items()
+                        }
+                        for preset, formats in entry["variants"].items()
+                    }
+            self._srcsets = srcsets
+            self._mtime = mtime
+            return True
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Parse arguments and run the pipeline"""
+    parser = argparse.ArgumentParser(description="Render responsive variants of product images")
+    parser.add_argument("--source", default=DEFAULT_SOURCE_DIR, help="Directory of original images")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_DIR, help="Directory served at IMAGE_DERIVATIVES_URL")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--no-prune", action="store_true", help="Keep variants no longer in the manifest")
+    parser.add_argument(
+        "--retain-hours", type=float, default=RETAIN_SECONDS / 3600,
+        help="Hours a variant stays on disk after leaving the manifest (default: 24)",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    result = run_pipeline(
+        args.source, args.output, args.workers, prune=not args.no_prune, retain_seconds=args.retain_hours * 3600
+    )
+    print(f"{result['rendered']} rendered, {result['unchanged']} unchanged, {result['removed']} stale files removed")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
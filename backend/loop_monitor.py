@@ -0,0 +1,207 @@
+"""
+Event loop lag monitoring and blocking-call detection for Sensation by Sanu API
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the lag histogram, in seconds
+LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def route_label(scope: dict) -> str:
+    """Method and route template of a request, e.g. 'GET /orders/{order_id}'"""
+    route = scope.get("route")
+    return f"{scope.get('method', '')} {getattr(route, 'path', None) or scope.get('path', '')}"
+
+
+class LoopMonitor:
+    """Measure event loop lag; in debug mode, report what blocked the loop
+
+    A task sleeps for `interval` and measures how late it wakes up. In debug
+    mode a watchdog thread also notices when that task stops waking up for
+    longer than `block_threshold`, and captures the loop thread's stack and
+    the request it was running while the loop is still blocked.
+    """
+
+    def __init__(self, interval: float = 0.1, block_threshold: float = 0.1,
+                 debug: bool = False, max_reports: int = 50) -> None:
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.debug = debug
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.lag_sum = 0.0
+        self.lag_count = 0
+        self.bucket_counts = [0] * len(LAG_BUCKETS)
+        self.blocked_total = 0
+        self.blocked_by_route: Dict[str, int] = {}
+        self.reports: Deque[Dict[str, Any]] = deque(maxlen=max_reports)
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id = 0
+        self._last_beat = time.monotonic()
+        self._beats = 0
+        self._pending_report: Optional[Dict[str, Any]] = None
+        # Request task -> its ASGI scope, to name the route that blocked
+        self._requests: Dict[asyncio.Task, dict] = {}
+
+    def start(self) -> None:
+        """Start measuring on the running loop"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stopping.clear()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.create_task(self._measure())
+        if self.debug:
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+
+    async def stop(self) -> None:
+        """Stop the measuring task and watchdog"""
+        self._stopping.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    def request_started(self, scope: dict) -> None:
+        task = asyncio.current_task()
+        if task is not None:
+            self._requests[task] = scope
+
+    def request_finished(self) -> None:
+        task = asyncio.current_task()
+        if task is not None:
+            self._requests.pop(task, None)
+
+    async def _measure(self) -> None:
+        """Sleep for the interval and record how late the loop woke us"""
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._last_beat = now
+            self._beats += 1
+            self._observe(max(0.0, now - started - self.interval))
+
+    def _observe(self, lag: float) -> None:
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.lag_sum += lag
+        self.lag_count += 1
+        for i, bound in enumerate(LAG_BUCKETS):
+            if lag <= bound:
+                self.bucket_counts[i] += 1
+        if lag < self.block_threshold:
+            return
+
+        self.blocked_total += 1
+        report, self._pending_report = self._pending_report, None
+        route = report["route"] if report else None
+        if route:
+            self.blocked_by_route[route] = self.blocked_by_route.get(route, 0) + 1
+        if report:
+            report["blocked_ms"] = round(lag * 1000, 1)
+            logger.warning(
+                "Event loop blocked for %.0f ms in %s\n%s",
+                lag * 1000, route or "background work", "".join(report["stack"])
+            )
+
+    def _watch(self) -> None:
+        """Watchdog thread: capture the loop thread's stack while it is blocked"""
+        reported_beat = -1
+        poll = min(self.block_threshold, self.interval) / 4
+        while not self._stopping.wait(poll):
+            stalled = time.monotonic() - self._last_beat - self.interval
+            if stalled < self.block_threshold or reported_beat == self._beats:
+                continue
+            reported_beat = self._beats
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            task = asyncio.current_task(self._loop)
+            scope = self._requests.get(task) if task else None
+            self._pending_report = {
+                "at": datetime.utcnow().isoformat(),
+                "route": route_label(scope) if scope else None,
+                "path": scope.get("path") if scope else None,
+                "blocked_ms": None,
+                "stack": traceback.format_stack(frame),
+            }
+            self.reports.append(self._pending_report)
+
+    def stats(self) -> Dict[str, Any]:
+        """Lag summary for the health and debug endpoints"""
+        return {
+            "last_lag_ms": round(self.last_lag * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "mean_lag_ms": round(self.lag_sum / self.lag_count * 1000, 1) if self.lag_count else 0.0,
+            "blocked_total": self.blocked_total,
+            "blocked_by_route": dict(self.blocked_by_route),
+            "debug": self.debug,
+        }
+
+    def prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format"""
+        lines: List[str] = [
+            "# HELP event_loop_lag_seconds Delay between when the loop should and did wake a sleeping task",
+            "# TYPE event_loop_lag_seconds histogram",
+        ]
+        for bound, count in zip(LAG_BUCKETS, self.bucket_counts):
+            lines.append(f'event_loop_lag_seconds_bucket{{le="{bound}"}} {count}')
+        lines += [
+            f'event_loop_lag_seconds_bucket{{le="+Inf"}} {self.lag_count}',
+            f"event_loop_lag_seconds_sum {self.lag_sum:.6f}",
+            f"event_loop_lag_seconds_count {self.lag_count}",
+            "# HELP event_loop_lag_max_seconds Largest lag seen since start",
+            "# TYPE event_loop_lag_max_seconds gauge",
+            f"event_loop_lag_max_seconds {self.max_lag:.6f}",
+            "# HELP event_loop_blocked_total Times the loop was blocked longer than the threshold",
+            "# TYPE event_loop_blocked_total counter",
+            f"event_loop_blocked_total {self.blocked_total}",
+        ]
+        if self.blocked_by_route:
+            lines += [
+                "# HELP event_loop_blocked_route_total Blocks attributed to a route (debug mode)",
+                "# TYPE event_loop_blocked_route_total counter",
+            ]
+            for route, count in sorted(self.blocked_by_route.items()):
+                escaped = route.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'event_loop_blocked_route_total{{route="{escaped}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+class LoopMonitorMiddleware:
+    """ASGI middleware telling the monitor which request each task is serving"""
+
+    def __init__(self, app: Callable, monitor: LoopMonitor) -> None:
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or not self.monitor.debug:
+            await self.app(scope, receive, send)
+            return
+        self.monitor.request_started(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.monitor.request_finished()
@@ -3,36 +3,73 @@ Sensation by Sanu - Production Backend API
 Complete e-commerce platform with authentication, admin dashboard, and business intelligence
 """
 
-from fastapi import FastAPI, HTTPException, Depends, status, Request
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, status, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import JSONResponse
-from typing import List, Optional, Dict, Any
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from typing import List, Optional, Dict, Any, Tuple
 import uvicorn
-from datetime import datetime, timedelta
+import asyncio
+import json
+import logging
+from datetime import date, datetime, timedelta
 import os
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
 
 # Import our models and database
 from models import (
-    Product, Order, User, ContactForm, OrderCreate, OrderUpdate, 
-    UserCreate, UserUpdate, UserLogin, Token, PasswordChange,
+    Product, Order, User, ContactForm, CartItem, OrderCreate, OrderUpdate, 
+    UserCreate, UserUpdate, UserLogin, Token, PasswordChange, UserRole, UserRoleUpdate,
     AdminStats, APIResponse, ErrorResponse, ProductCreate, ProductUpdate,
-    OrderStatus, PaymentMethod
+    OrderStatus, PaymentMethod, TrackingStatus, TrackingEvent,
+    BulkOrderUpdate, BulkRestock, BulkPriceChange,
+    AnalyticsInterval, RevenueSeries, ProductSalesReport, InventoryForecast
 )
 from database_production import (
-    get_db, create_tables, init_sample_data,
+    get_db, get_read_db, read_session, replica_router, create_tables, init_sample_data,
     create_user, authenticate_user, get_user_by_email, get_user_by_id,
     create_product, get_products, get_product_by_id, update_product, delete_product,
     create_order, get_orders_by_user, get_all_orders, get_order_by_id, update_order,
-    get_admin_stats, create_contact,
-    create_access_token, verify_token, get_password_hash, verify_password
+    get_order_status_history, get_order_by_tracking_number, archive_old_orders,
+    bulk_update_orders, bulk_restock_products, bulk_reprice_category,
+    get_admin_stats, get_daily_sales, get_product_sales, get_daily_product_units, create_contacts, search_products_fulltext, get_products_by_ids,
+    record_payment_event, process_payment_events,
+    create_access_token, verify_token, get_password_hash, verify_password,
+    revoke_user_tokens, token_revocations, set_user_role, ACCESS_TOKEN_EXPIRE_MINUTES,
+    SessionLocal, VersionConflictError, OrderUnavailableError, OrderContentionError, OrderMovePausedError
+)
+from analytics import revenue_series, top_products
+from forecasting import InventoryForecaster
+from image_pipeline import ImageVariants
+from snapshots import CatalogSnapshotPublisher
+from catalog_sync import CatalogSync
+from search import search_index
+from recommendations import similarity_index
+from events import OrderEventBroadcaster, format_sse
+from contact_pipeline import ContactPipeline
+from payments import PaymentEventWorker, SignatureError, verify_signature, SIGNATURE_HEADER
+from caching import StaleWhileRevalidateCache, TTLCache
+from admission import AdmissionControlMiddleware, ConcurrencyLimiter, RouteClass
+from loop_monitor import LoopMonitor, LoopMonitorMiddleware
+from profiling import ProfilerMiddleware, RequestProfiler, install_sql_timing, run_in_threadpool
+from rate_limit import (
+    RateLimiter, RateLimitRule, RateLimitedRoute, RateLimitMiddleware,
+    InMemoryBucketStore, RedisBucketStore
 )
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# How often each worker moves old finished orders to the archive tables
+ORDER_ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ORDER_ARCHIVE_INTERVAL_SECONDS", "3600"))
+
+# Shared secret of the payment provider's webhook signatures; webhooks are refused without it
+PAYMENT_WEBHOOK_SECRET = os.getenv("PAYMENT_WEBHOOK_SECRET")
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Sensation by Sanu API",
@@ -42,6 +79,110 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+# Profiling: admins add an X-Profile header or ?profile=1 to capture a cProfile
+# and SQL timings for one request. Innermost, so only the handler is measured.
+profiler = RequestProfiler(
+    max_profiles=int(os.getenv("PROFILE_MAX_PROFILES", "50")),
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "1.0"))
+)
+install_sql_timing()
+
+
+def can_profile(scope: dict) -> bool:
+    """True when a request's bearer token belongs to an admin"""
+    authorization = dict(scope["headers"]).get(b"authorization", b"").decode("latin-1")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    payload = verify_token(token)
+    return bool(payload) and is_admin(payload)
+
+
+app.add_middleware(ProfilerMiddleware, profiler=profiler, authorize=can_profile)
+
+# Event loop lag, exported at /metrics. With LOOP_MONITOR_DEBUG set, a watchdog
+# also logs the stack and route of anything blocking the loop past the threshold.
+loop_monitor = LoopMonitor(
+    block_threshold=float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100")) / 1000,
+    debug=os.getenv("LOOP_MONITOR_DEBUG", "").lower() in ("1", "true", "yes")
+)
+app.add_middleware(LoopMonitorMiddleware, monitor=loop_monitor)
+
+# Admission control: each route class gets its own concurrency pool, so a burst
+# of logins (bcrypt) or dashboard queries is shed with 503 before it can
+# exhaust the DB pool and starve catalog reads. Added before CORS so that
+# shed responses still carry CORS headers. First matching class wins.
+app.add_middleware(
+    AdmissionControlMiddleware,
+    route_classes=[
+        RouteClass("streams", None, r"^/orders/[^/]+/events$"),
+        RouteClass(
+            "auth",
+            ConcurrencyLimiter.from_env("auth", max_concurrent=4, max_queue=16, queue_timeout=2.0),
+            r"^/auth/(login|register|change-password)$",
+            methods={"POST"}
+        ),
+        RouteClass(
+            "admin",
+            ConcurrencyLimiter.from_env("admin", max_concurrent=3, max_queue=12, queue_timeout=5.0),
+            r"^/admin/"
+        ),
+        RouteClass(
+            "webhooks",
+            ConcurrencyLimiter.from_env("webhooks", max_concurrent=8, max_queue=64, queue_timeout=2.0),
+            r"^/payments/webhook$",
+            methods={"POST"}
+        ),
+        RouteClass(
+            "checkout",
+            ConcurrencyLimiter.from_env("checkout", max_concurrent=6, max_queue=24, queue_timeout=3.0),
+            r"^/(orders|contact)$",
+            methods={"POST"}
+        ),
+        RouteClass(
+            "reads",
+            ConcurrencyLimiter.from_env("reads", max_concurrent=64, max_queue=256, queue_timeout=1.0),
+            r"^/(products|track|orders)",
+            methods={"GET"}
+        ),
+    ]
+)
+
+# Rate limiting: token buckets per IP here, per email/user in the handlers below.
+# Buckets live in Redis when configured so limits hold across workers. Client
+# IPs come from X-Forwarded-For, trusted only from FORWARDED_ALLOW_IPS (the
+# nginx container in docker-compose); otherwise every request shares nginx's IP.
+LOGIN_IP_LIMIT = RateLimitRule("login-ip", capacity=20, per_seconds=60)
+# Keyed by email and IP, so failed attempts from elsewhere can't lock a user out
+LOGIN_EMAIL_LIMIT = RateLimitRule("login-email-ip", capacity=5, per_seconds=300)
+REGISTER_IP_LIMIT = RateLimitRule("register-ip", capacity=5, per_seconds=3600)
+ORDER_IP_LIMIT = RateLimitRule("order-ip", capacity=20, per_seconds=60)
+ORDER_USER_LIMIT = RateLimitRule("order-user", capacity=10, per_seconds=60)
+
+rate_limiter = RateLimiter(
+    RedisBucketStore(os.environ["REDIS_URL"]) if os.getenv("REDIS_URL") else InMemoryBucketStore()
+)
+app.add_middleware(
+    RateLimitMiddleware,
+    limiter=rate_limiter,
+    routes=[
+        RateLimitedRoute(LOGIN_IP_LIMIT, r"^/auth/login$", methods={"POST"}),
+        RateLimitedRoute(REGISTER_IP_LIMIT, r"^/auth/register$", methods={"POST"}),
+        RateLimitedRoute(ORDER_IP_LIMIT, r"^/orders$", methods={"POST"}),
+    ]
+)
+
+
+async def enforce_rate_limit(rule: RateLimitRule, identity: str) -> None:
+    """Raise 429 when `identity` has exhausted its bucket for `rule`"""
+    allowed, retry_after = await rate_limiter.hit(rule, identity)
+    if not allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, please slow down",
+            headers={"Retry-After": str(max(1, round(retry_after)))}
+        )
+
 # CORS middleware
 cors_origins = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://localhost:5173").split(",")
 app.add_middleware(
@@ -54,38 +195,409 @@ app.add_middleware(
 
 # Security
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+# Order status events, fanned out across workers through Redis when available
+order_events = OrderEventBroadcaster(os.getenv("REDIS_URL"))
+
+# Contact submissions are queued and written in batches; duplicates and spam are dropped
+contact_pipeline = ContactPipeline(
+    create_contacts,
+    max_queue=int(os.getenv("CONTACT_QUEUE_SIZE", "10000")),
+    spam_threshold=float(os.getenv("CONTACT_SPAM_THRESHOLD", "0.8"))
+)
+ORDER_EVENTS_HEARTBEAT_SECONDS = 15
+# EventSource can't send an Authorization header, so a stream may instead be
+# opened with a short-lived token for that one order in its URL
+ORDER_EVENTS_TOKEN_SCOPE = "order-events"
+ORDER_EVENTS_TOKEN_SECONDS = 60
+FINAL_ORDER_STATUSES = {OrderStatus.DELIVERED.value, OrderStatus.CANCELLED.value}
+
+# Public tracking lookups, including unknown numbers, are served from memory.
+# Misses read the primary: a lagging replica would put the pre-update view
+# back in the cache right after an update deletes it.
+TRACKING_CACHE_SECONDS = int(os.getenv("TRACKING_CACHE_SECONDS", "30"))
+tracking_cache = TTLCache(max_entries=10000, ttl=TRACKING_CACHE_SECONDS, negative_ttl=10)
+
+# Dashboard reads polled by every open admin tab share one computation per worker.
+# Writes mark them stale; the next poll gets the old value while one refresh runs.
+ADMIN_CACHE_SECONDS = float(os.getenv("ADMIN_CACHE_SECONDS", "5"))
+ADMIN_CACHE_STALE_SECONDS = float(os.getenv("ADMIN_CACHE_STALE_SECONDS", "60"))
+dashboard_cache = StaleWhileRevalidateCache(ttl=ADMIN_CACHE_SECONDS, stale_ttl=ADMIN_CACHE_STALE_SECONDS)
+
+# Longest date range the analytics endpoints accept
+ANALYTICS_MAX_DAYS = 3 * 366
+
+# Sales velocity per product; products expected to sell out within
+# STOCKOUT_ALERT_DAYS count as low stock
+inventory_forecaster = InventoryForecaster(alert_days=float(os.getenv("STOCKOUT_ALERT_DAYS", "14")))
+
+# Responsive image variants rendered by image_pipeline.py; the manifest is
+# read at startup and re-checked by the periodic catalog reload
+image_variants = ImageVariants()
+
+# Catalogs larger than this are searched with Postgres full-text instead of in memory
+SEARCH_INDEX_MAX_PRODUCTS = int(os.getenv("SEARCH_INDEX_MAX_PRODUCTS", "5000"))
+
+
+def user_to_model(u) -> User:
+    """Convert a user row to its API model"""
+    return User(
+        id=str(u.id),
+        email=u.email,
+        name=u.name,
+        phone=u.phone,
+        is_active=u.is_active,
+        role=u.role,
+        created_at=u.created_at,
+        updated_at=u.updated_at
+    )
+
+
+def product_to_model(p) -> Product:
+    """Convert a product row to its API model"""
+    return Product(
+        id=str(p.id),
+        name=p.name,
+        price=p.price,
+        image=p.image,
+        description=p.description,
+        tagline=p.tagline,
+        fragrance_pyramid=p.fragrance_pyramid,
+        in_stock=p.in_stock,
+        quantity=p.quantity,
+        category=p.category,
+        version=p.version,
+        srcset=image_variants.srcset(p.image),
+        created_at=p.created_at,
+        updated_at=p.updated_at
+    )
+
+
+def order_to_model(o) -> Order:
+    """Convert an order row to its API model"""
+    return Order(
+        id=str(o.id),
+        user_id=str(o.user_id),
+        items=[CartItem(product_id=str(i.product_id), quantity=i.quantity) for i in o.items],
+        total=o.total,
+        status=o.status,
+        shipping_address=o.shipping_address,
+        payment_method=o.payment_method,
+        created_at=o.created_at,
+        updated_at=o.updated_at,
+        tracking_number=o.tracking_number,
+        version=o.version
+    )
+
+
+def load_catalog_index() -> None:
+    """Build the in-memory search and similarity indexes from the database"""
+    db = SessionLocal()
+    try:
+        products = [product_to_model(p) for p in get_products(db, limit=None)]
+    finally:
+        db.close()
+    
+    similarity_index.build(products)
+    if len(products) > SEARCH_INDEX_MAX_PRODUCTS:
+        # Too large to keep in memory, search falls back to Postgres
+        search_index.disable()
+    else:
+        search_index.build(products)
+
+
+def refresh_catalog_entry(product) -> None:
+    """Update one product in in-memory catalog structures"""
+    model = product_to_model(product)
+    search_index.upsert(model)
+    similarity_index.upsert(model)
+    dashboard_cache.expire()
+
+
+def on_product_changed(product) -> None:
+    """Propagate a product write to in-memory catalog structures and snapshots"""
+    refresh_catalog_entry(product)
+    catalog_sync.notify([str(product.id)])
+    catalog_snapshots.schedule([str(product.id)])
+
+
+def on_products_changed(db, product_ids: List[str]) -> None:
+    """Reload products changed by a bulk operation into in-memory catalog structures and snapshots"""
+    for product in get_products_by_ids(db, product_ids):
+        refresh_catalog_entry(product)
+    catalog_sync.notify(product_ids)
+    catalog_snapshots.schedule([str(product_id) for product_id in product_ids])
+
+
+def on_product_deleted(product_id: str) -> None:
+    """Drop a deleted product from in-memory catalog structures and snapshots"""
+    search_index.remove(product_id)
+    similarity_index.remove(product_id)
+    dashboard_cache.expire()
+    catalog_sync.notify([product_id])
+    catalog_snapshots.schedule([product_id])
+
+
+def apply_catalog_changes(product_ids: List[str], products: List[Product]) -> None:
+    """Bring products another worker changed or deleted into this worker's catalog"""
+    found = set()
+    for product in products:
+        found.add(product.id)
+        search_index.upsert(product)
+        similarity_index.upsert(product)
+    for product_id in set(product_ids) - found:
+        search_index.remove(product_id)
+        similarity_index.remove(product_id)
+    dashboard_cache.expire()
+
+
+def load_snapshot_products(product_ids: List[str]) -> List[Product]:
+    """Products to publish, read fresh from the primary"""
+    db = SessionLocal()
+    try:
+        return [product_to_model(p) for p in get_products_by_ids(db, product_ids)]
+    finally:
+        db.close()
+
+
+def load_snapshot_listing() -> List[Product]:
+    """The product list GET /products returns without parameters"""
+    db = SessionLocal()
+    try:
+        return [product_to_model(p) for p in get_products(db)]
+    finally:
+        db.close()
+
+
+def load_all_snapshot_products() -> List[Product]:
+    """Every product, for rewriting all per-product snapshots"""
+    db = SessionLocal()
+    try:
+        return [product_to_model(p) for p in get_products(db, limit=None)]
+    finally:
+        db.close()
+
+
+# Static product JSON for nginx to serve directly, when CATALOG_SNAPSHOT_DIR is set
+catalog_snapshots = CatalogSnapshotPublisher(
+    os.getenv("CATALOG_SNAPSHOT_DIR"),
+    load_products=load_snapshot_products,
+    load_listing=load_snapshot_listing,
+    load_all=load_all_snapshot_products,
+    low_stock_threshold=int(os.getenv("SNAPSHOT_LOW_STOCK_THRESHOLD", "5"))
+)
+
+def reload_catalog() -> None:
+    """Periodic rebuild; snapshots are republished too when image variants changed"""
+    images_changed = image_variants.reload_if_changed()
+    load_catalog_index()
+    if images_changed:
+        catalog_snapshots.publish_all()
+
+
+# GET /products and search are served from each worker's memory: product writes
+# reach other workers through Redis, and every worker rebuilds periodically
+catalog_sync = CatalogSync(
+    load=load_snapshot_products,
+    apply=apply_catalog_changes,
+    reload=reload_catalog,
+    redis_url=os.getenv("REDIS_URL"),
+    reload_interval=float(os.getenv("CATALOG_RELOAD_SECONDS", "60"))
+)
+
+
+def response_cache_key(request: Request, auth_scope: str) -> Tuple:
+    """Cache key from the route, its sorted query parameters and who may see it"""
+    return (request.scope["route"].path, tuple(sorted(request.query_params.multi_items())), auth_scope)
+
+
+def load_admin_orders(skip: int, limit: int) -> List[Order]:
+    """Load a page of all orders for the dashboard"""
+    db = read_session()
+    try:
+        return [order_to_model(o) for o in get_all_orders(db, skip=skip, limit=limit)]
+    finally:
+        db.close()
+
+
+def load_revenue_series(start: date, end: date, interval: AnalyticsInterval) -> RevenueSeries:
+    """Build a revenue series from the daily sales aggregates"""
+    db = read_session()
+    try:
+        return revenue_series(get_daily_sales(db, start, end), start, end, interval)
+    finally:
+        db.close()
+
+
+def load_product_sales(start: date, end: date, limit: int) -> ProductSalesReport:
+    """Rank products by units and revenue from the daily sales aggregates"""
+    db = read_session()
+    try:
+        return top_products(get_product_sales(db, start, end), start, end, limit)
+    finally:
+        db.close()
+
+
+def analytics_range(start: Optional[date], end: Optional[date]) -> Tuple[date, date]:
+    """Fill in a default last-30-days range and validate it"""
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=29)
+    if start > end or (end - start).days >= ANALYTICS_MAX_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"start must be on or before end, at most {ANALYTICS_MAX_DAYS} days apart"
+        )
+    return start, end
+
+
+def forecast_inventory(db) -> List[InventoryForecast]:
+    """Fold newly completed sales days into the forecaster and project stockouts"""
+    today = datetime.utcnow().date()
+    pending = inventory_forecaster.pending_range(today)
+    if pending:
+        inventory_forecaster.update(get_daily_product_units(db, *pending), *pending)
+    return inventory_forecaster.forecast(get_products(db, limit=None), today)
+
+
+def load_inventory_forecast(at_risk_only: bool, limit: int) -> List[InventoryForecast]:
+    """Stockout forecasts, soonest first"""
+    db = read_session()
+    try:
+        forecasts = forecast_inventory(db)
+    finally:
+        db.close()
+    if at_risk_only:
+        forecasts = [f for f in forecasts if f.at_risk]
+    return forecasts[:limit]
+
+
+def load_admin_stats() -> AdminStats:
+    """Compute dashboard statistics"""
+    db = read_session()
+    try:
+        stats = get_admin_stats(db)
+        stats["recent_orders"] = [order_to_model(o) for o in stats["recent_orders"]]
+        stats["stockout_risk"] = [f for f in forecast_inventory(db) if f.at_risk]
+        stats["low_stock_products"] = len(stats["stockout_risk"])
+        return AdminStats(**stats)
+    finally:
+        db.close()
+
+
+# Set once deferred startup work has finished
+startup_state: Dict[str, Any] = {"ready": False, "error": None}
+
+
+async def archive_orders_periodically() -> None:
+    """Move old finished orders to the archive; workers skip rows another is moving"""
+    while True:
+        try:
+            moved = await run_in_threadpool(archive_old_orders)
+            if moved:
+                logger.info("Archived %d orders", moved)
+        except Exception as e:
+            logger.warning("Order archiving failed: %s", e)
+        await asyncio.sleep(ORDER_ARCHIVE_INTERVAL_SECONDS)
+
+
+def process_payment_batch() -> Dict[str, Any]:
+    """Apply one batch of stored payment events (blocking)"""
+    db = SessionLocal()
+    try:
+        result = process_payment_events(db)
+        # Loaded here, applied to the in-memory catalog back on the event loop
+        result["products"] = [product_to_model(p) for p in get_products_by_ids(db, result["restocked"])]
+        result["events"] = [order_event(order) for order in result["orders"]]
+        return result
+    finally:
+        db.close()
+
+
+async def process_payment_inbox() -> int:
+    """Apply a batch of payment events and announce the orders they changed"""
+    result = await run_in_threadpool(process_payment_batch)
+    if result["restocked"]:
+        apply_catalog_changes(result["restocked"], result["products"])
+        catalog_sync.notify(result["restocked"])
+        catalog_snapshots.schedule(result["restocked"])
+    for event in result["events"]:
+        await order_events.publish(event)
+    if result["events"]:
+        dashboard_cache.expire()
+    return result["claimed"]
+
+
+# Payment webhooks are acknowledged once stored; this applies them to orders
+payment_events = PaymentEventWorker(
+    process_payment_inbox,
+    poll_interval=float(os.getenv("PAYMENT_EVENT_POLL_SECONDS", "5"))
+)
+
+
+async def deferred_startup() -> None:
+    """Cache warm-up and connections, run after the worker starts serving"""
+    try:
+        await run_in_threadpool(image_variants.reload_if_changed)
+        await run_in_threadpool(load_catalog_index)
+        await catalog_sync.start()
+        await run_in_threadpool(catalog_snapshots.publish_all)
+        await order_events.start()
+        startup_state["archiver"] = asyncio.create_task(archive_orders_periodically())
+        startup_state["ready"] = True
+    except Exception as e:
+        startup_state["error"] = str(e)
+        raise
+
 
 # Initialize database
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database on startup"""
-    create_tables()
-    init_sample_data()
+    """Start serving immediately; heavier initialization continues in the background"""
+    # serve.py creates the schema once in the master. Without it the schema
+    # must exist before the first request, so that part stays on the fast path.
+    loop_monitor.start()
+    if not os.getenv("DB_INIT_DONE"):
+        await run_in_threadpool(create_tables)
+        await run_in_threadpool(init_sample_data)
+    # Revoked tokens must be known before the first request is authenticated
+    await token_revocations.start()
+    contact_pipeline.start()
+    payment_events.start()
+    startup_state["task"] = asyncio.create_task(deferred_startup())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release background connections on shutdown"""
+    if startup_state.get("archiver"):
+        startup_state["archiver"].cancel()
+    await order_events.stop()
+    await catalog_sync.stop()
+    await loop_monitor.stop()
+    await token_revocations.stop()
+    await contact_pipeline.stop()
+    await payment_events.stop()
 
 # Authentication dependencies
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get current authenticated user"""
-    token = credentials.credentials
-    payload = verify_token(token)
-    if not payload:
+async def get_token_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
+    """Verified claims of the bearer token"""
+    # Async so FastAPI runs it on the loop: no I/O here, and a threadpool hop costs more than the check
+    payload = verify_token(credentials.credentials)
+    # Scoped tokens, such as order stream tokens, only work where they are checked for
+    if not payload or not payload.get("sub") or payload.get("scope"):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    user_id = payload.get("sub")
-    if not user_id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
-    user = get_user_by_id(db, user_id)
+    return payload
+
+async def get_current_user(
+    claims: Dict[str, Any] = Depends(get_token_claims),
+    db: Session = Depends(get_db)
+) -> User:
+    """Get current authenticated user"""
+    user = get_user_by_id(db, claims["sub"])
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -95,27 +607,107 @@ async def get_current_user(
     
     return user
 
-async def get_admin_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get current admin user"""
-    user = await get_current_user(credentials, db)
-    
-    # Check if user is admin (you can implement role-based access)
-    admin_token = os.getenv("ADMIN_TOKEN", "MyAdminToken123!")
-    if credentials.credentials == admin_token:
-        return user
-    
-    # For now, check if user email is admin
-    if user.email == "admin@sensationbysanu.com":
-        return user
-    
-    raise HTTPException(
-        status_code=status.HTTP_403_FORBIDDEN,
-        detail="Admin access required"
+async def get_admin_claims(claims: Dict[str, Any] = Depends(get_token_claims)) -> Dict[str, Any]:
+    """Authorize an admin request from its token claims, without a database lookup"""
+    if not is_admin(claims):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return claims
+
+def get_user_read_db(current_user: User = Depends(get_current_user)):
+    """Read session for the current user's own data, on the primary right after they write"""
+    db = read_session(str(current_user.id))
+    try:
+        yield db
+    finally:
+        db.close()
+
+def is_admin(claims: Dict[str, Any]) -> bool:
+    """Check whether verified token claims grant admin access"""
+    return claims.get("role") == UserRole.ADMIN.value
+
+def ensure_order_access(order, current_user: User) -> None:
+    """Raise 403 unless the user owns the order or is admin"""
+    if str(order.user_id) != str(current_user.id) and current_user.role != UserRole.ADMIN.value:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+def issue_token(user) -> Token:
+    """Access token for a user, with their role as a signed claim"""
+    access_token = create_access_token(
+        data={"sub": str(user.id), "role": user.role},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        user=user_to_model(user)
+    )
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Parse the row version from an If-Match header (\"3\", W/\"3\" or *)"""
+    if not if_match or if_match.strip() == "*":
+        return None
+    tag = if_match.split(",")[0].strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="If-Match must be a version ETag"
+        )
+
+
+def version_conflict(resource: str) -> HTTPException:
+    """409 raised when an update lost a race with another writer"""
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=f"{resource} was modified by another request, reload and retry"
+    )
+
+
+def archive_paused() -> HTTPException:
+    """503 raised when an archived order can't be moved back during a backup"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Archived orders can't be changed while a backup is running, retry shortly",
+        headers={"Retry-After": "60"}
     )
 
+
+def order_event(order) -> Dict[str, Any]:
+    """Build the status event published for an order"""
+    return {
+        "order_id": str(order.id),
+        "status": order.status,
+        "tracking_number": order.tracking_number,
+        "updated_at": order.updated_at.isoformat(),
+    }
+
+
+def load_order_history_events(order_id: str) -> List[Dict[str, Any]]:
+    """Load an order's status history as events"""
+    db = SessionLocal()
+    try:
+        return [
+            {
+                "order_id": str(h.order_id),
+                "status": h.status,
+                "tracking_number": h.tracking_number,
+                "updated_at": h.created_at.isoformat(),
+            }
+            for h in get_order_status_history(db, order_id)
+        ]
+    finally:
+        db.close()
+
 # Routes
 @app.get("/", response_model=APIResponse)
 async def root() -> APIResponse:
@@ -130,9 +722,20 @@ async def health_check() -> APIResponse:
     """Health check endpoint"""
     return APIResponse(
         message="API is healthy",
-        data={"timestamp": datetime.utcnow(), "status": "healthy"}
+        data={
+            "timestamp": datetime.utcnow(),
+            "status": "healthy",
+            "ready": startup_state["ready"],
+            "startup_error": startup_state["error"],
+            "loop_lag_ms": round(loop_monitor.last_lag * 1000, 1)
+        }
     )
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> str:
+    """Event loop metrics for this worker in Prometheus format"""
+    return loop_monitor.prometheus()
+
 # Authentication routes
 @app.post("/auth/register", response_model=Token)
 async def register(user_data: UserCreate, db: Session = Depends(get_db)) -> Token:
@@ -148,30 +751,14 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)) -> Toke
     # Create user
     db_user = create_user(db, user_data)
     
-    # Create access token
-    access_token_expires = timedelta(minutes=30)
-    access_token = create_access_token(
-        data={"sub": str(db_user.id)}, expires_delta=access_token_expires
-    )
-    
-    return Token(
-        access_token=access_token,
-        token_type="bearer",
-        expires_in=1800,  # 30 minutes
-        user=User(
-            id=str(db_user.id),
-            email=db_user.email,
-            name=db_user.name,
-            phone=db_user.phone,
-            is_active=db_user.is_active,
-            created_at=db_user.created_at,
-            updated_at=db_user.updated_at
-        )
-    )
+    return issue_token(db_user)
 
 @app.post("/auth/login", response_model=Token)
-async def login(user_data: UserLogin, db: Session = Depends(get_db)) -> Token:
+async def login(user_data: UserLogin, request: Request, db: Session = Depends(get_db)) -> Token:
     """Login user"""
+    # Checked before bcrypt runs, so credential stuffing can't burn CPU
+    client_ip = request.client.host if request.client else "unknown"
+    await enforce_rate_limit(LOGIN_EMAIL_LIMIT, f"{user_data.email.lower()}|{client_ip}")
     user = authenticate_user(db, user_data.email, user_data.password)
     if not user:
         raise HTTPException(
@@ -186,31 +773,12 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)) -> Token:
             detail="Inactive user"
         )
     
-    # Create access token
-    access_token_expires = timedelta(minutes=30)
-    access_token = create_access_token(
-        data={"sub": str(user.id)}, expires_delta=access_token_expires
-    )
-    
-    return Token(
-        access_token=access_token,
-        token_type="bearer",
-        expires_in=1800,  # 30 minutes
-        user=User(
-            id=str(user.id),
-            email=user.email,
-            name=user.name,
-            phone=user.phone,
-            is_active=user.is_active,
-            created_at=user.created_at,
-            updated_at=user.updated_at
-        )
-    )
+    return issue_token(user)
 
 @app.get("/auth/me", response_model=User)
 async def get_current_user_info(current_user: User = Depends(get_current_user)) -> User:
     """Get current user information"""
-    return current_user
+    return user_to_model(current_user)
 
 @app.put("/auth/profile", response_model=User)
 async def update_profile(
@@ -235,15 +803,7 @@ async def update_profile(
     db.commit()
     db.refresh(db_user)
     
-    return User(
-        id=str(db_user.id),
-        email=db_user.email,
-        name=db_user.name,
-        phone=db_user.phone,
-        is_active=db_user.is_active,
-        created_at=db_user.created_at,
-        updated_at=db_user.updated_at
-    )
+    return user_to_model(db_user)
 
 @app.post("/auth/change-password", response_model=APIResponse)
 async def change_password(
@@ -266,44 +826,64 @@ async def change_password(
             detail="Current password is incorrect"
         )
     
-    # Update password
+    # Update password and sign out every session, including this one
     db_user.hashed_password = get_password_hash(password_data.new_password)
     db_user.updated_at = datetime.utcnow()
-    db.commit()
+    await token_revocations.publish(str(db_user.id), revoke_user_tokens(db, db_user))
     
     return APIResponse(
-        message="Password changed successfully",
+        message="Password changed successfully, please log in again",
         data={"updated_at": db_user.updated_at}
     )
 
+@app.post("/auth/logout", response_model=APIResponse)
+async def logout(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+) -> APIResponse:
+    """Revoke every access token issued to the current user"""
+    db_user = get_user_by_id(db, current_user.id)
+    if not db_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    
+    await token_revocations.publish(str(db_user.id), revoke_user_tokens(db, db_user))
+    
+    return APIResponse(message="Logged out")
+
 # Product routes
 @app.get("/products", response_model=List[Product])
 async def get_products_endpoint(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ) -> List[Product]:
     """Get all products"""
+    if startup_state["ready"] and search_index.enabled:
+        # Served from the warmed in-memory catalog
+        return search_index.documents()[skip:skip + limit]
     products = get_products(db, skip=skip, limit=limit)
-    return [
-        Product(
-            id=str(p.id),
-            name=p.name,
-            price=p.price,
-            image=p.image,
-            description=p.description,
-            tagline=p.tagline,
-            fragrance_pyramid=p.fragrance_pyramid,
-            in_stock=p.in_stock,
-            quantity=p.quantity,
-            category=p.category,
-            created_at=p.created_at,
-            updated_at=p.updated_at
-        ) for p in products
-    ]
+    return [product_to_model(p) for p in products]
+
+@app.get("/products/search", response_model=List[Product])
+async def search_products_endpoint(
+    q: str = Query(..., min_length=1, max_length=100),
+    category: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_read_db)
+) -> List[Product]:
+    """Search products by name, description, tagline and fragrance notes"""
+    if search_index.enabled:
+        results = search_index.search(q, category=category, limit=limit)
+        return [product for product, _score in results]
+    
+    products = search_products_fulltext(db, q, category=category, limit=limit)
+    return [product_to_model(p) for p in products]
 
 @app.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: str, db: Session = Depends(get_db)) -> Product:
+async def get_product(product_id: str, db: Session = Depends(get_read_db)) -> Product:
     """Get a specific product by ID"""
     product = get_product_by_id(db, product_id)
     if not product:
@@ -312,20 +892,22 @@ async def get_product(product_id: str, db: Session = Depends(get_db)) -> Product
             detail="Product not found"
         )
     
-    return Product(
-        id=str(product.id),
-        name=product.name,
-        price=product.price,
-        image=product.image,
-        description=product.description,
-        tagline=product.tagline,
-        fragrance_pyramid=product.fragrance_pyramid,
-        in_stock=product.in_stock,
-        quantity=product.quantity,
-        category=product.category,
-        created_at=product.created_at,
-        updated_at=product.updated_at
-    )
+    return product_to_model(product)
+
+@app.get("/products/{product_id}/similar", response_model=List[Product])
+async def get_similar_products(
+    product_id: str,
+    limit: int = Query(4, ge=1, le=similarity_index.top_k),
+    db: Session = Depends(get_read_db)
+) -> List[Product]:
+    """Get products with the most similar fragrance pyramids"""
+    neighbour_ids = [pid for pid, _score in similarity_index.similar(product_id, limit)]
+    products = [search_index.get_document(pid) for pid in neighbour_ids]
+    if None in products:
+        # Search index disabled for large catalogs, load the rows instead
+        by_id = {str(p.id): p for p in get_products_by_ids(db, neighbour_ids)}
+        return [product_to_model(by_id[pid]) for pid in neighbour_ids if pid in by_id]
+    return products
 
 # Order routes
 @app.post("/orders", response_model=APIResponse)
@@ -335,8 +917,12 @@ async def create_order_endpoint(
     db: Session = Depends(get_db)
 ) -> APIResponse:
     """Create a new order"""
+    await enforce_rate_limit(ORDER_USER_LIMIT, str(current_user.id))
     try:
         order = create_order(db, current_user.id, order_data)
+        replica_router.mark_write(current_user.id)
+        # Keep stock levels in the in-memory catalog current
+        on_products_changed(db, [item.product_id for item in order_data.items])
         
         return APIResponse(
             message="Order created successfully",
@@ -347,6 +933,21 @@ async def create_order_endpoint(
                 "created_at": order.created_at
             }
         )
+    except OrderUnavailableError as e:
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content=jsonable_encoder(ErrorResponse(
+                error="Some items are unavailable, nothing was ordered",
+                details={"status_code": status.HTTP_409_CONFLICT, "unavailable": e.items}
+            ))
+        )
+    except OrderContentionError:
+        # Nothing was reserved, so the client can safely send the same order again
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The order conflicted with another one, please retry",
+            headers={"Retry-After": "1"}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -355,133 +956,244 @@ async def create_order_endpoint(
 
 @app.get("/orders", response_model=List[Order])
 async def get_user_orders(
+    since: Optional[date] = Query(None, description="Only orders placed on or after this date"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_user_read_db)
 ) -> List[Order]:
     """Get user's orders"""
-    orders = get_orders_by_user(db, current_user.id)
-    return [
-        Order(
-            id=str(o.id),
-            user_id=str(o.user_id),
-            items=[],  # You can populate this with order items
-            total=o.total,
-            status=o.status,
-            shipping_address=o.shipping_address,
-            payment_method=o.payment_method,
-            created_at=o.created_at,
-            updated_at=o.updated_at,
-            tracking_number=o.tracking_number
-        ) for o in orders
-    ]
+    orders = get_orders_by_user(db, current_user.id, since=datetime.combine(since, datetime.min.time()) if since else None)
+    return [order_to_model(o) for o in orders]
 
 @app.get("/orders/{order_id}", response_model=Order)
 async def get_order(
     order_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_user_read_db),
+    primary_db: Session = Depends(get_db)
 ) -> Order:
     """Get order by ID"""
     order = get_order_by_id(db, order_id)
+    if not order and db.get_bind() is not primary_db.get_bind():
+        # The replica may not have the order yet, e.g. one placed from another device
+        order = get_order_by_id(primary_db, order_id)
     if not order:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Order not found"
         )
     
-    # Check if user owns this order or is admin
-    if str(order.user_id) != current_user.id:
-        # Check if user is admin
-        admin_token = os.getenv("ADMIN_TOKEN", "MyAdminToken123!")
-        # This is a simplified check - implement proper admin role checking
-        if current_user.email != "admin@sensationbysanu.com":
+    ensure_order_access(order, current_user)
+    
+    return order_to_model(order)
+
+@app.post("/orders/{order_id}/events/token", response_model=APIResponse)
+async def create_order_events_token(
+    order_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+) -> APIResponse:
+    """Issue a short-lived token for opening an order's event stream with EventSource"""
+    order = get_order_by_id(db, order_id)
+    if not order:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Order not found"
+        )
+    ensure_order_access(order, current_user)
+    token = create_access_token(
+        data={"sub": str(current_user.id), "scope": ORDER_EVENTS_TOKEN_SCOPE, "order_id": str(order.id)},
+        expires_delta=timedelta(seconds=ORDER_EVENTS_TOKEN_SECONDS)
+    )
+    return APIResponse(
+        message="Stream token created",
+        data={
+            "token": token,
+            "expires_in": ORDER_EVENTS_TOKEN_SECONDS,
+            "url": f"/orders/{order.id}/events?token={token}"
+        }
+    )
+
+@app.get("/orders/{order_id}/events")
+async def order_events_endpoint(
+    order_id: str,
+    request: Request,
+    token: Optional[str] = Query(None, description="Stream token from POST /orders/{order_id}/events/token"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: Session = Depends(get_db)
+) -> StreamingResponse:
+    """Stream order status and tracking changes as Server-Sent Events
+    
+    Authenticated with a bearer token, or with `?token=` for EventSource; the
+    stream token is checked when connecting, so get a new one to reconnect.
+    """
+    if token is not None:
+        claims = verify_token(token)
+        if not claims or claims.get("scope") != ORDER_EVENTS_TOKEN_SCOPE:
             raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired stream token"
             )
+    elif credentials is not None:
+        claims = await get_token_claims(credentials)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    current_user = await get_current_user(claims, db)
+    order = get_order_by_id(db, order_id)
+    if not order:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Order not found"
+        )
+    if token is not None and claims.get("order_id") != str(order.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Stream token is for another order"
+        )
+    ensure_order_access(order, current_user)
+    order_id = str(order.id)
+    # Don't hold a pooled connection for the lifetime of the stream
+    db.close()
     
-    return Order(
-        id=str(order.id),
-        user_id=str(order.user_id),
-        items=[],  # You can populate this with order items
-        total=order.total,
-        status=order.status,
-        shipping_address=order.shipping_address,
-        payment_method=order.payment_method,
-        created_at=order.created_at,
-        updated_at=order.updated_at,
-        tracking_number=order.tracking_number
+    async def stream():
+        async with order_events.subscribe(order_id) as queue:
+            # Subscribed before loading history, so no change can slip between
+            history = await run_in_threadpool(load_order_history_events, order_id)
+            last_seen = ""
+            for event in history:
+                last_seen = event["updated_at"]
+                yield format_sse(event)
+            if history and history[-1]["status"] in FINAL_ORDER_STATUSES:
+                return
+            
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), ORDER_EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event["updated_at"] <= last_seen:
+                    continue
+                last_seen = event["updated_at"]
+                yield format_sse(event)
+                if event["status"] in FINAL_ORDER_STATUSES:
+                    return
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
-# Contact form
-@app.post("/contact", response_model=APIResponse)
-async def submit_contact_form(
-    contact: ContactForm,
+# Public tracking
+@app.get("/track/{tracking_number}", response_model=TrackingStatus)
+async def track_shipment(
+    tracking_number: str,
+    response: Response,
     db: Session = Depends(get_db)
-) -> APIResponse:
-    """Submit contact form"""
+) -> TrackingStatus:
+    """Look up shipment status by tracking number (no login required)"""
+    tracking_number = tracking_number.strip()
+    found, tracking = tracking_cache.lookup(tracking_number)
+    if not found:
+        order = get_order_by_tracking_number(db, tracking_number)
+        tracking = None
+        if order:
+            tracking = TrackingStatus(
+                tracking_number=order.tracking_number,
+                status=order.status,
+                updated_at=order.updated_at,
+                history=[
+                    TrackingEvent(status=h.status, at=h.created_at)
+                    for h in get_order_status_history(db, str(order.id))
+                ]
+            )
+        tracking_cache.set(tracking_number, tracking)
+    
+    if tracking is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Tracking number not found"
+        )
+    response.headers["Cache-Control"] = f"public, max-age={TRACKING_CACHE_SECONDS}"
+    return tracking
+
+# Contact form
+@app.post("/contact", response_model=APIResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_contact_form(contact: ContactForm) -> APIResponse:
+    """Submit contact form; it is stored shortly after, in a batch"""
+    # Duplicates get the same answer, so resubmitting reveals nothing
+    if contact_pipeline.submit(contact) == "rejected":
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many submissions right now, please try again shortly",
+            headers={"Retry-After": "5"}
+        )
+    
+    return APIResponse(
+        message="Contact form submitted successfully",
+        data={"submitted_at": datetime.utcnow()}
+    )
+
+# Payments
+@app.post("/payments/webhook")
+async def payment_webhook(request: Request, db: Session = Depends(get_db)) -> Dict[str, Any]:
+    """Store a signed payment provider event and acknowledge it; it is applied in the background"""
+    if not PAYMENT_WEBHOOK_SECRET:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Payment webhooks are not configured"
+        )
+    payload = await request.body()
     try:
-        create_contact(db, contact)
-        
-        return APIResponse(
-            message="Contact form submitted successfully",
-            data={"submitted_at": datetime.utcnow()}
+        verify_signature(payload, request.headers.get(SIGNATURE_HEADER), PAYMENT_WEBHOOK_SECRET)
+    except SignatureError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
-    except Exception as e:
+    try:
+        event = json.loads(payload)
+        valid = isinstance(event.get("id"), str) and isinstance(event.get("type"), str)
+    except (ValueError, AttributeError):
+        valid = False
+    if not valid:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to submit contact form: {str(e)}"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Malformed event"
         )
+    
+    # Redeliveries of an event are acknowledged again but stored once
+    stored = await run_in_threadpool(record_payment_event, db, event)
+    if stored:
+        payment_events.wake()
+    return {"received": True, "duplicate": not stored}
 
 # Admin routes
 @app.get("/admin/products", response_model=List[Product])
 async def get_admin_products(
-    admin_user: User = Depends(get_admin_user),
-    db: Session = Depends(get_db)
+    admin_claims: Dict[str, Any] = Depends(get_admin_claims),
+    db: Session = Depends(get_read_db)
 ) -> List[Product]:
     """Get all products (admin)"""
     products = get_products(db)
-    return [
-        Product(
-            id=str(p.id),
-            name=p.name,
-            price=p.price,
-            image=p.image,
-            description=p.description,
-            tagline=p.tagline,
-            fragrance_pyramid=p.fragrance_pyramid,
-            in_stock=p.in_stock,
-            quantity=p.quantity,
-            category=p.category,
-            created_at=p.created_at,
-            updated_at=p.updated_at
-        ) for p in products
-    ]
+    return [product_to_model(p) for p in products]
 
 @app.post("/admin/products", response_model=Product)
 async def create_product_admin(
     product_data: ProductCreate,
-    admin_user: User = Depends(get_admin_user),
+    admin_claims: Dict[str, Any] = Depends(get_admin_claims),
     db: Session = Depends(get_db)
 ) -> Product:
     """Create a new product (admin)"""
     try:
         product = create_product(db, product_data)
+        on_product_changed(product)
         
-        return Product(
-            id=str(product.id),
-            name=product.name,
-            price=product.price,
-            image=product.image,
-            description=product.description,
-            tagline=product.tagline,
-            fragrance_pyramid=product.fragrance_pyramid,
-            in_stock=product.in_stock,
-            quantity=product.quantity,
-            category=product.category,
-            created_at=product.created_at,
-            updated_at=product.updated_at
-        )
+        return product_to_model(product)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -492,34 +1204,28 @@ async def create_product_admin(
 async def update_product_admin(
     product_id: str,
     product_data: ProductUpdate,
-    admin_user: User = Depends(get_admin_user),
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    admin_claims: Dict[str, Any] = Depends(get_admin_claims),
     db: Session = Depends(get_db)
 ) -> Product:
-    """Update product (admin)"""
+    """Update product (admin), conditional on If-Match when given"""
+    expected_version = parse_if_match(if_match)
     try:
-        product = update_product(db, product_id, product_data)
+        product = update_product(db, product_id, product_data, expected_version)
         if not product:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Product not found"
             )
+        on_product_changed(product)
         
-        return Product(
-            id=str(product.id),
-            name=product.name,
-            price=product.price,
-            image=product.image,
-            description=product.description,
-            tagline=product.tagline,
-            fragrance_pyramid=product.fragrance_pyramid,
-            in_stock=product.in_stock,
-            quantity=product.quantity,
-            category=product.category,
-            created_at=product.created_at,
-            updated_at=product.updated_at
-        )
+        response.headers["ETag"] = f'"{product.version}"'
+        return product_to_model(product)
     except HTTPException:
         raise
+    except VersionConflictError:
+        raise version_conflict("Product")
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -529,7 +1235,7 @@ async def update_product_admin(
 @app.delete("/admin/products/{product_id}", response_model=APIResponse)
 async def delete_product_admin(
     product_id: str,
-    admin_user: User = Depends(get_admin_user),
+    admin_claims: Dict[str, Any] = Depends(get_admin_claims),
     db: Session = Depends(get_db)
 ) -> APIResponse:
     """Delete product (admin)"""
@@ -540,6 +1246,7 @@ async def delete_product_admin(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Product not found"
             )
+        on_product_deleted(product_id)
         
         return APIResponse(
             message="Product deleted successfully",
@@ -555,26 +1262,17 @@ async def delete_product_admin(
 
 @app.get("/admin/orders", response_model=List[Order])
 async def get_admin_orders(
-    admin_user: User = Depends(get_admin_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    admin_claims: Dict[str, Any] = Depends(get_admin_claims)
 ) -> List[Order]:
     """Get all orders (admin)"""
     try:
-        orders = get_all_orders(db)
-        return [
-            Order(
-                id=str(o.id),
-                user_id=str(o.user_id),
-                items=[],  # You can populate this with order items
-                total=o.total,
-                status=o.status,
-                shipping_address=o.shipping_address,
-                payment_method=o.payment_method,
-                created_at=o.created_at,
-                updated_at=o.updated_at,
-                tracking_number=o.tracking_number
-            ) for o in orders
-        ]
+        return await dashboard_cache.get(
+            response_cache_key(request, "admin"),
+            lambda: run_in_threadpool(load_admin_orders, skip, limit)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -585,63 +1283,233 @@ async def get_admin_orders(
 async def update_order_admin(
     order_id: str,
     order_update: OrderUpdate,
-    admin_user: User = Depends(get_admin_user),
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    admin_claims: Dict[str, Any] = Depends(get_admin_claims),
     db: Session = Depends(get_db)
 ) -> Order:
-    """Update order (admin)"""
+    """Update order (admin), conditional on If-Match when given"""
+    expected_version = parse_if_match(if_match)
     try:
-        order = update_order(db, order_id, order_update)
+        order = update_order(db, order_id, order_update, expected_version)
         if not order:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Order not found"
             )
+        await order_events.publish(order_event(order))
+        dashboard_cache.expire()
+        if order.tracking_number:
+            # A number that was just assigned may be cached as unknown.
+            # Lookups of a replaced number expire within TRACKING_CACHE_SECONDS.
+            tracking_cache.delete(order.tracking_number)
         
-        return Order(
-            id=str(order.id),
-            user_id=str(order.user_id),
-            items=[],  # You can populate this with order items
-            total=order.total,
-            status=order.status,
-            shipping_address=order.shipping_address,
-            payment_method=order.payment_method,
-            created_at=order.created_at,
-            updated_at=order.updated_at,
-            tracking_number=order.tracking_number
-        )
+        response.headers["ETag"] = f'"{order.version}"'
+        return order_to_model(order)
     except HTTPException:
         raise
+    except VersionConflictError:
+        raise version_conflict("Order")
+    except OrderMovePausedError:
+        raise archive_paused()
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to update order: {str(e)}"
         )
 
+@app.post("/admin/orders/bulk", response_model=APIResponse)
+async def bulk_update_orders_admin(
+    bulk_update: BulkOrderUpdate,
+    admin_claims: Dict[str, Any] = Depends(get_admin_claims),
+    db: Session = Depends(get_db)
+) -> APIResponse:
+    """Update status/tracking of many orders in one transaction (admin)"""
+    try:
+        result = bulk_update_orders(db, bulk_update.items)
+    except OrderMovePausedError:
+        raise archive_paused()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to update orders: {str(e)}"
+        )
+    
+    tracking_cache.clear()
+    dashboard_cache.expire()
+    for order in result["updated"]:
+        await order_events.publish(order_event(order))
+    
+    return APIResponse(
+        message=f"{len(result['updated'])} orders updated",
+        data={
+            "updated": [str(order.id) for order in result["updated"]],
+            "missing": result["missing"]
+        }
+    )
+
+@app.post("/admin/products/restock", response_model=APIResponse)
+async def bulk_restock_admin(
+    restock: BulkRestock,
+    admin_claims: Dict[str, Any] = Depends(get_admin_claims),
+    db: Session = Depends(get_db)
+) -> APIResponse:
+    """Add stock to many products in one transaction (admin)"""
+    try:
+        result = bulk_restock_products(db, restock.items)
+        on_products_changed(db, result["updated"])
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to restock products: {str(e)}"
+        )
+    
+    return APIResponse(
+        message=f"{len(result['updated'])} products restocked",
+        data=result
+    )
+
+@app.post("/admin/products/reprice", response_model=APIResponse)
+async def bulk_reprice_admin(
+    price_change: BulkPriceChange,
+    admin_claims: Dict[str, Any] = Depends(get_admin_claims),
+    db: Session = Depends(get_db)
+) -> APIResponse:
+    """Change prices of every product in a category (admin)"""
+    try:
+        updated = bulk_reprice_category(db, price_change.category, price_change.percent)
+        on_products_changed(db, updated)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to change prices: {str(e)}"
+        )
+    
+    return APIResponse(
+        message=f"{len(updated)} products repriced",
+        data={"updated": updated}
+    )
+
+@app.put("/admin/users/{user_id}/role", response_model=User)
+async def update_user_role_endpoint(
+    user_id: str,
+    role_update: UserRoleUpdate,
+    admin_claims: Dict[str, Any] = Depends(get_admin_claims),
+    db: Session = Depends(get_db)
+) -> User:
+    """Change a user's role; their current tokens are revoked so the new role applies"""
+    db_user = get_user_by_id(db, user_id)
+    if not db_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    await token_revocations.publish(str(db_user.id), set_user_role(db, db_user, role_update.role))
+    return user_to_model(db_user)
+
 @app.get("/admin/stats", response_model=AdminStats)
 async def get_admin_stats_endpoint(
-    admin_user: User = Depends(get_admin_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    admin_claims: Dict[str, Any] = Depends(get_admin_claims)
 ) -> AdminStats:
     """Get admin statistics"""
     try:
-        stats = get_admin_stats(db)
-        return AdminStats(**stats)
+        return await dashboard_cache.get(
+            response_cache_key(request, "admin"),
+            lambda: run_in_threadpool(load_admin_stats)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to fetch admin stats: {str(e)}"
         )
 
+@app.get("/admin/analytics/revenue", response_model=RevenueSeries)
+async def get_revenue_analytics(
+    request: Request,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    interval: AnalyticsInterval = AnalyticsInterval.DAY,
+    admin_claims: Dict[str, Any] = Depends(get_admin_claims)
+) -> RevenueSeries:
+    """Orders, revenue and average order value per day, week or month (admin)"""
+    start, end = analytics_range(start, end)
+    return await dashboard_cache.get(
+        response_cache_key(request, "admin"),
+        lambda: run_in_threadpool(load_revenue_series, start, end, interval)
+    )
+
+@app.get("/admin/analytics/products", response_model=ProductSalesReport)
+async def get_product_analytics(
+    request: Request,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = Query(10, ge=1, le=100),
+    admin_claims: Dict[str, Any] = Depends(get_admin_claims)
+) -> ProductSalesReport:
+    """Top products by units sold and by revenue (admin)"""
+    start, end = analytics_range(start, end)
+    return await dashboard_cache.get(
+        response_cache_key(request, "admin"),
+        lambda: run_in_threadpool(load_product_sales, start, end, limit)
+    )
+
+@app.get("/admin/inventory/forecast", response_model=List[InventoryForecast])
+async def get_inventory_forecast(
+    request: Request,
+    at_risk_only: bool = False,
+    limit: int = Query(100, ge=1, le=1000),
+    admin_claims: Dict[str, Any] = Depends(get_admin_claims)
+) -> List[InventoryForecast]:
+    """Sales velocity and projected stockout date per product (admin)"""
+    return await dashboard_cache.get(
+        response_cache_key(request, "admin"),
+        lambda: run_in_threadpool(load_inventory_forecast, at_risk_only, limit)
+    )
+
+@app.get("/admin/debug/profiles", response_model=APIResponse)
+async def list_profiles(admin_claims: Dict[str, Any] = Depends(get_admin_claims)) -> APIResponse:
+    """List captured request profiles, newest first (admin)"""
+    return APIResponse(
+        message="Request profiles",
+        data={"profiles": profiler.summaries()}
+    )
+
+@app.get("/admin/debug/profiles/{profile_id}", response_model=APIResponse)
+async def get_profile(profile_id: str, admin_claims: Dict[str, Any] = Depends(get_admin_claims)) -> APIResponse:
+    """Get a captured profile with its slowest functions and SQL statements (admin)
+    
+    Functions include the request's run_in_threadpool calls, profiled in their
+    worker threads; sync dependencies FastAPI runs in its threadpool are not.
+    """
+    profile = profiler.get(profile_id)
+    if not profile:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return APIResponse(message="Request profile", data=profile)
+
+@app.get("/admin/debug/loop", response_model=APIResponse)
+async def get_loop_stats(admin_claims: Dict[str, Any] = Depends(get_admin_claims)) -> APIResponse:
+    """Event loop lag and recent blocking calls with their stacks (admin)"""
+    return APIResponse(
+        message="Event loop monitor",
+        data={**loop_monitor.stats(), "blocking_calls": list(reversed(loop_monitor.reports))}
+    )
+
 # Error handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     """Handle HTTP exceptions"""
     return JSONResponse(
         status_code=exc.status_code,
-        content=ErrorResponse(
+        content=jsonable_encoder(ErrorResponse(
             error=exc.detail,
             details={"status_code": exc.status_code}
-        ).dict()
+        )),
+        headers=exc.headers
     )
 
 @app.exception_handler(Exception)
@@ -649,10 +1517,10 @@ async def general_exception_handler(request: Request, exc: Exception):
     """Handle general exceptions"""
     return JSONResponse(
         status_code=500,
-        content=ErrorResponse(
+        content=jsonable_encoder(ErrorResponse(
             error="Internal server error",
             details={"exception": str(exc)}
-        ).dict()
+        ))
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,44 @@
+"""
+Sensation by Sanu - User administration
+
+Roles are only granted here or through PUT /admin/users/{id}/role, never by
+registering with a particular email. The first admin is created this way:
+
+    python manage_users.py set-role admin@sensationbysanu.com admin
+    python manage_users.py set-role someone@example.com customer
+"""
+
+import argparse
+import sys
+from typing import List, Optional
+
+from database_production import SessionLocal, get_user_by_email, set_user_role
+from models import UserRole
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Parse arguments and run a command"""
+    parser = argparse.ArgumentParser(description="Manage shop user accounts")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    set_role = commands.add_parser("set-role", help="Change a user's role and sign them out")
+    set_role.add_argument("email")
+    set_role.add_argument("role", choices=[role.value for role in UserRole])
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        user = get_user_by_email(db, args.email)
+        if user is None:
+            print(f"No user with email {args.email}", file=sys.stderr)
+            return 1
+        # Running workers pick up the revocation on their next refresh
+        set_user_role(db, user, UserRole(args.role))
+        print(f"{user.email} is now {args.role}")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
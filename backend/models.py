@@ -3,7 +3,7 @@ Database models and schemas for Sensation by Sanu API
 """
 
 from typing import Dict, List, Optional, Any
-from datetime import datetime
+from datetime import date, datetime
 from pydantic import BaseModel, EmailStr, Field
 from enum import Enum
 
@@ -17,6 +17,19 @@ class OrderStatus(str, Enum):
     CANCELLED = "cancelled"
 
 
+class UserRole(str, Enum):
+    """User role enumeration"""
+    CUSTOMER = "customer"
+    ADMIN = "admin"
+
+
+class AnalyticsInterval(str, Enum):
+    """Bucket size of an analytics series"""
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+
 class PaymentMethod(str, Enum):
     """Payment method enumeration"""
     CREDIT_CARD = "credit_card"
@@ -42,8 +55,18 @@ class Product(BaseModel):
     tagline: Optional[str] = Field(None, max_length=200)
     fragrance_pyramid: Optional[FragrancePyramid] = None
     in_stock: bool = Field(default=True)
-    quantity: Optional[int] = Field(None, ge=0)
+    quantity: Optional[int] = Field(
+        None, ge=0,
+        description=(
+            "Units in stock. The API returns the exact count; catalog snapshots served by nginx "
+            "give null above SNAPSHOT_LOW_STOCK_THRESHOLD and leave out version and updated_at"
+        )
+    )
     category: Optional[str] = Field(None, max_length=50)
+    version: Optional[int] = Field(None, description="Row version, sent back in If-Match")
+    srcset: Optional[Dict[str, Dict[str, str]]] = Field(
+        None, description="Responsive variants of image: preset (thumb/card/zoom) -> format -> srcset"
+    )
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -75,6 +98,21 @@ class Order(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     tracking_number: Optional[str] = Field(None, max_length=50)
+    version: Optional[int] = Field(None, description="Row version, sent back in If-Match")
+
+
+class TrackingEvent(BaseModel):
+    """Public order status change"""
+    status: OrderStatus
+    at: datetime
+
+
+class TrackingStatus(BaseModel):
+    """Public shipment status looked up by tracking number"""
+    tracking_number: str
+    status: OrderStatus
+    updated_at: datetime
+    history: List[TrackingEvent] = Field(default_factory=list)
 
 
 class ContactForm(BaseModel):
@@ -95,6 +133,7 @@ class User(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = Field(default=True)
+    role: UserRole = Field(default=UserRole.CUSTOMER)
 
 
 class UserCreate(BaseModel):
@@ -125,6 +164,11 @@ class PasswordChange(BaseModel):
     new_password: str = Field(..., min_length=8, max_length=100)
 
 
+class UserRoleUpdate(BaseModel):
+    """User role change model"""
+    role: UserRole
+
+
 class UserUpdate(BaseModel):
     """User update model"""
     name: Optional[str] = Field(None, min_length=2, max_length=100)
@@ -145,6 +189,44 @@ class OrderUpdate(BaseModel):
     tracking_number: Optional[str] = Field(None, max_length=50)
 
 
+class BulkOrderUpdateItem(OrderUpdate):
+    """Single order change within a bulk update"""
+    order_id: str
+
+
+class BulkOrderUpdate(BaseModel):
+    """Bulk order update model"""
+    items: List[BulkOrderUpdateItem] = Field(..., min_items=1, max_items=1000)
+
+
+class BulkRestockItem(BaseModel):
+    """Stock added to one product"""
+    product_id: str
+    quantity: int = Field(..., gt=0)
+
+
+class BulkRestock(BaseModel):
+    """Bulk restock model"""
+    items: List[BulkRestockItem] = Field(..., min_items=1, max_items=1000)
+
+
+class BulkPriceChange(BaseModel):
+    """Percentage price change for every product in a category"""
+    category: str = Field(..., max_length=50)
+    percent: float = Field(..., gt=-100, le=1000, description="e.g. -15 for 15% off")
+
+
+class InventoryForecast(BaseModel):
+    """Projected stockout of one product at its recent sales velocity"""
+    product_id: str
+    name: str
+    quantity: int = Field(..., ge=0)
+    daily_velocity: float = Field(..., ge=0, description="Smoothed units sold per day")
+    days_until_stockout: Optional[float] = Field(None, description="None when the product isn't selling")
+    stockout_date: Optional[date] = None
+    at_risk: bool = Field(default=False, description="Expected to sell out within the alert window")
+
+
 class AdminStats(BaseModel):
     """Admin statistics model"""
     total_orders: int = Field(..., ge=0)
@@ -155,6 +237,42 @@ class AdminStats(BaseModel):
     monthly_revenue: int = Field(..., ge=0)
     low_stock_products: int = Field(..., ge=0)
     recent_orders: List[Order] = Field(default_factory=list)
+    stockout_risk: List[InventoryForecast] = Field(default_factory=list)
+
+
+class RevenuePoint(BaseModel):
+    """Sales in one day, week or month"""
+    period_start: date
+    orders: int = Field(..., ge=0)
+    revenue: int = Field(..., ge=0)
+    average_order_value: int = Field(..., ge=0)
+
+
+class RevenueSeries(BaseModel):
+    """Revenue over a date range, bucketed by interval"""
+    start: date
+    end: date
+    interval: AnalyticsInterval
+    orders: int = Field(..., ge=0)
+    revenue: int = Field(..., ge=0)
+    average_order_value: int = Field(..., ge=0)
+    points: List[RevenuePoint] = Field(default_factory=list)
+
+
+class ProductSales(BaseModel):
+    """Units sold and revenue of one product over a date range"""
+    product_id: str
+    name: Optional[str] = None
+    units: int = Field(..., ge=0)
+    revenue: int = Field(..., ge=0)
+
+
+class ProductSalesReport(BaseModel):
+    """Best selling products over a date range"""
+    start: date
+    end: date
+    by_units: List[ProductSales] = Field(default_factory=list)
+    by_revenue: List[ProductSales] = Field(default_factory=list)
 
 
 class ProductCreate(BaseModel):
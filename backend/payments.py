@@ -0,0 +1,193 @@
+"""
+Payment webhooks for Sensation by Sanu API
+
+Webhook requests are verified with the provider's HMAC scheme (the one
+Stripe uses: `Stripe-Signature: t=<unix time>,v1=<hex HMAC-SHA256 of
+"<t>.<raw body>">`), stored in an inbox table and acknowledged at once.
+A background worker applies them to orders, so provider retries during a
+peak queue up as rows instead of holding request workers.
+
+FakePaymentProvider signs events the same way, for tests and local
+development without a provider account:
+
+    python payments.py <order_id> <amount_in_cents> [--event canceled]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sys
+import time
+import urllib.request
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = "Stripe-Signature"
+SIGNATURE_TOLERANCE_SECONDS = 300
+
+
+class SignatureError(Exception):
+    """Webhook signature missing, malformed, stale or wrong"""
+
+
+def compute_signature(payload: bytes, secret: str, timestamp: int) -> str:
+    signed = str(timestamp).encode() + b"." + payload
+    return hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+
+
+def sign_payload(payload: bytes, secret: str, timestamp: Optional[int] = None) -> str:
+    """Signature header value for a payload"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    return f"t={timestamp},v1={compute_signature(payload, secret, timestamp)}"
+
+
+def verify_signature(
+    payload: bytes,
+    header: Optional[str],
+    secret: str,
+    tolerance: int = SIGNATURE_TOLERANCE_SECONDS,
+    now: Optional[float] = None,
+) -> None:
+    """Raise SignatureError unless `header` signs `payload` and is recent"""
+    if not header:
+        raise SignatureError("Missing signature")
+    timestamp = None
+    signatures = []
+    for part in header.split(","):
+        key, _, value = part.strip().partition("=")
+        if key == "t":
+            timestamp = value
+        elif key == "v1":
+            signatures.append(value)
+    try:
+        timestamp = int(timestamp)
+    except (TypeError, ValueError):
+        raise SignatureError("Malformed signature")
+    if not signatures:
+        raise SignatureError("Malformed signature")
+    # The timestamp is signed too, so a captured request can't be replayed later
+    if abs((time.time() if now is None else now) - timestamp) > tolerance:
+        raise SignatureError("Signature timestamp outside the tolerance")
+    expected = compute_signature(payload, secret, timestamp)
+    # Several v1 signatures are sent while the provider rolls the secret
+    if not any(hmac.compare_digest(expected, signature) for signature in signatures):
+        raise SignatureError("Signature mismatch")
+
+
+class FakePaymentProvider:
+    """Builds and delivers signed webhook events the way the real provider does"""
+
+    def __init__(self, secret: str) -> None:
+        self.secret = secret
+
+    def event(self, event_type: str, order_id: str, amount: int, currency: str = "inr") -> Dict[str, Any]:
+        """A payment intent event for an order"""
+        return {
+            "id": f"evt_{uuid.uuid4().hex}",
+            "object": "event",
+            "type": event_type,
+            "created": int(time.time()),
+            "data": {
+                "object": {
+                    "id": f"pi_{uuid.uuid4().hex[:24]}",
+                    "object": "payment_intent",
+                    "amount": amount,
+                    "amount_received": amount if event_type == "payment_intent.succeeded" else 0,
+                    "currency": currency,
+                    "metadata": {"order_id": str(order_id)},
+                }
+            },
+        }
+
+    def payment_succeeded(self, order_id: str, amount: int) -> Dict[str, Any]:
+        return self.event("payment_intent.succeeded", order_id, amount)
+
+    def payment_canceled(self, order_id: str, amount: int) -> Dict[str, Any]:
+        return self.event("payment_intent.canceled", order_id, amount)
+
+    def signed_request(self, event: Dict[str, Any], timestamp: Optional[int] = None) -> Tuple[bytes, Dict[str, str]]:
+        """Body and headers of a webhook delivery"""
+        body = json.dumps(event).encode()
+        return body, {"Content-Type": "application/json", SIGNATURE_HEADER: sign_payload(body, self.secret, timestamp)}
+
+    def deliver(self, url: str, event: Dict[str, Any]) -> int:
+        """POST an event to a webhook endpoint; returns the response status"""
+        body, headers = self.signed_request(event)
+        request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+
+
+class PaymentEventWorker:
+    """Applies stored webhook events in the background
+
+    `process` handles one batch and returns how many events it took; it is
+    called until the inbox is drained, then again on `wake()` (a new event
+    in this worker) or every `poll_interval` seconds, which picks up events
+    stored by other workers and retries that are due. Workers claim rows
+    with SKIP LOCKED, so any number can run at once.
+    """
+
+    def __init__(self, process: Callable[[], Awaitable[int]], poll_interval: float = 5.0) -> None:
+        self.process = process
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop after the batch in progress; unprocessed events stay in the inbox"""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                while await self.process():
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Processing payment events failed: %s", e)
+            # Not wait_for, which can swallow stop()'s cancel if a wakeup lands at the same moment
+            with contextlib.suppress(TimeoutError):
+                async with asyncio.timeout(self.poll_interval):
+                    await self._wakeup.wait()
+            self._wakeup.clear()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Send a signed fake payment event for an order")
+    parser.add_argument("order_id")
+    parser.add_argument("amount", type=int, help="amount in cents; the order total unless testing a mismatch")
+    parser.add_argument("--event", choices=["succeeded", "canceled"], default="succeeded")
+    parser.add_argument("--url", default="http://localhost:8000/payments/webhook")
+    parser.add_argument("--secret", default=os.getenv("PAYMENT_WEBHOOK_SECRET"))
+    args = parser.parse_args(argv)
+    if not args.secret:
+        parser.error("--secret or PAYMENT_WEBHOOK_SECRET is required")
+
+    provider = FakePaymentProvider(args.secret)
+    event = provider.event(f"payment_intent.{args.event}", args.order_id, args.amount)
+    print(f"{event['id']}: {provider.deliver(args.url, event)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+On-demand request profiling for Sensation by Sanu API
+"""
+
+import cProfile
+import io
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.concurrency import run_in_threadpool as starlette_run_in_threadpool
+
+# SQL statements recorded for the request being profiled, if any
+_active_sql: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("active_sql", default=None)
+_sql_timing_installed = False
+# Profiles of threadpool calls finished for the request being profiled, if any
+_active_thread_profiles: ContextVar[Optional[List[cProfile.Profile]]] = ContextVar("active_thread_profiles", default=None)
+
+
+def install_sql_timing() -> None:
+    """Time statements on every engine, recording them for profiled requests"""
+    global _sql_timing_installed
+    if _sql_timing_installed:
+        return
+    _sql_timing_installed = True
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _active_sql.get() is not None:
+            conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        statements = _active_sql.get()
+        started = conn.info.get("profile_started")
+        if statements is not None and started:
+            statements.append({
+                "statement": statement[:500],
+                "duration_ms": round((time.perf_counter() - started.pop()) * 1000, 3),
+            })
+
+
+async def run_in_threadpool(func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Starlette's run_in_threadpool, also profiling the call for a profiled request
+
+    cProfile only sees the thread it is enabled on, so the call gets its own
+    profile in the worker thread, merged into the request's when it ends.
+    """
+    profiles = _active_thread_profiles.get()
+    if profiles is None:
+        return await starlette_run_in_threadpool(func, *args, **kwargs)
+
+    def profiled_call() -> Any:
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            profiles.append(profile)
+
+    return await starlette_run_in_threadpool(profiled_call)
+
+
+class RequestProfiler:
+    """Keep the last `max_profiles` request profiles"""
+
+    def __init__(self, max_profiles: int = 50, sample_rate: float = 1.0, top_functions: int = 40) -> None:
+        self.sample_rate = sample_rate
+        self.top_functions = top_functions
+        self._profiles: Deque[Dict[str, Any]] = deque(maxlen=max_profiles)
+        # cProfile hooks the whole thread, so only one request is profiled at a time
+        self._busy = threading.Lock()
+
+    def sampled(self) -> bool:
+        """Whether a request asking to be profiled should be"""
+        return random.random() < self.sample_rate
+
+    def try_start(self) -> bool:
+        """Claim the profiler, False when another request holds it"""
+        return self._busy.acquire(blocking=False)
+
+    def finish(self, profile: Dict[str, Any]) -> None:
+        """Store a finished profile and release the profiler"""
+        self._profiles.append(profile)
+        self._busy.release()
+
+    def summaries(self) -> List[Dict[str, Any]]:
+        """Summaries of stored profiles, newest first"""
+        return [
+            {key: value for key, value in profile.items() if key not in ("functions", "sql_statements")}
+            for profile in reversed(self._profiles)
+        ]
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        """A stored profile with its function and SQL breakdown"""
+        for profile in self._profiles:
+            if profile["id"] == profile_id:
+                return profile
+        return None
+
+    def format_stats(self, profiler: cProfile.Profile, thread_profiles: List[cProfile.Profile]) -> str:
+        """Top functions by cumulative time, across the loop thread and threadpool calls"""
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        for thread_profile in thread_profiles:
+            stats.add(thread_profile)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top_functions)
+        return output.getvalue()
+
+
+def profile_requested(scope: dict) -> bool:
+    """True for requests sent with an X-Profile header or ?profile=1"""
+    for name, value in scope.get("headers", []):
+        if name == b"x-profile" and value not in (b"", b"0"):
+            return True
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return query.get("profile", ["0"])[0] not in ("", "0")
+
+
+class ProfilerMiddleware:
+    """ASGI middleware profiling requests that ask for it
+
+    `authorize` decides from the ASGI scope whether the caller may profile,
+    so only admins can make the server pay for it. The profile covers
+    everything run on the event loop thread while the request is in flight,
+    including other requests interleaved with it, plus the calls the request
+    makes through this module's `run_in_threadpool`. Work FastAPI itself runs
+    in the threadpool, such as sync dependencies, is not included.
+    """
+
+    def __init__(self, app: Callable, profiler: RequestProfiler, authorize: Callable[[dict], bool]) -> None:
+        self.app = app
+        self.profiler = profiler
+        self.authorize = authorize
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if (
+            scope["type"] != "http"
+            or not profile_requested(scope)
+            or not self.profiler.sampled()
+            or not self.authorize(scope)
+            or not self.profiler.try_start()
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex[:12]
+        status_code = 500
+
+        async def send_with_id(message: dict) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        statements: List[Dict[str, Any]] = []
+        thread_profiles: List[cProfile.Profile] = []
+        token = _active_sql.set(statements)
+        thread_token = _active_thread_profiles.set(thread_profiles)
+        profiler = cProfile.Profile()
+        started_at = datetime.utcnow()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - started
+            _active_sql.reset(token)
+            _active_thread_profiles.reset(thread_token)
+            # Calls still running (background cache refreshes) are left out
+            finished_threads = list(thread_profiles)
+            self.profiler.finish({
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "status_code": status_code,
+                "started_at": started_at.isoformat(),
+                "duration_ms": round(duration * 1000, 3),
+                "sql_count": len(statements),
+                "sql_ms": round(sum(s["duration_ms"] for s in statements), 3),
+                "sql_statements": sorted(statements, key=lambda s: -s["duration_ms"]),
+                "threadpool_calls": len(finished_threads),
+                "functions": self.profiler.format_stats(profiler, finished_threads),
+            })
@@ -0,0 +1,173 @@
+"""
+Token-bucket rate limiting for Sensation by Sanu API
+"""
+
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+from admission import RoutePattern
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    """Allow bursts of `capacity` requests, refilled at `per_seconds` per capacity"""
+    name: str
+    capacity: int
+    per_seconds: float
+
+    @property
+    def refill_rate(self) -> float:
+        """Tokens added per second"""
+        return self.capacity / self.per_seconds
+
+
+class InMemoryBucketStore:
+    """Token buckets held in this process
+
+    Used without REDIS_URL, and by RedisBucketStore while Redis is down.
+    """
+
+    def __init__(self, max_keys: int = 100000) -> None:
+        self.max_keys = max_keys
+        # key -> (tokens, last refill time)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, rule: RateLimitRule, cost: float = 1.0) -> Tuple[bool, float]:
+        """Take tokens from a bucket; returns (allowed, seconds until allowed)"""
+        return self.take_now(key, rule, cost)
+
+    def take_now(self, key: str, rule: RateLimitRule, cost: float = 1.0) -> Tuple[bool, float]:
+        """Synchronous take, shared with the Redis store's fallback path"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (float(rule.capacity), now))
+        tokens = min(float(rule.capacity), tokens + (now - updated) * rule.refill_rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.max_keys:
+            # Evicting the least recently seen bucket only ever forgives a client
+            self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / rule.refill_rate
+
+
+# KEYS[1] bucket key; ARGV capacity, refill rate per second, cost
+_TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+local wait = (cost - tokens) / rate
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+    wait = 0
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, tostring(wait)}
+"""
+
+
+class RedisBucketStore:
+    """Token buckets shared by every worker, updated atomically by a Lua script"""
+
+    def __init__(self, redis_url: str, prefix: str = "ratelimit:") -> None:
+        import redis.asyncio as redis
+
+        self.prefix = prefix
+        self._client = redis.from_url(redis_url)
+        self._script = self._client.register_script(_TAKE_SCRIPT)
+        # Used while Redis is unreachable, so limits still hold per worker
+        self._fallback = InMemoryBucketStore()
+
+    async def take(self, key: str, rule: RateLimitRule, cost: float = 1.0) -> Tuple[bool, float]:
+        """Take tokens from the shared bucket"""
+        try:
+            allowed, wait = await self._script(
+                keys=[self.prefix + key], args=[rule.capacity, rule.refill_rate, cost]
+            )
+            return bool(allowed), float(wait)
+        except Exception as e:
+            logger.warning("Rate limit store unavailable, limiting per worker: %s", e)
+            return self._fallback.take_now(key, rule, cost)
+
+
+class RateLimiter:
+    """Check requests against named rules in a bucket store"""
+
+    def __init__(self, store: Any) -> None:
+        self.store = store
+
+    async def hit(self, rule: RateLimitRule, identity: str) -> Tuple[bool, float]:
+        """Count one request by `identity` against `rule`"""
+        return await self.store.take(f"{rule.name}:{identity}", rule)
+
+
+@dataclass
+class RateLimitedRoute(RoutePattern):
+    """Rule applied per client IP to requests matching a path pattern"""
+    rule: RateLimitRule
+    path_pattern: str
+    methods: Optional[Set[str]] = None
+
+
+def too_many_requests_body(retry_after: float) -> bytes:
+    """429 body in the API's error format"""
+    return json.dumps({
+        "success": False,
+        "error": "Too many requests, please slow down",
+        "details": {"status_code": 429, "retry_after": round(retry_after, 1)},
+        "timestamp": datetime.utcnow().isoformat(),
+    }).encode()
+
+
+class RateLimitMiddleware:
+    """ASGI middleware applying per-IP token buckets to matching routes"""
+
+    def __init__(self, app: Callable, limiter: RateLimiter, routes: List[RateLimitedRoute]) -> None:
+        self.app = app
+        self.limiter = limiter
+        self.routes = routes
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] == "http":
+            client = scope.get("client")
+            ip = client[0] if client else "unknown"
+            for route in self.routes:
+                if not route.matches(scope["method"], scope["path"]):
+                    continue
+                allowed, retry_after = await self.limiter.hit(route.rule, ip)
+                if not allowed:
+                    await self._reject(send, retry_after)
+                    return
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(send: Callable, retry_after: float) -> None:
+        """Answer 429 with Retry-After"""
+        body = too_many_requests_body(retry_after)
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, round(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,216 @@
+"""
+Content-based "similar fragrances" recommendations for Sensation by Sanu API
+"""
+
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from models import FragrancePyramid, Product
+
+
+# Base notes linger longest, so they say the most about how a fragrance wears
+NOTE_TIER_WEIGHTS: Dict[str, float] = {
+    "top_notes": 1.0,
+    "middle_notes": 1.5,
+    "base_notes": 2.0,
+}
+
+# Rows scored per block when building the full similarity matrix
+_BUILD_BLOCK_ROWS = 1024
+
+
+def normalize_note(note: str) -> str:
+    """Normalize a note name so 'White Musk ' and 'white musk' match"""
+    return " ".join(note.lower().split())
+
+
+class SimilarityIndex:
+    """Top-K cosine similarity between products' fragrance pyramids"""
+
+    def __init__(self, top_k: int = 8) -> None:
+        self.top_k = top_k
+        self._lock = threading.RLock()
+        self._note_columns: Dict[str, int] = {}
+        self._row_of: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = []
+        self._free_rows: List[int] = []
+        # One L2-normalised row per product, zero rows for free slots
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        # product_id -> [(neighbour_id, score)] best first, at most top_k long
+        self._neighbours: Dict[str, List[Tuple[str, float]]] = {}
+        # product_id -> products whose neighbour list contains it
+        self._referenced_by: Dict[str, Set[str]] = {}
+        # Score a newcomer must beat to enter each row's list (0 while not full)
+        self._threshold = np.zeros(0, dtype=np.float32)
+        # product_id -> notes last encoded, so stock/price-only writes are free
+        self._signatures: Dict[str, tuple] = {}
+
+    def build(self, products: List[Product]) -> None:
+        """Encode every product and precompute all top-K lists"""
+        with self._lock:
+            self._note_columns = {}
+            self._row_of = {}
+            self._ids = []
+            self._free_rows = []
+            self._neighbours = {}
+            self._referenced_by = {}
+            self._signatures = {p.id: self._signature(p) for p in products}
+
+            encoded = [(p.id, self._encode(p.fragrance_pyramid)) for p in products]
+            self._vectors = np.zeros((len(encoded), len(self._note_columns)), dtype=np.float32)
+            self._threshold = np.zeros(len(encoded), dtype=np.float32)
+            for row, (product_id, (columns, weights)) in enumerate(encoded):
+                self._vectors[row, columns] = weights
+                self._row_of[product_id] = row
+                self._ids.append(product_id)
+
+            for start in range(0, len(self._ids), _BUILD_BLOCK_ROWS):
+                block = self._vectors[start:start + _BUILD_BLOCK_ROWS] @ self._vectors.T
+                for offset, scores in enumerate(block):
+                    row = start + offset
+                    self._set_neighbours(self._ids[row], self._top_k(scores, row))
+
+    def upsert(self, product: Product) -> None:
+        """Re-encode one product and patch only the lists it affects"""
+        with self._lock:
+            signature = self._signature(product)
+            if self._signatures.get(product.id) == signature:
+                return
+            self._signatures[product.id] = signature
+            columns, weights = self._encode(product.fragrance_pyramid)
+            if self._vectors.shape[1] < len(self._note_columns):
+                grow = len(self._note_columns) - self._vectors.shape[1]
+                self._vectors = np.pad(self._vectors, ((0, 0), (0, grow)))
+
+            row = self._row_of.get(product.id)
+            if row is None:
+                row = self._allocate_row(product.id)
+            self._vectors[row] = 0.0
+            self._vectors[row, columns] = weights
+
+            scores = self._vectors @ self._vectors[row]
+            self._set_neighbours(product.id, self._top_k(scores, row))
+
+            # Rows whose list already holds this product get its new score
+            for other_id in list(self._referenced_by.get(product.id, ())):
+                other_row = self._row_of[other_id]
+                self._rescore(other_id, other_row, product.id, float(scores[other_row]))
+
+            # Rows where the product now beats the weakest listed neighbour
+            scores[row] = 0.0
+            for other_row in np.nonzero(scores > self._threshold)[0]:
+                other_id = self._ids[other_row]
+                if other_id is None or product.id in dict(self._neighbours[other_id]):
+                    continue
+                entries = self._neighbours[other_id] + [(product.id, float(scores[other_row]))]
+                entries.sort(key=lambda entry: -entry[1])
+                self._set_neighbours(other_id, entries[:self.top_k])
+
+    def remove(self, product_id: str) -> None:
+        """Drop a product and refill the lists that referenced it"""
+        with self._lock:
+            self._signatures.pop(product_id, None)
+            row = self._row_of.pop(product_id, None)
+            if row is None:
+                return
+            self._set_neighbours(product_id, [])
+            self._neighbours.pop(product_id, None)
+            self._vectors[row] = 0.0
+            self._threshold[row] = 0.0
+            self._ids[row] = None
+            self._free_rows.append(row)
+
+            for other_id in list(self._referenced_by.pop(product_id, ())):
+                other_row = self._row_of[other_id]
+                entries = [e for e in self._neighbours[other_id] if e[0] != product_id]
+                if len(entries) + 1 == self.top_k:
+                    entries = self._top_k(self._vectors @ self._vectors[other_row], other_row)
+                self._set_neighbours(other_id, entries)
+
+    def similar(self, product_id: str, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Get precomputed neighbours of a product, best first"""
+        return self._neighbours.get(product_id, [])[:limit or self.top_k]
+
+    @staticmethod
+    def _signature(product: Product) -> tuple:
+        """The part of a product that determines its vector"""
+        pyramid = product.fragrance_pyramid
+        if not pyramid:
+            return ()
+        return tuple(tuple(getattr(pyramid, tier)) for tier in NOTE_TIER_WEIGHTS)
+
+    def _encode(self, pyramid: Optional[FragrancePyramid]) -> Tuple[List[int], np.ndarray]:
+        """Encode a pyramid as sparse column indices and L2-normalised weights"""
+        weights: Dict[int, float] = {}
+        if pyramid:
+            for tier, tier_weight in NOTE_TIER_WEIGHTS.items():
+                for note in getattr(pyramid, tier):
+                    note = normalize_note(note)
+                    if not note:
+                        continue
+                    column = self._note_columns.setdefault(note, len(self._note_columns))
+                    weights[column] = max(weights.get(column, 0.0), tier_weight)
+
+        values = np.fromiter(weights.values(), dtype=np.float32, count=len(weights))
+        norm = np.linalg.norm(values)
+        if norm:
+            values /= norm
+        return list(weights), values
+
+    def _allocate_row(self, product_id: str) -> int:
+        """Reuse a free row or append a new one"""
+        if self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            row = self._vectors.shape[0]
+            self._vectors = np.vstack(
+                [self._vectors, np.zeros((1, self._vectors.shape[1]), dtype=np.float32)]
+            )
+            self._threshold = np.append(self._threshold, np.float32(0.0))
+            self._ids.append(None)
+        self._ids[row] = product_id
+        self._row_of[product_id] = row
+        return row
+
+    def _top_k(self, scores: np.ndarray, row: int) -> List[Tuple[str, float]]:
+        """Pick the best K positive-scoring products other than `row`"""
+        scores = scores.copy()
+        scores[row] = 0.0
+        candidates = np.nonzero(scores > 0.0)[0]
+        if len(candidates) > self.top_k:
+            best = np.argpartition(scores[candidates], -self.top_k)[-self.top_k:]
+            candidates = candidates[best]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self._ids[i], float(scores[i])) for i in ranked]  # type: ignore[misc]
+
+    def _rescore(self, product_id: str, row: int, neighbour_id: str, score: float) -> None:
+        """Update one neighbour's score in a list, refilling the list if it fell out"""
+        others = [e for e in self._neighbours[product_id] if e[0] != neighbour_id]
+        full = len(others) + 1 == self.top_k
+        if score <= 0.0 or (full and others and score < others[-1][1]):
+            if full:
+                # Something outside the list may now rank higher
+                others = self._top_k(self._vectors @ self._vectors[row], row)
+            self._set_neighbours(product_id, others)
+            return
+        entries = others + [(neighbour_id, score)]
+        entries.sort(key=lambda entry: -entry[1])
+        self._set_neighbours(product_id, entries)
+
+    def _set_neighbours(self, product_id: str, entries: List[Tuple[str, float]]) -> None:
+        """Replace a neighbour list and keep the reverse references in step"""
+        for old_id, _score in self._neighbours.get(product_id, []):
+            self._referenced_by.get(old_id, set()).discard(product_id)
+        self._neighbours[product_id] = entries
+        for new_id, _score in entries:
+            self._referenced_by.setdefault(new_id, set()).add(product_id)
+        row = self._row_of.get(product_id)
+        if row is not None:
+            full = len(entries) == self.top_k
+            self._threshold[row] = entries[-1][1] if full else 0.0
+
+
+# Shared index used by the API process
+similarity_index = SimilarityIndex()
@@ -0,0 +1,103 @@
+"""
+Access token revocation for Sensation by Sanu API
+"""
+
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from events import RedisSubscriber
+
+logger = logging.getLogger(__name__)
+
+
+class TokenRevocationList:
+    """Per-user "tokens issued before this time are invalid" timestamps
+
+    Checked from memory on every request. The database is the source of
+    truth: each worker loads recent revocations at start and reloads them
+    every `refresh_interval` seconds; with Redis, revocations also reach
+    other workers immediately. Entries older than `token_lifetime` are
+    dropped, since every token they could reject has expired.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[float], Dict[str, float]],
+        token_lifetime: float,
+        redis_url: Optional[str] = None,
+        channel: str = "token-revocations",
+        refresh_interval: float = 30.0,
+    ) -> None:
+        self.load = load
+        self.token_lifetime = token_lifetime
+        self.refresh_interval = refresh_interval
+        self._valid_after: Dict[str, float] = {}
+        self._channel = RedisSubscriber(redis_url, channel, self._receive, "Token revocations")
+        self._tasks: List[asyncio.Task] = []
+
+    def __len__(self) -> int:
+        return len(self._valid_after)
+
+    def is_revoked(self, user_id: Optional[str], issued_at: Optional[float]) -> bool:
+        """True when a token for this user, issued at `issued_at`, has been revoked"""
+        valid_after = self._valid_after.get(str(user_id))
+        if valid_after is None:
+            return False
+        # Tokens without an iat claim predate revocation support
+        return issued_at is None or float(issued_at) < valid_after
+
+    def add(self, user_id: str, valid_after: float) -> None:
+        """Record a revocation in this worker"""
+        user_id = str(user_id)
+        if valid_after > self._valid_after.get(user_id, 0.0):
+            self._valid_after[user_id] = valid_after
+
+    async def publish(self, user_id: str, valid_after: float) -> None:
+        """Record a revocation and tell the other workers"""
+        self.add(user_id, valid_after)
+        if self._channel.connected:
+            try:
+                await self._channel.publish({"user_id": str(user_id), "valid_after": valid_after})
+            except Exception as e:
+                logger.warning("Redis publish failed, other workers see the revocation on refresh: %s", e)
+
+    def refresh(self) -> None:
+        """Merge in the database's revocations and drop expired ones (blocking)"""
+        cutoff = time.time() - self.token_lifetime
+        loaded = self.load(cutoff)
+        # Revocations only ever move forward, so keeping local entries the
+        # query may have missed is safe
+        valid_after = {user_id: t for user_id, t in self._valid_after.items() if t > cutoff}
+        for user_id, t in loaded.items():
+            valid_after[str(user_id)] = max(t, valid_after.get(str(user_id), 0.0))
+        self._valid_after = valid_after
+
+    async def start(self) -> None:
+        """Load revocations, then keep them in sync"""
+        await asyncio.to_thread(self.refresh)
+        self._tasks.append(asyncio.create_task(self._refresh_periodically()))
+        await self._channel.start()
+
+    async def stop(self) -> None:
+        """Stop syncing and close the Redis connection"""
+        for task in self._tasks:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+        await self._channel.stop()
+
+    async def _refresh_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.warning("Refreshing token revocations failed: %s", e)
+
+    async def _receive(self, message: Dict[str, Any]) -> None:
+        """Apply a revocation published by another worker"""
+        self.add(message["user_id"], float(message["valid_after"]))
@@ -0,0 +1,209 @@
+"""
+In-memory catalog search index for Sensation by Sanu API
+"""
+
+import bisect
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from models import Product
+
+
+# Relative weight of a term match per product field
+FIELD_WEIGHTS: Dict[str, float] = {
+    "name": 4.0,
+    "top_notes": 2.5,
+    "middle_notes": 2.5,
+    "base_notes": 2.5,
+    "tagline": 1.5,
+    "description": 1.0,
+}
+
+# Prefix matches score lower than exact term matches
+PREFIX_MATCH_FACTOR = 0.6
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Split text into lowercase alphanumeric tokens"""
+    if not text:
+        return []
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _product_fields(product: Product) -> Dict[str, str]:
+    """Collect the searchable text of a product by field"""
+    fields = {
+        "name": product.name,
+        "description": product.description,
+        "tagline": product.tagline or "",
+    }
+    pyramid = product.fragrance_pyramid
+    if pyramid:
+        fields["top_notes"] = " ".join(pyramid.top_notes)
+        fields["middle_notes"] = " ".join(pyramid.middle_notes)
+        fields["base_notes"] = " ".join(pyramid.base_notes)
+    return fields
+
+
+class SearchIndex:
+    """Inverted index over product names, descriptions, taglines and notes"""
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        # term -> {product_id: weight}
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        # product_id -> terms indexed for that product (for incremental removal)
+        self._product_terms: Dict[str, Set[str]] = {}
+        # Sorted vocabulary for prefix lookups
+        self._vocabulary: List[str] = []
+        self._documents: Dict[str, Product] = {}
+        # Documents in catalog order, rebuilt after a change
+        self._ordered: Optional[List[Product]] = None
+        # False until built, or when the catalog is too large to hold in memory
+        self.enabled = False
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def build(self, products: List[Product]) -> None:
+        """Rebuild the whole index from a product list"""
+        with self._lock:
+            self._postings = defaultdict(dict)
+            self._product_terms = {}
+            self._vocabulary = []
+            self._documents = {}
+            for product in products:
+                self._add(product)
+            self._vocabulary = sorted(self._postings)
+            self.enabled = True
+
+    def disable(self) -> None:
+        """Empty the index and stop accepting updates"""
+        with self._lock:
+            self.build([])
+            self.enabled = False
+
+    def upsert(self, product: Product) -> None:
+        """Add or replace a single product in the index"""
+        with self._lock:
+            if not self.enabled:
+                return
+            self._remove(product.id)
+            for term in self._add(product):
+                index = bisect.bisect_left(self._vocabulary, term)
+                if index == len(self._vocabulary) or self._vocabulary[index] != term:
+                    self._vocabulary.insert(index, term)
+
+    def remove(self, product_id: str) -> None:
+        """Remove a product from the index"""
+        with self._lock:
+            self._remove(product_id)
+
+    def get_document(self, product_id: str) -> Optional[Product]:
+        """Get the indexed copy of a product"""
+        return self._documents.get(product_id)
+
+    def documents(self) -> List[Product]:
+        """Get all indexed products, oldest first like the database lists them"""
+        with self._lock:
+            if self._ordered is None:
+                self._ordered = sorted(self._documents.values(), key=lambda p: (p.created_at, p.id))
+            return list(self._ordered)
+
+    def search(
+        self,
+        query: str,
+        category: Optional[str] = None,
+        limit: int = 20,
+        prefix: bool = True,
+    ) -> List[Tuple[Product, float]]:
+        """Rank products matching every query term, best first"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            scores: Optional[Dict[str, float]] = None
+            for position, term in enumerate(terms):
+                # Only the term being typed is prefix-expanded
+                expand = prefix and position == len(terms) - 1
+                term_scores = self._match(term, expand)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {
+                        product_id: score + term_scores[product_id]
+                        for product_id, score in scores.items()
+                        if product_id in term_scores
+                    }
+                if not scores:
+                    return []
+
+            results = []
+            for product_id, score in scores.items():
+                product = self._documents[product_id]
+                if category and (product.category or "").lower() != category.lower():
+                    continue
+                results.append((product, score))
+
+        results.sort(key=lambda result: (-result[1], result[0].name))
+        return results[:limit]
+
+    def _match(self, term: str, expand: bool) -> Dict[str, float]:
+        """Score products for one term, optionally including prefix matches"""
+        scores: Dict[str, float] = dict(self._postings.get(term, {}))
+        if not expand:
+            return scores
+
+        index = bisect.bisect_left(self._vocabulary, term)
+        while index < len(self._vocabulary):
+            candidate = self._vocabulary[index]
+            if not candidate.startswith(term):
+                break
+            if candidate != term:
+                for product_id, weight in self._postings[candidate].items():
+                    prefixed = weight * PREFIX_MATCH_FACTOR
+                    if prefixed > scores.get(product_id, 0.0):
+                        scores[product_id] = prefixed
+            index += 1
+        return scores
+
+    def _add(self, product: Product) -> Set[str]:
+        """Index a product and return the terms it introduced"""
+        self._documents[product.id] = product
+        self._ordered = None
+        weights: Dict[str, float] = defaultdict(float)
+        for field, text in _product_fields(product).items():
+            for term in tokenize(text):
+                weights[term] += FIELD_WEIGHTS[field]
+
+        new_terms = set()
+        for term, weight in weights.items():
+            if term not in self._postings:
+                new_terms.add(term)
+            self._postings[term][product.id] = weight
+        self._product_terms[product.id] = set(weights)
+        return new_terms
+
+    def _remove(self, product_id: str) -> None:
+        """Drop a product's postings and prune empty terms"""
+        self._documents.pop(product_id, None)
+        self._ordered = None
+        for term in self._product_terms.pop(product_id, set()):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+                index = bisect.bisect_left(self._vocabulary, term)
+                if index < len(self._vocabulary) and self._vocabulary[index] == term:
+                    del self._vocabulary[index]
+
+
+# Shared index used by the API process
+search_index = SearchIndex()
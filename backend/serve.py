@@ -0,0 +1,239 @@
+"""
+Sensation by Sanu - Production launcher
+
+Imports the API once, runs one-time database setup in the master process,
+then forks workers that share the listening socket. SIGTERM/SIGINT drain
+in-flight requests in every worker before exiting; dead workers are replaced.
+
+    python serve.py --workers 4 --port 8000
+    python serve.py --profile-startup      # import cost per module, then exit
+"""
+
+import argparse
+import importlib.util
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+from uvicorn.importer import import_from_string
+
+logger = logging.getLogger("serve")
+
+# Seconds between checks for exited workers
+REAP_INTERVAL = 0.5
+
+
+def default_workers() -> int:
+    """One worker per usable core, overridable with WEB_CONCURRENCY"""
+    if os.getenv("WEB_CONCURRENCY"):
+        return max(1, int(os.environ["WEB_CONCURRENCY"]))
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return max(1, os.cpu_count() or 1)
+
+
+def event_loop_implementation() -> str:
+    """Use uvloop when installed"""
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+
+def http_implementation() -> str:
+    """Use httptools when installed"""
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+
+def prepare_database() -> None:
+    """Create tables and sample data once, before any worker starts"""
+    from database_production import create_tables, engine, init_sample_data
+
+    create_tables()
+    init_sample_data()
+    # Workers must not share the master's pooled connections across fork
+    engine.dispose()
+    os.environ["DB_INIT_DONE"] = "1"
+
+
+def profile_startup(app_path: str, top: int = 25) -> None:
+    """Report the slowest module imports and total time until the app is importable"""
+    module = app_path.split(":")[0]
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        raise SystemExit(result.returncode)
+
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings.append((int(cumulative_us), int(self_us), name.rstrip()))
+
+    print(f"Importing {module} took {elapsed * 1000:.0f} ms (interpreter start included)")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, name in sorted(timings, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    """Bind the listening socket shared by all workers"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Master:
+    """Pre-fork process manager for the API workers"""
+
+    def __init__(self, app_path: str, host: str, port: int, workers: int, graceful_timeout: int) -> None:
+        self.app_path = app_path
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.stopping = False
+        self._children: Dict[int, int] = {}  # pid -> worker slot
+        self._sock: Optional[socket.socket] = None
+        self._app: object = None
+
+    def run(self) -> None:
+        """Preload the app, start workers and supervise them until signalled"""
+        self._app = import_from_string(self.app_path)
+        self._sock = bind_socket(self.host, self.port, backlog=2048)
+        logger.info(
+            "Listening on %s:%d with %d workers (loop=%s, http=%s)",
+            self.host, self.port, self.workers, event_loop_implementation(), http_implementation()
+        )
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+
+        for slot in range(self.workers):
+            self._spawn(slot)
+
+        while not self.stopping:
+            self._reap(respawn=True)
+            time.sleep(REAP_INTERVAL)
+
+        self._shutdown()
+
+    def _handle_stop(self, signum: int, frame: object) -> None:
+        """Begin a graceful shutdown"""
+        self.stopping = True
+
+    def _spawn(self, slot: int) -> None:
+        """Fork one worker serving on the shared socket"""
+        pid = os.fork()
+        if pid:
+            self._children[pid] = slot
+            return
+
+        # Worker: uvicorn installs its own SIGTERM/SIGINT handlers for draining
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        config = uvicorn.Config(
+            self._app,
+            loop=event_loop_implementation(),
+            http=http_implementation(),
+            timeout_graceful_shutdown=self.graceful_timeout,
+            # Only these proxies may set the client IP (used by rate limits) through
+            # X-Forwarded-For; docker-compose sets the nginx container's address
+            proxy_headers=True,
+            forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        )
+        exit_code = 0
+        try:
+            uvicorn.Server(config).run(sockets=[self._sock])
+        except Exception:
+            logger.exception("Worker %d crashed", os.getpid())
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    def _reap(self, respawn: bool) -> None:
+        """Collect exited workers, replacing them unless shutting down"""
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self._children.clear()
+                return
+            if pid == 0:
+                return
+            slot = self._children.pop(pid, None)
+            if slot is None:
+                continue
+            if respawn and not self.stopping:
+                logger.warning("Worker %d exited with status %d, restarting", pid, status)
+                self._spawn(slot)
+
+    def _shutdown(self) -> None:
+        """Ask workers to drain, then force-kill any that overrun the deadline"""
+        logger.info("Draining %d workers", len(self._children))
+        for pid in list(self._children):
+            self._signal(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self._children and time.monotonic() < deadline:
+            self._reap(respawn=False)
+            time.sleep(0.1)
+
+        for pid in list(self._children):
+            logger.warning("Worker %d did not drain in time, killing", pid)
+            self._signal(pid, signal.SIGKILL)
+        self._reap(respawn=False)
+        if self._sock:
+            self._sock.close()
+
+    @staticmethod
+    def _signal(pid: int, signum: int) -> None:
+        """Signal a worker that may already have exited"""
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Parse arguments and run the master"""
+    parser = argparse.ArgumentParser(description="Run the Sensation by Sanu API with multiple workers")
+    parser.add_argument("--app", default="main_production:app", help="ASGI app import path")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", "30")),
+                        help="Seconds a worker may spend finishing in-flight requests on shutdown")
+    parser.add_argument("--skip-db-init", action="store_true", help="Don't create tables or sample data")
+    parser.add_argument("--profile-startup", action="store_true", help="Report import time per module and exit")
+    args = parser.parse_args(argv)
+
+    if args.profile_startup:
+        profile_startup(args.app)
+        return
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(process)d] %(levelname)s %(message)s")
+    if args.skip_db_init:
+        os.environ["DB_INIT_DONE"] = "1"
+    else:
+        prepare_database()
+    Master(args.app, args.host, args.port, args.workers, args.graceful_timeout).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+Static catalog snapshots for Sensation by Sanu API
+
+Pre-rendered, pre-compressed JSON of the product list and of each product,
+written where nginx can serve them without reaching the API:
+
+    <directory>/products.json(.gz, .br)
+    <directory>/products/<product_id>.json(.gz, .br)
+"""
+
+import fcntl
+import gzip
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+from models import Product
+
+try:
+    import brotli
+except ImportError:  # .br files are skipped; nginx falls back to .gz
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value):
+    """Encode datetimes the way the API does"""
+    return value.isoformat()
+
+
+class CatalogSnapshotPublisher:
+    """Keep snapshot files in step with the products table
+
+    Snapshots omit exact stock above `low_stock_threshold` (and the row
+    version and updated_at), so an order only rewrites files when a product
+    sells out or drops into low stock. Publishing re-reads the database under
+    a file lock, so concurrent workers can't overwrite newer data with older.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str],
+        load_products: Callable[[List[str]], List[Product]],
+        load_listing: Callable[[], List[Product]],
+        load_all: Callable[[], List[Product]],
+        low_stock_threshold: int = 5,
+    ) -> None:
+        self.directory = directory
+        self.load_products = load_products
+        self.load_listing = load_listing
+        self.load_all = load_all
+        self.low_stock_threshold = low_stock_threshold
+        # One publisher thread per process; the file lock orders processes
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalog-snapshots")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def schedule(self, product_ids: List[str]) -> None:
+        """Publish changed products in the background"""
+        if self.enabled and product_ids:
+            self._executor.submit(self._run, self.publish, list(product_ids))
+
+    def publish(self, product_ids: List[str]) -> bool:
+        """Rewrite the snapshots of these products, and the listing if any changed"""
+        with self._locked():
+            changed = False
+            found = set()
+            for product in self.load_products(product_ids):
+                found.add(product.id)
+                changed |= self._write(self._product_path(product.id), self.render(product))
+            for product_id in set(product_ids) - found:
+                changed |= self._remove(self._product_path(product_id))
+            if changed:
+                self._write_listing()
+            return changed
+
+    def publish_all(self) -> None:
+        """Rewrite every snapshot and drop those of deleted products"""
+        if not self.enabled:
+            return
+        with self._locked():
+            # Every product gets a file, not just those on the listing's first page
+            products = self.load_all()
+            for product in products:
+                self._write(self._product_path(product.id), self.render(product))
+            known = {f"{product.id}.json" for product in products}
+            product_dir = os.path.join(self.directory, "products")
+            for name in os.listdir(product_dir):
+                if name.endswith(".json") and name not in known:
+                    self._remove(os.path.join(product_dir, name))
+            self._write_listing()
+
+    def render(self, product: Product) -> bytes:
+        """Serialize a product as the storefront sees it"""
+        data = product.dict(exclude={"version", "updated_at"})
+        if data["quantity"] is not None and data["quantity"] > self.low_stock_threshold:
+            data["quantity"] = None
+        return json.dumps(data, default=_json_default, separators=(",", ":")).encode()
+
+    def _write_listing(self, products: Optional[List[Product]] = None) -> None:
+        """Write the same list GET /products returns without parameters"""
+        if products is None:
+            products = self.load_listing()
+        body = b"[" + b",".join(self.render(product) for product in products) + b"]"
+        self._write(os.path.join(self.directory, "products.json"), body)
+
+    def _product_path(self, product_id: str) -> str:
+        return os.path.join(self.directory, "products", f"{product_id}.json")
+
+    def _write(self, path: str, body: bytes) -> bool:
+        """Atomically replace a snapshot and its compressed copies; False if unchanged"""
+        try:
+            with open(path, "rb") as f:
+                if f.read() == body:
+                    return False
+        except FileNotFoundError:
+            pass
+        # Each file is swapped in atomically; the copies may briefly be one write apart
+        self._replace(path + ".gz", gzip.compress(body, compresslevel=9, mtime=0))
+        if brotli is not None:
+            self._replace(path + ".br", brotli.compress(body, quality=11))
+        self._replace(path, body)
+        return True
+
+    @staticmethod
+    def _replace(path: str, data: bytes) -> None:
+        """Write to a temporary file beside `path`, then rename over it"""
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        """Delete a snapshot and its compressed copies; False if it didn't exist"""
+        removed = False
+        for suffix in ("", ".gz", ".br"):
+            try:
+                os.remove(path + suffix)
+                removed = True
+            except FileNotFoundError:
+                pass
+        return removed
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the publish lock shared by every worker process"""
+        os.makedirs(os.path.join(self.directory, "products"), exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _run(job: Callable, *args) -> None:
+        try:
+            job(*args)
+        except Exception:
+            logger.exception("Publishing catalog snapshots failed")
@@ -0,0 +1,72 @@
+"""
+Shared fixtures for the Sensation by Sanu API tests
+
+The tests need a PostgreSQL database they may wipe, given in
+TEST_DATABASE_URL; without it they are skipped:
+
+    TEST_DATABASE_URL=postgresql://postgres@localhost/sensation_test python -m pytest
+"""
+
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    # Read when database_production is imported
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def database():
+    """Empty schema with the sample products"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    import database_production
+
+    database_production.Base.metadata.drop_all(database_production.engine)
+    database_production.create_tables()
+    database_production.init_sample_data()
+    return database_production
+
+
+def make_orders(database_production, count: int, age_days: int = 0, status: str = "delivered") -> List[str]:
+    """Insert orders of one item each, placed `age_days` ago; returns their IDs"""
+    db = database_production.SessionLocal()
+    try:
+        user = database_production.UserDB(
+            email=f"customer-{uuid.uuid4().hex[:8]}@example.com",
+            name="Customer",
+            hashed_password="x"
+        )
+        product = db.query(database_production.ProductDB).first()
+        db.add(user)
+        db.flush()
+        placed = datetime.utcnow() - timedelta(days=age_days)
+        order_ids = []
+        for _ in range(count):
+            order = database_production.OrderDB(
+                user_id=user.id,
+                total=product.price,
+                status=status,
+                payment_method="credit_card",
+                shipping_address={},
+                created_at=placed,
+                updated_at=placed
+            )
+            db.add(order)
+            db.flush()
+            db.add(database_production.OrderItemDB(
+                order_id=order.id, product_id=product.id, quantity=1, price_at_time=product.price
+            ))
+            db.add(database_production.OrderStatusHistoryDB(order_id=order.id, status=status, created_at=placed))
+            order_ids.append(str(order.id))
+        db.commit()
+        return order_ids
+    finally:
+        db.close()
@@ -0,0 +1,110 @@
+"""
+Admission control tests: the concurrency limiter and the shedding middleware
+"""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from admission import AdmissionControlMiddleware, ConcurrencyLimiter, RouteClass
+
+
+async def settle():
+    """Let woken tasks run until they block again"""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_requests_past_the_limit_wait_and_time_out():
+    limiter = ConcurrencyLimiter("test", max_concurrent=1, max_queue=1, queue_timeout=0.05)
+
+    assert await limiter.acquire() is True
+    assert await limiter.acquire() is False
+    assert limiter.stats() == {
+        "active": 1, "queued": 0, "max_concurrent": 1, "max_queue": 1, "rejected": 0, "timed_out": 1,
+    }
+    # The timed-out waiter is gone, so a release frees the slot
+    limiter.release()
+    assert limiter.active == 0
+
+
+@pytest.mark.asyncio
+async def test_requests_past_a_full_queue_are_shed_at_once():
+    limiter = ConcurrencyLimiter("test", max_concurrent=1, max_queue=2, queue_timeout=10)
+    await limiter.acquire()
+    waiters = [asyncio.create_task(limiter.acquire()) for _ in range(2)]
+    await settle()
+
+    assert await asyncio.wait_for(limiter.acquire(), 0.1) is False
+    assert (limiter.queued, limiter.rejected) == (2, 1)
+
+    for _ in waiters:
+        limiter.release()
+    assert await asyncio.gather(*waiters) == [True, True]
+
+
+@pytest.mark.asyncio
+async def test_a_release_hands_the_slot_to_the_oldest_waiter():
+    limiter = ConcurrencyLimiter("test", max_concurrent=1, max_queue=3, queue_timeout=10)
+    await limiter.acquire()
+    admitted = []
+
+    async def wait(name):
+        await limiter.acquire()
+        admitted.append(name)
+
+    waiters = []
+    for name in ("first", "second", "third"):
+        waiters.append(asyncio.create_task(wait(name)))
+        await settle()
+    # A client that gives up while queued is skipped over
+    waiters[0].cancel()
+    await settle()
+
+    limiter.release()
+    await settle()
+    assert admitted == ["second"]
+    assert limiter.active == 1
+    # A newcomer queues behind the remaining waiter instead of taking the slot
+    newcomer = asyncio.create_task(limiter.acquire())
+    await settle()
+    assert limiter.queued == 2
+
+    limiter.release()
+    limiter.release()
+    await asyncio.gather(waiters[2], newcomer)
+    assert admitted == ["second", "third"]
+    limiter.release()
+    assert (limiter.active, limiter.queued) == (0, 0)
+
+
+def test_shed_requests_get_503_with_retry_after():
+    limiter = ConcurrencyLimiter("checkout", max_concurrent=1, max_queue=0, queue_timeout=2.5)
+    received = []
+
+    async def app(scope, receive, send):
+        received.append(scope["path"])
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    client = TestClient(AdmissionControlMiddleware(app, [
+        RouteClass("streams", None, r"^/orders/[^/]+/events$"),
+        RouteClass("checkout", limiter, r"^/orders$", methods={"POST"}),
+    ]))
+    # Another request holds the only slot
+    asyncio.run(limiter.acquire())
+
+    response = client.post("/orders")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "3"
+    assert response.json()["details"] == {"status_code": 503, "route_class": "checkout"}
+    # Unlimited and unmatched routes are always admitted
+    assert client.get("/orders/1/events").status_code == 200
+    assert client.get("/orders").status_code == 200
+
+    limiter.release()
+    assert client.post("/orders").status_code == 200
+    assert limiter.active == 0
+    assert received == ["/orders/1/events", "/orders", "/orders"]
@@ -0,0 +1,26 @@
+"""
+Order archive tests
+"""
+
+from conftest import make_orders
+
+
+def test_all_orders_are_listed_newest_first_across_live_and_archive(database):
+    archived = make_orders(database, 3, age_days=500)
+    assert database.archive_old_orders(days=400) == 3
+    # Older than the archived orders, but still in progress, so never archived
+    old_pending = make_orders(database, 2, age_days=600, status="pending")
+    recent = make_orders(database, 2, age_days=1)
+
+    db = database.SessionLocal()
+    try:
+        orders = database.get_all_orders(db, skip=0, limit=100)
+        pages = [database.get_all_orders(db, skip=skip, limit=2) for skip in range(0, 7, 2)]
+    finally:
+        db.close()
+
+    created = [order.created_at for order in orders]
+    assert created == sorted(created, reverse=True)
+    assert {str(order.id) for order in orders} == set(archived + old_pending + recent)
+    assert [str(order.id) for page in pages for order in page] == [str(order.id) for order in orders]
+    assert {str(order.id) for order in orders[-2:]} == set(old_pending)
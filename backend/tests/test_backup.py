@@ -0,0 +1,146 @@
+"""
+Backup and restore tests
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+import backup
+from conftest import make_orders
+
+
+def archive_continuously(database_production, stop: threading.Event) -> None:
+    """Archive old orders a few at a time until stopped"""
+    while not stop.is_set():
+        if not database_production.archive_old_orders(days=1, batch_size=3):
+            stop.wait(0.01)
+
+
+def order_placement(database_production):
+    """Order ID -> "live" or "archive", and the IDs found on both sides or missing their order"""
+    with database_production.engine.connect() as connection:
+        live = {row[0] for row in connection.execute(text("SELECT id::text FROM orders"))}
+        archived = {row[0] for row in connection.execute(text("SELECT id::text FROM orders_archive"))}
+        orphans = connection.execute(text(
+            "SELECT count(*) FROM order_items i WHERE NOT EXISTS (SELECT 1 FROM orders o WHERE o.id = i.order_id)"
+        )).scalar()
+        archived_orphans = connection.execute(text(
+            "SELECT count(*) FROM order_items_archive i "
+            "WHERE NOT EXISTS (SELECT 1 FROM orders_archive o WHERE o.id = i.order_id)"
+        )).scalar()
+    placement = {order_id: "live" for order_id in live}
+    placement.update({order_id: "archive" for order_id in archived})
+    return placement, live & archived, orphans + archived_orphans
+
+
+def test_full_backup_while_archiving_restores_every_order_once(database, tmp_path):
+    order_ids = make_orders(database, 60, age_days=400)
+    stop = threading.Event()
+    archiver = threading.Thread(target=archive_continuously, args=(database, stop))
+    archiver.start()
+    try:
+        # Small chunks keep the dump running while the archiver works
+        backup.run_backup(str(tmp_path / "full"), chunk_rows=2)
+    finally:
+        stop.set()
+        archiver.join()
+    placement, both, _orphans = order_placement(database)
+    assert set(placement) == set(order_ids)
+
+    backup.run_restore([str(tmp_path / "full")], clean=True)
+
+    restored, both, orphans = order_placement(database)
+    assert set(restored) == set(order_ids)
+    assert not both
+    assert orphans == 0
+
+
+def test_incremental_restore_replays_archive_moves(database, tmp_path):
+    order_ids = make_orders(database, 20, age_days=400)
+    backup.run_backup(str(tmp_path / "full"))
+    assert database.archive_old_orders(days=1) == 20
+    # One order comes back to the live tables when it is changed
+    db = database.SessionLocal()
+    try:
+        from models import OrderUpdate
+        database.update_order(db, order_ids[0], OrderUpdate(status="cancelled"))
+    finally:
+        db.close()
+    backup.run_backup(str(tmp_path / "incremental"), since_dir=str(tmp_path / "full"))
+    expected, _both, _orphans = order_placement(database)
+
+    backup.run_restore([str(tmp_path / "full"), str(tmp_path / "incremental")], clean=True)
+
+    restored, both, orphans = order_placement(database)
+    assert restored == expected
+    assert restored[order_ids[0]] == "live"
+    assert not both
+    assert orphans == 0
+
+
+def test_order_moves_wait_for_a_running_backup(database):
+    order_ids = make_orders(database, 3, age_days=400)
+    connection = database.engine.raw_connection()
+    try:
+        connection.cursor().execute("SELECT pg_advisory_lock(%s)", (database.ORDER_MOVE_LOCK,))
+        connection.commit()
+        # The archiver skips its run rather than wait for the backup
+        assert database.archive_old_orders(days=1) == 0
+    finally:
+        connection.cursor().execute("SELECT pg_advisory_unlock(%s)", (database.ORDER_MOVE_LOCK,))
+        connection.commit()
+        connection.close()
+    assert database.archive_old_orders(days=1) == len(order_ids)
+
+
+def test_incremental_backups_carry_edited_addresses(database, tmp_path):
+    db = database.SessionLocal()
+    try:
+        user = database.UserDB(email="addresses@example.com", name="Customer", hashed_password="x")
+        db.add(user)
+        db.flush()
+        address = database.AddressDB(
+            user_id=user.id, street="12 Old Street", city="Kochi", state="Kerala",
+            postal_code="682001", country="India", created_at=datetime.utcnow() - timedelta(days=30)
+        )
+        db.add(address)
+        db.commit()
+        address_id = address.id
+    finally:
+        db.close()
+    backup.run_backup(str(tmp_path / "full"))
+    with database.engine.begin() as connection:
+        connection.execute(text("UPDATE addresses SET street = '7 New Street' WHERE id = :id"), {"id": address_id})
+
+    manifest = backup.run_backup(str(tmp_path / "incremental"), since_dir=str(tmp_path / "full"))
+    assert manifest["tables"]["addresses"]["mode"] == "full"
+    assert manifest["tables"]["order_status_history"]["mode"] == "changes"
+    backup.run_restore([str(tmp_path / "full"), str(tmp_path / "incremental")], clean=True)
+
+    with database.engine.connect() as connection:
+        street = connection.execute(text("SELECT street FROM addresses WHERE id = :id"), {"id": address_id}).scalar()
+    assert street == "7 New Street"
+
+
+def test_orders_can_move_while_the_other_tables_are_dumped(database, tmp_path, monkeypatch):
+    dump_table = backup.dump_table
+    moves_allowed = {}
+
+    def dump_and_check(connection, table, *args):
+        with database.engine.connect() as other:
+            # What an archive move or a change to an archived order would try
+            moves_allowed[table.name] = other.execute(
+                text("SELECT pg_try_advisory_xact_lock_shared(:lock)"), {"lock": database.ORDER_MOVE_LOCK}
+            ).scalar()
+        return dump_table(connection, table, *args)
+
+    monkeypatch.setattr(backup, "dump_table", dump_and_check)
+    backup.run_backup(str(tmp_path / "full"))
+
+    moving = backup.order_move_tables()
+    assert {name for name, allowed in moves_allowed.items() if not allowed} == moving
+    assert len(moves_allowed) == len(backup.backup_tables())
+    with database.engine.connect() as other:
+        assert other.execute(text("SELECT pg_try_advisory_xact_lock_shared(:lock)"), {"lock": database.ORDER_MOVE_LOCK}).scalar()
@@ -0,0 +1,164 @@
+"""
+In-process cache tests
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import caching
+from caching import StaleWhileRevalidateCache, TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic clock the test advances by hand"""
+    now = [1000.0]
+    # Only the module's clock: the event loop keeps real time
+    monkeypatch.setattr(caching, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = TTLCache(max_entries=10, ttl=30)
+    cache.set("key", "value")
+    cache.set("short", "value", ttl=5)
+
+    clock[0] += 5
+    assert cache.lookup("short") == (False, None)
+    clock[0] += 24.9
+    assert cache.lookup("key") == (True, "value")
+    clock[0] += 0.1
+    assert cache.lookup("key") == (False, None)
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_the_least_recently_used_entry_is_evicted(clock):
+    cache = TTLCache(max_entries=2, ttl=30)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.lookup("a")
+    cache.set("c", 3)
+
+    assert [cache.lookup(key) for key in ("a", "b", "c")] == [(True, 1), (False, None), (True, 3)]
+    # Re-setting a key also counts as a use
+    cache.set("a", 10)
+    cache.set("d", 4)
+    assert [cache.lookup(key)[0] for key in ("a", "c", "d")] == [True, False, True]
+
+
+def test_misses_are_cached_for_the_negative_ttl(clock):
+    cache = TTLCache(max_entries=10, ttl=30, negative_ttl=10)
+    cache.set("unknown", None)
+
+    # Found, with no value: the lookup is known to miss
+    assert cache.lookup("unknown") == (True, None)
+    clock[0] += 10
+    assert cache.lookup("unknown") == (False, None)
+
+    cache.set("unknown", None)
+    cache.delete("unknown")
+    assert cache.lookup("unknown") == (False, None)
+
+
+class Source:
+    """Computation the test releases by hand, counting how often it ran"""
+
+    def __init__(self):
+        self.calls = 0
+        self.value = "v0"
+        self.release = asyncio.Event()
+
+    async def compute(self):
+        self.calls += 1
+        value = self.value
+        await self.release.wait()
+        return value
+
+
+async def settle():
+    """Let woken tasks run until they block again"""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_computation(clock):
+    cache = StaleWhileRevalidateCache(ttl=10, stale_ttl=60)
+    source = Source()
+
+    readers = [asyncio.create_task(cache.get("key", source.compute)) for _ in range(5)]
+    await settle()
+    source.release.set()
+
+    assert await asyncio.gather(*readers) == ["v0"] * 5
+    assert source.calls == 1
+    assert cache.misses == 5
+    assert await cache.get("key", source.compute) == "v0"
+    assert (source.calls, cache.hits) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_stale_values_are_served_while_one_refresh_runs(clock):
+    cache = StaleWhileRevalidateCache(ttl=10, stale_ttl=60)
+    source = Source()
+    source.release.set()
+    await cache.get("key", source.compute)
+
+    clock[0] += 30
+    source.value, source.release = "v1", asyncio.Event()
+    assert [await cache.get("key", source.compute) for _ in range(3)] == ["v0"] * 3
+    await settle()
+    assert (source.calls, cache.stale_hits) == (2, 3)
+
+    source.release.set()
+    await settle()
+    assert await cache.get("key", source.compute) == "v1"
+    assert source.calls == 2
+
+    # Past the stale window the value is recomputed before it is returned
+    clock[0] += 100
+    source.value = "v2"
+    assert await cache.get("key", source.compute) == "v2"
+
+
+@pytest.mark.asyncio
+async def test_a_refresh_started_before_expire_is_returned_but_not_cached(clock):
+    cache = StaleWhileRevalidateCache(ttl=10, stale_ttl=60)
+    before, after = Source(), Source()
+    after.value = "after write"
+
+    early = asyncio.create_task(cache.get("key", before.compute))
+    await settle()
+    # A write lands while the first computation is still reading
+    cache.expire()
+    late = asyncio.create_task(cache.get("key", after.compute))
+    await settle()
+    assert (before.calls, after.calls) == (1, 1)
+
+    # The older computation finishing last must not overwrite the newer one
+    after.release.set()
+    assert await late == "after write"
+    before.release.set()
+    assert await early == "v0"
+
+    assert await cache.get("key", after.compute) == "after write"
+    assert after.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_a_failed_computation_is_not_cached(clock):
+    cache = StaleWhileRevalidateCache(ttl=10, stale_ttl=60)
+
+    async def fail():
+        raise RuntimeError("database is down")
+
+    with pytest.raises(RuntimeError):
+        await cache.get("key", fail)
+
+    async def compute():
+        return "value"
+
+    assert await cache.get("key", compute) == "value"
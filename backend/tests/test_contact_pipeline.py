@@ -0,0 +1,157 @@
+"""
+Contact pipeline tests, with a fake batch insert in place of the database
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import contact_pipeline
+from contact_pipeline import ContactPipeline, spam_score
+from models import ContactForm
+
+MESSAGE = "Hello, do you ship the brass lamps to Bangalore?"
+SPAM = ContactForm(
+    name="www.cheap-seo.xyz",
+    email="promo@example.com",
+    message="BEST SEO BACKLINKS AND CRYPTO!!!!!! click here http://spam.example https://spam.example",
+)
+
+
+def contact(message=MESSAGE, email="asha@example.com", name="Asha"):
+    return ContactForm(name=name, email=email, message=message)
+
+
+class FakeInsert:
+    """Stands in for create_contacts, recording each batch"""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, rows):
+        self.batches.append(rows)
+        return len(rows)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic clock for the dedup window, advanced by hand"""
+    now = [1000.0]
+    # Only the module's clock: the event loop keeps real time
+    monkeypatch.setattr(contact_pipeline, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+@pytest.mark.asyncio
+async def test_the_same_message_is_accepted_once_an_hour(clock):
+    pipeline = ContactPipeline(FakeInsert())
+
+    assert pipeline.submit(contact()) == "accepted"
+    # Case and whitespace don't make a message new
+    assert pipeline.submit(contact("  hello, DO you ship the brass\n lamps to Bangalore? ")) == "duplicate"
+    assert pipeline.submit(contact(email="Asha@Example.com ")) == "duplicate"
+    assert pipeline.submit(contact(email="ravi@example.com")) == "accepted"
+    assert pipeline.submit(contact("A different question about lamps")) == "accepted"
+
+    clock[0] += 3599
+    assert pipeline.submit(contact()) == "duplicate"
+    clock[0] += 1
+    assert pipeline.submit(contact()) == "accepted"
+    assert pipeline.stats() == {
+        "accepted": 4, "duplicate": 3, "rejected": 0, "spam": 0, "stored": 0, "failed": 0, "queued": 4,
+    }
+
+
+@pytest.mark.asyncio
+async def test_a_flood_is_written_in_batches_of_500():
+    insert = FakeInsert()
+    pipeline = ContactPipeline(insert)
+    for i in range(1200):
+        pipeline.submit(contact(f"Question number {i} about the lamps"))
+
+    pipeline.start()
+    await asyncio.sleep(0.1)
+    assert [len(batch) for batch in insert.batches] == [500, 500]
+    # The remainder waits out the flush interval for more submissions
+    await asyncio.sleep(0.6)
+    assert [len(batch) for batch in insert.batches] == [500, 500, 200]
+    assert pipeline.stats()["stored"] == 1200
+    await pipeline.stop()
+
+
+@pytest.mark.asyncio
+async def test_a_single_submission_is_written_after_the_flush_interval():
+    insert = FakeInsert()
+    pipeline = ContactPipeline(insert)
+    pipeline.start()
+
+    pipeline.submit(contact())
+    await asyncio.sleep(0.3)
+    assert insert.batches == []
+    await asyncio.sleep(0.4)
+    assert [row["message"] for batch in insert.batches for row in batch] == [MESSAGE]
+    await pipeline.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_writes_whatever_is_queued():
+    insert = FakeInsert()
+    pipeline = ContactPipeline(insert)
+    pipeline.start()
+    pipeline.submit(contact())
+    await asyncio.sleep(0.05)
+    # Arrives as the worker is cancelled, while it is filling a batch
+    pipeline.submit(contact("A second question about lamps"))
+
+    await asyncio.wait_for(pipeline.stop(), 1)
+    assert sum(len(batch) for batch in insert.batches) == 2
+
+
+def test_spam_scores_rank_promotions_above_questions():
+    assert spam_score(contact()) < 0.1
+    assert spam_score(contact(MESSAGE + " Photos: https://imgur.com/a/lamp")) < 0.8
+    assert spam_score(SPAM) > 0.99
+    promotion = contact("Earn $500 a day with this investment opportunity, message us on whatsapp")
+    assert spam_score(contact()) < spam_score(promotion) < spam_score(SPAM)
+
+
+@pytest.mark.asyncio
+async def test_spam_is_dropped_before_the_insert():
+    insert = FakeInsert()
+    pipeline = ContactPipeline(insert)
+    pipeline.submit(SPAM)
+    pipeline.submit(contact())
+
+    await pipeline.stop()
+    [[row]] = insert.batches
+    assert row["email"] == "asha@example.com"
+    assert row["spam_score"] == round(spam_score(contact()), 3)
+    assert (pipeline.counts["spam"], pipeline.counts["stored"]) == (1, 1)
+
+
+@pytest.mark.asyncio
+async def test_submissions_past_a_full_queue_are_rejected():
+    pipeline = ContactPipeline(FakeInsert(), max_queue=2)
+    assert [pipeline.submit(contact(f"Question number {i} about lamps")) for i in range(3)] == [
+        "accepted", "accepted", "rejected",
+    ]
+    # A rejected message isn't remembered, so it can be sent again
+    await pipeline.stop()
+    assert pipeline.submit(contact("Question number 2 about lamps")) == "accepted"
+
+
+def test_the_endpoint_answers_503_when_the_queue_is_full(monkeypatch):
+    from fastapi.testclient import TestClient
+    import main_production
+
+    monkeypatch.setattr(main_production, "contact_pipeline", ContactPipeline(FakeInsert(), max_queue=1))
+    client = TestClient(main_production.app)
+    form = {"name": "Asha", "email": "asha@example.com", "message": MESSAGE}
+
+    assert client.post("/contact", json=form).status_code == 202
+    # A duplicate gets the same answer as a new message
+    assert client.post("/contact", json=form).status_code == 202
+    response = client.post("/contact", json=dict(form, message="Another question about lamps"))
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
@@ -0,0 +1,96 @@
+"""
+Cross-worker fan-out tests, with workers sharing a fakeredis server
+"""
+
+import asyncio
+
+import pytest
+
+from catalog_sync import CatalogSync
+from events import OrderEventBroadcaster
+from revocation import TokenRevocationList
+
+
+@pytest.fixture
+def shared_redis(monkeypatch):
+    """Point redis.asyncio.from_url at one in-process server"""
+    fakeredis = pytest.importorskip("fakeredis")
+    import fakeredis.aioredis
+    import redis.asyncio
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.asyncio, "from_url", lambda url: fakeredis.aioredis.FakeRedis(server=server))
+    return server
+
+
+async def eventually(condition):
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not met")
+
+
+@pytest.mark.asyncio
+async def test_order_events_reach_subscribers_in_other_workers(shared_redis):
+    publisher, receiver = OrderEventBroadcaster("redis://fake"), OrderEventBroadcaster("redis://fake")
+    await publisher.start()
+    await receiver.start()
+    try:
+        async with receiver.subscribe("order-1") as queue:
+            await publisher._channel._redis.publish("order-events", b"not json")
+            await publisher.publish({"order_id": "order-2", "status": "shipped"})
+            await publisher.publish({"order_id": "order-1", "status": "shipped"})
+            # The malformed message is skipped without stopping the relay
+            assert await asyncio.wait_for(queue.get(), 1) == {"order_id": "order-1", "status": "shipped"}
+    finally:
+        await publisher.stop()
+        await receiver.stop()
+
+
+@pytest.mark.asyncio
+async def test_order_events_are_delivered_locally_without_redis():
+    broadcaster = OrderEventBroadcaster("redis://unreachable:1")
+    await broadcaster.start()
+    async with broadcaster.subscribe("order-1") as queue:
+        await broadcaster.publish({"order_id": "order-1", "status": "delivered"})
+        assert queue.get_nowait() == {"order_id": "order-1", "status": "delivered"}
+    await broadcaster.stop()
+
+
+@pytest.mark.asyncio
+async def test_catalog_changes_are_applied_by_the_other_workers_only(shared_redis):
+    applied = {"writer": [], "reader": []}
+
+    def sync(name):
+        return CatalogSync(
+            load=lambda product_ids: [],
+            apply=lambda product_ids, products: applied[name].append(product_ids),
+            reload=lambda: None,
+            redis_url="redis://fake",
+        )
+
+    writer, reader = sync("writer"), sync("reader")
+    await writer.start()
+    await reader.start()
+    try:
+        writer.notify(["p1", "p2"])
+        await eventually(lambda: applied["reader"])
+        assert applied == {"writer": [], "reader": [["p1", "p2"]]}
+    finally:
+        await writer.stop()
+        await reader.stop()
+
+
+@pytest.mark.asyncio
+async def test_revocations_reach_the_other_workers(shared_redis):
+    lists = [TokenRevocationList(lambda cutoff: {}, token_lifetime=3600, redis_url="redis://fake") for _ in range(2)]
+    for revocations in lists:
+        await revocations.start()
+    try:
+        await lists[0].publish("user-1", 1000.0)
+        await eventually(lambda: lists[1].is_revoked("user-1", 999.0))
+        assert not lists[1].is_revoked("user-1", 1001.0)
+    finally:
+        for revocations in lists:
+            await revocations.stop()
@@ -0,0 +1,158 @@
+"""
+Order placement tests
+"""
+
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import make_orders
+from models import Address, BulkOrderUpdateItem, CartItem, OrderCreate, OrderStatus, PaymentMethod
+
+
+def place_order(database_production, user_id, product_ids, quantities=None):
+    db = database_production.SessionLocal()
+    try:
+        return database_production.create_order(db, user_id, OrderCreate(
+            items=[
+                CartItem(product_id=product_id, quantity=quantity)
+                for product_id, quantity in zip(product_ids, quantities or [1] * len(product_ids))
+            ],
+            shipping_address=Address(
+                street="12 Test Street", city="Kochi", state="Kerala", postal_code="682001", country="India"
+            ),
+            payment_method=PaymentMethod.CASH_ON_DELIVERY
+        ))
+    finally:
+        db.close()
+
+
+def stock_and_orders(database_production):
+    """Stock by product ID and the number of orders placed"""
+    db = database_production.SessionLocal()
+    try:
+        stock = {str(product.id): product.quantity for product in db.query(database_production.ProductDB).all()}
+        return stock, db.query(database_production.OrderDB).count()
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def customer(database):
+    db = database.SessionLocal()
+    try:
+        user = database.UserDB(email=f"customer-{uuid.uuid4().hex[:8]}@example.com", name="Customer", hashed_password="x")
+        db.add(user)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def test_an_order_with_an_unknown_product_reserves_nothing(database, customer):
+    before = stock_and_orders(database)
+    product_id = next(pid for pid, quantity in before[0].items() if quantity)
+    unknown = str(uuid.uuid4())
+
+    with pytest.raises(database.OrderUnavailableError) as raised:
+        place_order(database, customer, [product_id, unknown])
+
+    assert raised.value.items == [{"product_id": unknown, "reason": "not_found", "requested": 1, "available": 0}]
+    assert stock_and_orders(database) == before
+
+
+def set_stock(database_production, product_id, quantity):
+    db = database_production.SessionLocal()
+    try:
+        product = db.get(database_production.ProductDB, uuid.UUID(product_id))
+        product.quantity, product.in_stock = quantity, quantity > 0
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_an_order_for_more_than_the_stock_reserves_nothing(database, customer):
+    plenty, short = [pid for pid, quantity in stock_and_orders(database)[0].items() if quantity][:2]
+    set_stock(database, short, 3)
+    before = stock_and_orders(database)
+
+    with pytest.raises(database.OrderUnavailableError) as raised:
+        place_order(database, customer, [plenty, short], [1, 4])
+
+    assert raised.value.items == [{"product_id": short, "reason": "insufficient_stock", "requested": 4, "available": 3}]
+    assert stock_and_orders(database) == before
+
+
+def test_an_order_is_priced_by_the_statement_that_reserves_it(database, customer):
+    stock, _ = stock_and_orders(database)
+    product_ids = [pid for pid, quantity in stock.items() if quantity and quantity >= 2][:2]
+    db = database.SessionLocal()
+    try:
+        prices = {str(p.id): p.price for p in database.get_products_by_ids(db, product_ids)}
+    finally:
+        db.close()
+
+    order_id = place_order(database, customer, product_ids, [2, 1]).id
+
+    db = database.SessionLocal()
+    try:
+        order = database.get_order_by_id(db, str(order_id))
+        assert order.total == prices[product_ids[0]] * 2 + prices[product_ids[1]]
+        assert {str(item.product_id): item.price_at_time for item in order.items} == prices
+    finally:
+        db.close()
+    after, _ = stock_and_orders(database)
+    assert (after[product_ids[0]], after[product_ids[1]]) == (stock[product_ids[0]] - 2, stock[product_ids[1]] - 1)
+
+
+def test_orders_listing_the_same_items_in_opposite_order_do_not_deadlock(database):
+    db = database.SessionLocal()
+    try:
+        products = db.query(database.ProductDB).limit(4).all()
+        for product in products:
+            product.quantity = 1000
+            product.in_stock = True
+        user = database.UserDB(email=f"customer-{uuid.uuid4().hex[:8]}@example.com", name="Customer", hashed_password="x")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+        product_ids = [str(product.id) for product in products]
+    finally:
+        db.close()
+
+    orderings = [product_ids, product_ids[::-1]] * 200
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        # Raises OrderContentionError if any two orders deadlocked
+        list(pool.map(lambda ordering: place_order(database, user_id, ordering), orderings))
+
+    db = database.SessionLocal()
+    try:
+        quantities = [db.get(database.ProductDB, product.id).quantity for product in products]
+    finally:
+        db.close()
+    assert quantities == [1000 - len(orderings)] * len(products)
+
+
+def test_bulk_updates_record_history_only_for_orders_that_changed(database):
+    shipped, unchanged, tracked = make_orders(database, 3, status="shipped")
+    db = database.SessionLocal()
+    try:
+        result = database.bulk_update_orders(db, [
+            BulkOrderUpdateItem(order_id=shipped, status=OrderStatus.DELIVERED),
+            BulkOrderUpdateItem(order_id=unchanged, status=OrderStatus.SHIPPED),
+            BulkOrderUpdateItem(order_id=tracked, tracking_number="TRK123"),
+        ])
+        assert len(result["updated"]) == 3
+        history = {
+            order_id: [row.status for row in database.get_order_status_history(db, order_id)]
+            for order_id in (shipped, unchanged, tracked)
+        }
+    finally:
+        db.close()
+
+    assert history == {
+        shipped: ["shipped", "delivered"],
+        unchanged: ["shipped"],
+        tracked: ["shipped", "shipped"],
+    }
@@ -0,0 +1,224 @@
+"""
+Payment webhook tests, driven by FakePaymentProvider
+"""
+
+import time
+from datetime import datetime
+
+import pytest
+
+from conftest import make_orders
+from payments import FakePaymentProvider
+
+SECRET = "whsec_test"
+
+
+@pytest.fixture
+def client(database, monkeypatch):
+    """Test client for the API, without the startup tasks; events are applied by the test"""
+    from fastapi.testclient import TestClient
+    import main_production
+
+    monkeypatch.setattr(main_production, "PAYMENT_WEBHOOK_SECRET", SECRET)
+    return TestClient(main_production.app)
+
+
+def deliver(client, event, timestamp=None):
+    body, headers = FakePaymentProvider(SECRET).signed_request(event, timestamp)
+    return client.post("/payments/webhook", content=body, headers=headers)
+
+
+def stored_events(database):
+    db = database.SessionLocal()
+    try:
+        return {event.id: event for event in db.query(database.PaymentEventDB).all()}
+    finally:
+        db.close()
+
+
+def process(database):
+    db = database.SessionLocal()
+    try:
+        return database.process_payment_events(db)
+    finally:
+        db.close()
+
+
+def order_status(database, order_id):
+    db = database.SessionLocal()
+    try:
+        return db.query(database.OrderDB).filter(database.OrderDB.id == order_id).one().status
+    finally:
+        db.close()
+
+
+def order_total(database, order_id):
+    db = database.SessionLocal()
+    try:
+        return db.query(database.OrderDB).filter(database.OrderDB.id == order_id).one().total
+    finally:
+        db.close()
+
+
+def test_only_correctly_signed_recent_events_are_stored(client, database):
+    provider = FakePaymentProvider(SECRET)
+    event = provider.payment_succeeded("order", 100)
+    body, headers = provider.signed_request(event)
+
+    assert client.post("/payments/webhook", content=body).status_code == 400
+    forged = dict(headers, **{"Stripe-Signature": FakePaymentProvider("whsec_other").signed_request(event)[1]["Stripe-Signature"]})
+    assert client.post("/payments/webhook", content=body, headers=forged).status_code == 400
+    assert client.post("/payments/webhook", content=body + b" ", headers=headers).status_code == 400
+    assert deliver(client, event, timestamp=int(time.time()) - 1000).status_code == 400
+    assert stored_events(database) == {}
+
+    response = deliver(client, event)
+    assert response.status_code == 200
+    assert response.json() == {"received": True, "duplicate": False}
+    assert list(stored_events(database)) == [event["id"]]
+
+
+def test_redelivered_events_are_stored_and_applied_once(client, database):
+    order_id = make_orders(database, 1, status="pending")[0]
+    event = FakePaymentProvider(SECRET).payment_succeeded(order_id, order_total(database, order_id))
+
+    assert deliver(client, event).json()["duplicate"] is False
+    assert deliver(client, event).json()["duplicate"] is True
+    assert len(stored_events(database)) == 1
+
+    result = process(database)
+    assert result["claimed"] == 1
+    assert len(result["orders"]) == 1
+    assert order_status(database, order_id) == "confirmed"
+    assert process(database)["claimed"] == 0
+
+    # A second event for the same payment finds the order already confirmed
+    assert deliver(client, FakePaymentProvider(SECRET).payment_succeeded(order_id, order_total(database, order_id))).status_code == 200
+    result = process(database)
+    assert result["claimed"] == 1 and result["orders"] == []
+
+
+def test_a_failing_event_is_retried_without_undoing_the_rest_of_its_batch(client, database, monkeypatch):
+    paid, flaky = make_orders(database, 2, status="pending")
+    provider = FakePaymentProvider(SECRET)
+    paid_event = provider.payment_succeeded(paid, order_total(database, paid))
+    flaky_event = provider.payment_succeeded(flaky, order_total(database, flaky))
+    deliver(client, flaky_event)
+    deliver(client, paid_event)
+
+    apply = database.apply_payment_event
+
+    def apply_then_fail(db, event):
+        applied = apply(db, event)
+        if event["id"] == flaky_event["id"]:
+            # After the order was changed, so the savepoint has something to undo
+            raise RuntimeError("connection reset")
+        return applied
+
+    monkeypatch.setattr(database, "apply_payment_event", apply_then_fail)
+    assert process(database)["claimed"] == 2
+    events = stored_events(database)
+    assert events[paid_event["id"]].status == "processed"
+    assert events[flaky_event["id"]].status == "pending"
+    assert events[flaky_event["id"]].attempts == 1
+    assert events[flaky_event["id"]].next_attempt_at > datetime.utcnow()
+    assert order_status(database, paid) == "confirmed"
+    assert order_status(database, flaky) == "pending"
+
+    # Not due yet; once it is, the retry succeeds
+    assert process(database)["claimed"] == 0
+    monkeypatch.setattr(database, "apply_payment_event", apply)
+    db = database.SessionLocal()
+    try:
+        db.get(database.PaymentEventDB, flaky_event["id"]).next_attempt_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+    assert process(database)["claimed"] == 1
+    assert stored_events(database)[flaky_event["id"]].attempts == 2
+    assert order_status(database, flaky) == "confirmed"
+
+
+def test_payments_of_the_wrong_amount_or_currency_are_rejected(client, database):
+    short, foreign = make_orders(database, 2, status="pending")
+    provider = FakePaymentProvider(SECRET)
+    short_event = provider.payment_succeeded(short, order_total(database, short) - 1)
+    foreign_event = provider.event("payment_intent.succeeded", foreign, order_total(database, foreign), currency="usd")
+    deliver(client, short_event)
+    deliver(client, foreign_event)
+
+    process(database)
+    events = stored_events(database)
+    assert events[short_event["id"]].status == "failed"
+    assert events[foreign_event["id"]].status == "failed"
+    assert order_status(database, short) == "pending"
+    assert order_status(database, foreign) == "pending"
+
+
+def test_a_canceled_payment_cancels_the_order_and_restocks(client, database):
+    order_id = make_orders(database, 1, status="pending")[0]
+    db = database.SessionLocal()
+    try:
+        product = db.query(database.ProductDB).first()
+        product_id, stock = str(product.id), product.quantity
+    finally:
+        db.close()
+
+    deliver(client, FakePaymentProvider(SECRET).payment_canceled(order_id, order_total(database, order_id)))
+    result = process(database)
+    assert result["restocked"] == [product_id]
+    assert order_status(database, order_id) == "cancelled"
+    db = database.SessionLocal()
+    try:
+        assert db.get(database.ProductDB, product.id).quantity == stock + 1
+    finally:
+        db.close()
+
+
+def sales(database):
+    """Daily aggregates as plain tuples, without rows that net to zero"""
+    db = database.SessionLocal()
+    try:
+        return (
+            {(row.day, row.orders, row.revenue) for row in db.query(database.DailySalesDB).all() if row.orders},
+            {(row.day, row.product_id, row.units, row.revenue) for row in db.query(database.DailyProductSalesDB).all() if row.units},
+        )
+    finally:
+        db.close()
+
+
+def rebuild_sales(database):
+    db = database.SessionLocal()
+    try:
+        database.rebuild_sales_aggregates(db)
+    finally:
+        db.close()
+
+
+def test_cancelled_orders_leave_the_sales_aggregates(client, database):
+    kept, canceled, admin_canceled = make_orders(database, 3, status="pending")
+    rebuild_sales(database)
+    day, orders, revenue = next(iter(sales(database)[0]))
+    assert orders == 3
+
+    deliver(client, FakePaymentProvider(SECRET).payment_canceled(canceled, order_total(database, canceled)))
+    process(database)
+    db = database.SessionLocal()
+    try:
+        database.update_order(db, admin_canceled, database.OrderUpdate(status="cancelled"))
+    finally:
+        db.close()
+
+    incremental = sales(database)
+    assert incremental[0] == {(day, 1, order_total(database, kept))}
+    # The rebuild agrees, leaving cancelled orders out too
+    rebuild_sales(database)
+    assert sales(database) == incremental
+
+    # Reopening an order counts it again
+    db = database.SessionLocal()
+    try:
+        database.update_order(db, admin_canceled, database.OrderUpdate(status="pending"))
+    finally:
+        db.close()
+    assert sales(database)[0] == {(day, 2, order_total(database, kept) + order_total(database, admin_canceled))}
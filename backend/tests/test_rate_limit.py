@@ -0,0 +1,152 @@
+"""
+Rate limiting tests: bucket arithmetic, the Redis script, the middleware and login
+"""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import rate_limit
+from rate_limit import (
+    InMemoryBucketStore, RateLimitedRoute, RateLimiter, RateLimitMiddleware, RateLimitRule, RedisBucketStore,
+)
+
+RULE = RateLimitRule("test", capacity=3, per_seconds=6)  # one token every 2 s
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic clock the test advances by hand"""
+    now = [1000.0]
+    # Only the module's clock: the event loop keeps real time
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_a_bucket_allows_its_capacity_then_denies_until_refilled(clock):
+    store = InMemoryBucketStore()
+
+    assert [store.take_now("key", RULE)[0] for _ in range(3)] == [True, True, True]
+    assert store.take_now("key", RULE) == (False, 2.0)
+    clock[0] += 1.5
+    assert store.take_now("key", RULE) == (False, pytest.approx(0.5))
+    clock[0] += 0.5
+    assert store.take_now("key", RULE) == (True, 0.0)
+    # Other keys have their own bucket
+    assert store.take_now("other", RULE) == (True, 0.0)
+
+
+def test_a_bucket_refills_to_no_more_than_its_capacity(clock):
+    store = InMemoryBucketStore()
+    store.take_now("key", RULE)
+    clock[0] += 3600
+
+    assert [store.take_now("key", RULE)[0] for _ in range(4)] == [True, True, True, False]
+
+
+def test_evicting_a_bucket_forgives_its_client(clock):
+    store = InMemoryBucketStore(max_keys=2)
+    for _ in range(3):
+        store.take_now("a", RULE)
+    assert store.take_now("a", RULE)[0] is False
+
+    store.take_now("b", RULE)
+    store.take_now("c", RULE)
+    assert store.take_now("a", RULE)[0] is True
+
+
+@pytest.fixture
+def redis_store(monkeypatch):
+    """RedisBucketStore on fakeredis, which runs the Lua script"""
+    fakeredis = pytest.importorskip("fakeredis.aioredis")
+    pytest.importorskip("lupa")
+    import redis.asyncio
+
+    monkeypatch.setattr(redis.asyncio, "from_url", lambda url: fakeredis.FakeRedis())
+    return RedisBucketStore("redis://fake")
+
+
+@pytest.mark.asyncio
+async def test_the_redis_script_allows_the_capacity_then_denies(redis_store):
+    rule = RateLimitRule("test", capacity=3, per_seconds=60)
+
+    results = [await redis_store.take("key", rule) for _ in range(4)]
+    assert [allowed for allowed, _ in results] == [True, True, True, False]
+    assert results[3][1] == pytest.approx(20, abs=0.1)
+    assert await redis_store.take("other", rule) == (True, 0.0)
+    assert await redis_store._client.pttl("ratelimit:key") == pytest.approx(60000, abs=100)
+
+
+@pytest.mark.asyncio
+async def test_the_redis_script_refills_at_the_rule_rate(redis_store):
+    rule = RateLimitRule("test", capacity=2, per_seconds=0.2)
+
+    assert [(await redis_store.take("key", rule))[0] for _ in range(3)] == [True, True, False]
+    time.sleep(0.12)
+    assert [(await redis_store.take("key", rule))[0] for _ in range(2)] == [True, False]
+
+
+@pytest.mark.asyncio
+async def test_an_unreachable_redis_falls_back_to_per_worker_buckets(redis_store, clock):
+    async def unreachable(keys, args):
+        raise ConnectionError("Connection refused")
+
+    redis_store._script = unreachable
+
+    assert [(await redis_store.take("key", RULE))[0] for _ in range(4)] == [True, True, True, False]
+    clock[0] += 2
+    assert await redis_store.take("key", RULE) == (True, 0.0)
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def test_the_middleware_answers_429_with_retry_after(clock):
+    app = RateLimitMiddleware(ok_app, RateLimiter(InMemoryBucketStore()), [
+        RateLimitedRoute(RateLimitRule("login", capacity=2, per_seconds=60), r"^/auth/login$", methods={"POST"}),
+    ])
+    client = TestClient(app)
+
+    assert [client.post("/auth/login").status_code for _ in range(2)] == [200, 200]
+    response = client.post("/auth/login")
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "30"
+    assert response.json()["details"] == {"status_code": 429, "retry_after": 30.0}
+    # Other methods and paths are not limited
+    assert client.get("/auth/login").status_code == 200
+    assert client.post("/auth/register").status_code == 200
+
+    clock[0] += 30
+    assert client.post("/auth/login").status_code == 200
+
+
+def client_from(app, ip):
+    """Test client whose requests come from `ip`"""
+    async def from_ip(scope, receive, send):
+        await app(dict(scope, client=(ip, 50000)), receive, send)
+
+    return TestClient(from_ip)
+
+
+def test_failed_logins_are_limited_per_email_and_ip(database, monkeypatch):
+    import main_production
+
+    monkeypatch.setattr(main_production.rate_limiter, "store", InMemoryBucketStore())
+    attacker = client_from(main_production.app, "203.0.113.7")
+
+    def login(client, email):
+        return client.post("/auth/login", json={"email": email, "password": "wrong password"})
+
+    capacity = main_production.LOGIN_EMAIL_LIMIT.capacity
+    assert [login(attacker, "admin@example.com").status_code for _ in range(capacity)] == [401] * capacity
+    response = login(attacker, "Admin@Example.com")
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) == 60
+
+    # The same email from elsewhere, and other emails from this IP, are unaffected
+    assert login(client_from(main_production.app, "198.51.100.2"), "admin@example.com").status_code == 401
+    assert login(attacker, "someone@example.com").status_code == 401
@@ -0,0 +1,70 @@
+"""
+Read replica routing tests, with the lag probe faked
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+import database_production
+from database_production import ReplicaRouter
+
+
+@pytest.fixture
+def router(monkeypatch):
+    """Router with a replica configured, whose lag probe is slow and counted"""
+    monkeypatch.setattr(database_production, "ReadSessionLocal", object())
+    router = ReplicaRouter()
+    router.lag = 0.0
+    router.probes = 0
+    count = threading.Lock()
+
+    def probe():
+        with count:
+            router.probes += 1
+        time.sleep(0.1)
+        return router.lag
+
+    monkeypatch.setattr(router, "_replica_lag", probe)
+    return router
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic clock of database_production, advanced by hand"""
+    now = [1000.0]
+    monkeypatch.setattr(database_production, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_concurrent_reads_run_one_lag_probe(router):
+    # The first reads are sent to the primary until the probe answers
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        answers = list(pool.map(lambda _: router.use_replica(), range(64)))
+
+    assert router.probes == 1
+    assert answers.count(True) >= 1
+    assert router.use_replica() is True
+    assert router.probes == 1
+
+
+def test_a_lagging_replica_is_not_used_until_it_catches_up(router, clock):
+    router.lag = database_production.MAX_REPLICA_LAG_SECONDS + 1
+
+    assert router.use_replica() is False
+    router.lag = 0.0
+    assert router.use_replica() is False
+    clock[0] += database_production.REPLICA_LAG_CHECK_SECONDS + 0.1
+    assert router.use_replica() is True
+    assert router.probes == 2
+
+
+def test_a_users_reads_stay_on_the_primary_after_their_write(router, clock):
+    router.mark_write("user-1")
+    assert router.use_replica("user-1") is False
+    assert router.use_replica("user-2") is True
+    clock[0] += database_production.READ_YOUR_WRITES_SECONDS + 0.1
+    assert router.use_replica("user-1") is True
@@ -0,0 +1,98 @@
+"""
+Access token revocation and claims cache tests
+"""
+
+import hashlib
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import caching
+import database_production
+from caching import TTLCache
+from revocation import TokenRevocationList
+
+
+def test_tokens_issued_before_a_revocation_are_rejected():
+    revocations = TokenRevocationList(lambda since: {}, token_lifetime=3600)
+    assert not revocations.is_revoked("user", 1000.0)
+
+    revocations.add("user", 1000.0)
+    assert revocations.is_revoked("user", 999.5)
+    assert not revocations.is_revoked("user", 1000.0)
+    assert not revocations.is_revoked("other", 999.5)
+    # Tokens without iat predate revocation
+    assert revocations.is_revoked("user", None)
+
+    # An older revocation arriving late doesn't re-admit tokens
+    revocations.add("user", 500.0)
+    assert revocations.is_revoked("user", 999.5)
+
+
+def test_a_refresh_merges_the_database_and_drops_expired_revocations():
+    now = time.time()
+    loaded = {"from-db": now - 10, "local": now - 100}
+    revocations = TokenRevocationList(lambda since: loaded, token_lifetime=3600)
+    revocations.add("local", now - 5)
+    revocations.add("expired", now - 7200)
+
+    revocations.refresh()
+    assert len(revocations) == 2
+    assert revocations.is_revoked("from-db", now - 11)
+    assert revocations.is_revoked("local", now - 6)
+    assert not revocations.is_revoked("expired", now - 7201)
+
+
+@pytest.fixture
+def auth(monkeypatch):
+    """database_production with an empty claims cache and revocation list, on a hand-advanced clock"""
+    now = [1000.0]
+    # Only the module's clock: the event loop keeps real time
+    monkeypatch.setattr(caching, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    monkeypatch.setattr(database_production, "token_claims_cache", TTLCache(max_entries=100, ttl=1800))
+    monkeypatch.setattr(database_production, "token_revocations", TokenRevocationList(lambda since: {}, token_lifetime=1800))
+    return database_production, now
+
+
+def cached_claims(database, token):
+    return database.token_claims_cache.lookup(hashlib.sha256(token.encode()).hexdigest())
+
+
+def test_a_revoked_token_is_rejected_even_with_cached_claims(auth):
+    database, _ = auth
+    token = database.create_access_token({"sub": "user-1"}, timedelta(minutes=30))
+    other = database.create_access_token({"sub": "user-2"}, timedelta(minutes=30))
+    assert database.verify_token(token)["sub"] == "user-1"
+    assert cached_claims(database, token)[0]
+
+    database.token_revocations.add("user-1", time.time())
+    assert database.verify_token(token) is None
+    assert database.verify_token(other)["sub"] == "user-2"
+    # A token issued after the revocation is accepted
+    assert database.verify_token(database.create_access_token({"sub": "user-1"}, timedelta(minutes=30)))["sub"] == "user-1"
+
+
+def test_cached_claims_do_not_outlive_the_token(auth):
+    database, now = auth
+    short = database.create_access_token({"sub": "user-1"}, timedelta(seconds=60))
+    long = database.create_access_token({"sub": "user-1"}, timedelta(hours=2))
+    database.verify_token(short)
+    database.verify_token(long)
+
+    now[0] += 61
+    assert cached_claims(database, short) == (False, None)
+    assert cached_claims(database, long)[0]
+    # Long-lived tokens are still re-verified every cache TTL
+    now[0] += 1800
+    assert cached_claims(database, long) == (False, None)
+
+
+def test_invalid_tokens_are_rejected_and_not_cached(auth):
+    database, _ = auth
+    token = database.create_access_token({"sub": "user-1"}, timedelta(minutes=30))
+    forged = token[:-2] + ("AA" if not token.endswith("AA") else "BB")
+
+    assert database.verify_token(forged) is None
+    assert cached_claims(database, forged) == (False, None)
@@ -0,0 +1,113 @@
+"""
+Catalog search index tests
+"""
+
+from models import FragrancePyramid, Product
+from search import FIELD_WEIGHTS, PREFIX_MATCH_FACTOR, SearchIndex
+
+
+def product(product_id, name, description, category="unisex", top_notes=(), tagline=None):
+    return Product(
+        id=product_id,
+        name=name,
+        price=100000,
+        image=f"/images/{product_id}.jpg",
+        description=description,
+        tagline=tagline,
+        fragrance_pyramid=FragrancePyramid(top_notes=list(top_notes)),
+        category=category,
+    )
+
+
+ROSE_OUD = product("1", "Rose Oud", "A deep evening scent with saffron.")
+AMBER_NIGHT = product("2", "Amber Night", "Warm amber with a hint of rose petals.", category="women")
+CITRUS_BLOOM = product("3", "Citrus Bloom", "Bright daytime scent with orange.", category="Women", top_notes=["Rose", "Lemon"])
+
+
+def index_of(*products):
+    index = SearchIndex()
+    index.build(list(products))
+    return index
+
+
+def ranked(index, query, **options):
+    return [(found.name, score) for found, score in index.search(query, **options)]
+
+
+def test_matches_are_ranked_by_the_field_they_are_in():
+    index = index_of(ROSE_OUD, AMBER_NIGHT, CITRUS_BLOOM)
+
+    assert ranked(index, "rose") == [
+        ("Rose Oud", FIELD_WEIGHTS["name"]),
+        ("Citrus Bloom", FIELD_WEIGHTS["top_notes"]),
+        ("Amber Night", FIELD_WEIGHTS["description"]),
+    ]
+    # A term in several fields scores for each of them
+    assert ranked(index, "AMBER") == [("Amber Night", FIELD_WEIGHTS["name"] + FIELD_WEIGHTS["description"])]
+
+
+def test_every_term_must_match():
+    index = index_of(ROSE_OUD, AMBER_NIGHT, CITRUS_BLOOM)
+
+    assert ranked(index, "rose scent") == [
+        ("Rose Oud", FIELD_WEIGHTS["name"] + FIELD_WEIGHTS["description"]),
+        ("Citrus Bloom", FIELD_WEIGHTS["top_notes"] + FIELD_WEIGHTS["description"]),
+    ]
+    assert ranked(index, "rose vanilla") == []
+    assert ranked(index, "  ,; ") == []
+
+
+def test_only_the_last_term_is_prefix_expanded():
+    index = index_of(ROSE_OUD, AMBER_NIGHT, CITRUS_BLOOM)
+
+    assert ranked(index, "oud sa") == [("Rose Oud", FIELD_WEIGHTS["name"] + FIELD_WEIGHTS["description"] * PREFIX_MATCH_FACTOR)]
+    assert ranked(index, "sa oud") == []
+    assert ranked(index, "oud sa", prefix=False) == []
+    # Prefix matches keep the field ranking, at a discount
+    assert [name for name, _ in ranked(index, "ros")] == ["Rose Oud", "Citrus Bloom", "Amber Night"]
+    assert ranked(index, "ros")[0][1] == FIELD_WEIGHTS["name"] * PREFIX_MATCH_FACTOR
+
+
+def test_results_can_be_limited_to_a_category():
+    index = index_of(ROSE_OUD, AMBER_NIGHT, CITRUS_BLOOM)
+
+    assert [name for name, _ in ranked(index, "rose", category="women")] == ["Citrus Bloom", "Amber Night"]
+    assert [name for name, _ in ranked(index, "rose", category="UNISEX")] == ["Rose Oud"]
+    assert ranked(index, "rose", category="men") == []
+    assert [name for name, _ in ranked(index, "rose", limit=1)] == ["Rose Oud"]
+
+
+def test_upserts_replace_a_product_and_prune_its_old_terms():
+    index = index_of(ROSE_OUD, AMBER_NIGHT)
+
+    index.upsert(product("1", "Velvet Oud", "A deep evening scent with cardamom."))
+    assert [name for name, _ in ranked(index, "rose")] == ["Amber Night"]
+    assert ranked(index, "saf") == []
+    assert [name for name, _ in ranked(index, "car")] == ["Velvet Oud"]
+    assert index.get_document("1").name == "Velvet Oud"
+
+    index.upsert(CITRUS_BLOOM)
+    assert [name for name, _ in ranked(index, "lem")] == ["Citrus Bloom"]
+    assert len(index) == 3
+
+
+def test_removed_products_are_no_longer_found():
+    index = index_of(ROSE_OUD, AMBER_NIGHT, CITRUS_BLOOM)
+
+    index.remove("1")
+    assert [name for name, _ in ranked(index, "rose")] == ["Citrus Bloom", "Amber Night"]
+    assert ranked(index, "oud") == []
+    assert ranked(index, "saf") == []
+    assert index.get_document("1") is None
+    assert len(index) == 2
+
+
+def test_a_disabled_index_ignores_upserts():
+    index = SearchIndex()
+    index.upsert(ROSE_OUD)
+    assert len(index) == 0
+
+    index.build([ROSE_OUD])
+    index.disable()
+    index.upsert(AMBER_NIGHT)
+    assert (len(index), index.enabled) == (0, False)